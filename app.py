@@ -1,18 +1,48 @@
 # app.py
-from flask import Flask, render_template, request, redirect, session, jsonify
+from flask import Flask, render_template, request, redirect, session, jsonify, make_response, Response, stream_with_context, send_from_directory
 from supabase import create_client, Client, ClientOptions
 from dotenv import load_dotenv
 import os
 import time
+import json
+import base64
+import tempfile
 import ssl
+import hmac
+import uuid
+import contextvars
+import httpx
+import math
 from functools import wraps
+from werkzeug.middleware.proxy_fix import ProxyFix
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from cache import TTLCache, ProfileCache, shared_backend_from_env
+from http_cache import agregar_huella, aplicar_politica, con_etag, etag_de, no_modificado, politica
+from leaderboard import Leaderboard
+from metricas import Metricas, TransporteMedido, instrumentar
+from limites import Limitador, reglas_desde_entorno
+from report_feed import ReportFeed, SupabaseReportSource
+from dashboard_hub import DashboardHub, SupabaseDashboardSource, datos_usuario
+from geo_index import ZOOM_SIN_GRUPOS, GridIndex, coordenadas
+from rutas import RegistroLancheros, planificar_ruta, red_fluvial, repartir
+from uploads import UploadPipeline, UploadQueueFull, rutas_con_variantes
+from imagenes import procesar_imagen
+from unicidad import campos_en_uso, literal, MENSAJES as MENSAJES_UNICIDAD
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("FLASK_SECRET_KEY")
 
+# Detrás de un proxy (nginx, balanceador) la IP real del cliente viene en X-Forwarded-For y
+# los límites por IP la necesitan. Solo se confía en tantos saltos como diga PROXY_FIX_X_FOR.
+PROXY_FIX_X_FOR = int(os.environ.get("PROXY_FIX_X_FOR", 0))
+if PROXY_FIX_X_FOR:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_X_FOR)
+
 @app.context_processor
 def inject_now():
     return {'now': datetime.utcnow}
@@ -20,13 +50,247 @@ def inject_now():
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 
-options: ClientOptions = ClientOptions(
-    postgrest_client_timeout=10,
-    storage_client_timeout=10,
-)
+# Latencia por ruta y por cada llamada a Supabase (ver /metrics). Las llamadas se miden en
+# el transporte del cliente HTTP, así entran tablas, RPC, Storage y Auth.
+metricas = Metricas(lento=float(os.environ.get("SLOW_REQUEST_SECONDS", 1.0)))
+http_client = httpx.Client(transport=TransporteMedido(metricas), timeout=10)
+
+options: ClientOptions = ClientOptions(httpx_client=http_client)
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
 
+# Los roles casi nunca cambian, así que no hace falta ir a Supabase en cada petición protegida.
+roles_cache = TTLCache(
+    maxsize=int(os.environ.get("ROLE_CACHE_SIZE", 5000)),
+    ttl=float(os.environ.get("ROLE_CACHE_TTL", 60)),
+)
+
+shared_backend = shared_backend_from_env()
+
+def cargar_ranking(limite):
+    response = supabase.table('usuarios').select('nombre, kg_reciclados').order('kg_reciclados', desc=True).limit(limite).execute()
+    return response.data
+
+# Un solo top-N en memoria para /dashboard, /api/user y /api/ranking.
+leaderboard = Leaderboard(
+    cargar_ranking,
+    size=int(os.environ.get("LEADERBOARD_SIZE", 50)),
+    interval=float(os.environ.get("LEADERBOARD_INTERVAL", 20)),
+    backend=shared_backend,
+)
+
+# Los días del progreso se cortan a medianoche en la hora local del Chocó, no en la del servidor.
+# Si se cambia, la migración de progreso_diario tiene que usar la misma zona (app.timezone).
+APP_TIMEZONE = ZoneInfo(os.environ.get("APP_TIMEZONE", "America/Bogota"))
+PROGRESO_RANGOS = (7, 30, 90, 365)
+
+# Lo que se le abona al usuario por cada kg recogido (el dashboard dice "1 kg = 15 min").
+MINUTOS_POR_KG = float(os.environ.get("MINUTOS_POR_KG", 15))
+
+def cargar_perfil(user_id):
+    # QUITAMOS .single() para evitar el error PGRST116
+    response = supabase.table('usuarios').select('*').eq('id', user_id).execute()
+    return response.data[0] if response.data else None
+
+# Perfil completo por usuario para /dashboard, /perfil y /api/user. Las escrituras de la app
+# lo actualizan en el sitio, así la siguiente lectura ya ve el cambio sin volver a Supabase.
+# Eso solo vale entre workers con REDIS_URL: sin backend compartido cada worker tendría su
+# copia y, tras guardar el perfil en uno, los demás servirían los datos viejos. Por eso sin
+# Redis el caché va apagado (TTL 0); con un solo proceso se puede encender con PROFILE_CACHE_TTL.
+perfiles = ProfileCache(
+    cargar_perfil,
+    maxsize=int(os.environ.get("PROFILE_CACHE_SIZE", 5000)),
+    ttl=float(os.environ.get("PROFILE_CACHE_TTL", 60 if shared_backend is not None else 0)),
+    backend=shared_backend,
+)
+
+# Un solo hilo por worker sigue los cambios de 'reportes' y los reparte a todos los lancheros conectados.
+report_feed = ReportFeed(
+    SupabaseReportSource(supabase),
+    interval=float(os.environ.get("REPORT_FEED_INTERVAL", 5)),
+    heartbeat=float(os.environ.get("REPORT_FEED_HEARTBEAT", 15)),
+)
+REPORT_STREAM_MAX_SECONDS = float(os.environ.get("REPORT_STREAM_MAX_SECONDS", 300))
+# Con workers síncronos (python app.py, gunicorn por defecto) cada stream abierto ocupa un
+# hilo o un worker durante minutos, así que solo se sirven desde asgi.py. En WSGI se responde
+# 204 y el navegador vuelve a pedir por polling con ETag. WSGI_STREAMS=1 los activa para
+# workers que no se bloquean (gevent, eventlet).
+WSGI_STREAMS = os.environ.get("WSGI_STREAMS", "0") == "1"
+
+# Lo mismo para los dashboards: un hilo por worker consulta los perfiles de quienes están
+# conectados y el ranking, y a cada pestaña le llega por SSE solo lo que cambió de lo suyo.
+dashboards = DashboardHub(
+    SupabaseDashboardSource(supabase),
+    leaderboard.top,
+    interval=float(os.environ.get("DASHBOARD_HUB_INTERVAL", 10)),
+    heartbeat=float(os.environ.get("DASHBOARD_HUB_HEARTBEAT", 15)),
+)
+DASHBOARD_STREAM_MAX_SECONDS = float(os.environ.get("DASHBOARD_STREAM_MAX_SECONDS", 300))
+
+# Índice espacial de los reportes abiertos para /api/reportes/bbox. Lo alimenta el feed (que también
+# ve lo que hacen otros workers) y se actualiza al momento en este worker al subir la foto o al recoger.
+mapa_reportes = GridIndex(celda=float(os.environ.get("MAPA_CELDA_GRADOS", 0.01)))
+report_feed.escuchar(mapa_reportes.escuchar_feed)
+REPORTES_BBOX_MAX = int(os.environ.get("REPORTES_BBOX_MAX", 500))
+
+# Rutas de recogida: red de puntos de paso del río (archivo JSON opcional) y lancheros que están en ruta.
+RED_FLUVIAL_PATH = os.environ.get("RED_FLUVIAL_PATH", os.path.join(app.root_path, 'data', 'red_fluvial.json'))
+RUTA_PRESUPUESTO_MS = float(os.environ.get("RUTA_PRESUPUESTO_MS", 200))
+# La ruta se arma con los reportes abiertos más cercanos al bote, no con todo el backlog.
+RUTA_MAX_CANDIDATOS = int(os.environ.get("RUTA_MAX_CANDIDATOS", 150))
+lancheros_en_ruta = RegistroLancheros(
+    ttl=float(os.environ.get("RUTA_ACTIVA_SEGUNDOS", 900)),
+    backend=shared_backend,
+)
+
+# Las fotos se guardan en disco y se suben a Storage en segundo plano para no bloquear al worker.
+upload_pipeline = UploadPipeline(
+    supabase,
+    spool_dir=os.environ.get("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), 'chocolimpio_uploads')),
+    workers=int(os.environ.get("UPLOAD_WORKERS", 4)),
+    max_queue=int(os.environ.get("UPLOAD_MAX_QUEUE", 100)),
+    retries=int(os.environ.get("UPLOAD_RETRIES", 4)),
+    processor=procesar_imagen,
+    process_workers=int(os.environ.get("IMAGE_WORKERS", 2)),
+)
+
+# Tamaños que se generan al subir: imagen principal limitada y una miniatura cuadrada.
+IMAGEN_REPORTE = {'max_lado': 1600, 'miniaturas': [320]}
+IMAGEN_AVATAR = {'max_lado': 512, 'miniaturas': [128]}
+IMAGEN_LANCHA = {'max_lado': 1600, 'miniaturas': [320]}
+
+def rutas_en_bucket(url, bucket, imagen):
+    # De la URL pública a la ruta dentro del bucket, junto con las de sus miniaturas.
+    if not url or f'/{bucket}/' not in url:
+        return []
+    return rutas_con_variantes(url.split(f'/{bucket}/')[-1].split('?')[0], imagen['miniaturas'])
+
+# Token buckets para las rutas que llaman a Supabase Auth o Storage: por IP, por usuario
+# (antes del login, por IP y correo o teléfono que se intenta usar) y uno global por ruta.
+# Formato 'peticiones/segundos'; cada uno se cambia con RATE_LIMIT_<RUTA>_<ALCANCE>.
+LIMITES = {
+    'login': {'ip': '30/300', 'usuario': '5/300', 'ruta': '600/60'},
+    'register': {'ip': '5/600', 'usuario': '3/600', 'ruta': '120/60'},
+    'password_reset': {'ip': '5/600', 'usuario': '3/900', 'ruta': '60/60'},
+    'verificar': {'ip': '10/300', 'usuario': '5/300', 'ruta': '300/60'},
+    'reportar': {'ip': '60/60', 'usuario': '20/60', 'ruta': '600/60'},
+    'upload_avatar': {'ip': '20/300', 'usuario': '5/300', 'ruta': '120/60'},
+}
+limitador = Limitador(reglas_desde_entorno(LIMITES), backend=shared_backend, metricas=metricas)
+
+def admitir(ruta, usuario=None, identificador=None):
+    # Segundos que le faltan al cliente para poder reintentar, 0 si puede pasar.
+    # Va antes de cualquier llamada a Supabase para que rechazar salga barato.
+    # `usuario` es el de la sesión; `identificador`, lo que se escribe antes de entrar. Ese
+    # bucket va junto con la IP: si fuera solo por correo, cualquiera podría gastarle los
+    # intentos a otra persona y dejarla sin poder entrar.
+    if identificador:
+        usuario = f'{request.remote_addr}|{identificador.strip().lower()}'
+    return limitador.revisar(ruta, ip=request.remote_addr, usuario=usuario.strip().lower() if usuario else None)
+
+def demasiadas_peticiones(espera, response=None):
+    if response is None:
+        response = jsonify({'success': False, 'error': 'Demasiados intentos. Espera un momento y vuelve a intentarlo.'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(espera)))
+    return response
+
+def upload_ocupado():
+    response = jsonify({'success': False, 'error': 'El servidor está ocupado subiendo fotos. Intenta de nuevo en unos segundos.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '10'
+    return response
+
+def foto_reporte_subida(params, urls):
+    response = supabase.table('reportes').update({
+        'foto_url': urls[''],
+        'foto_thumb_url': urls.get('_320'),
+    }).eq('id', params['reporte_id']).execute()
+    # Con la foto ya subida el reporte es visible: entra al mapa de este worker sin esperar al feed.
+    for reporte in response.data:
+        if not reporte.get('recogido'):
+            mapa_reportes.insertar(reporte)
+    report_feed.despertar()
+
+def borrar_reporte_sin_foto(reporte_id):
+    # Un reporte cuya foto no se va a subir nunca quedaría oculto para siempre: se borra.
+    # Devuelve False si no se pudo borrar.
+    try:
+        supabase.table('reportes').delete().eq('id', reporte_id).is_('foto_url', 'null').execute()
+        return True
+    except Exception as e:
+        print(f"[ERROR BORRAR REPORTE SIN FOTO] {reporte_id}: {e}")
+        return False
+
+def foto_reporte_fallida(params):
+    borrar_reporte_sin_foto(params['reporte_id'])
+
+def avatar_subido(params, urls):
+    cambios = {
+        'avatar_url': urls[''],
+        'avatar_thumb_url': urls.get('_128'),
+    }
+    supabase.table('usuarios').update(cambios).eq('id', params['user_id']).execute()
+    perfiles.actualizar(params['user_id'], cambios)
+
+def foto_lancha_subida(params, urls):
+    supabase.table('usuarios').update({
+        'foto_lancha_thumb_url': urls.get('_320'),
+    }).eq('id', params['user_id']).execute()
+
+def foto_lancha_fallida(params):
+    # La URL se guardó al registrarse, antes de subir la foto; si no se subió, no debe quedar apuntando a nada.
+    supabase.table('usuarios').update({'foto_lancha_url': None}).eq('id', params['user_id']).execute()
+
+upload_pipeline.on('reporte', foto_reporte_subida, fallo=foto_reporte_fallida)
+upload_pipeline.on('avatar', avatar_subido)
+upload_pipeline.on('lancha', foto_lancha_subida, fallo=foto_lancha_fallida)
+
+def obtener_rol(user_id):
+    def cargar_rol():
+        response = supabase.table('usuarios').select('rol').eq('id', user_id).execute()
+        return response.data[0].get('rol') if response.data else None
+    return roles_cache.get_or_set(user_id, cargar_rol)
+
+# Identificador de login (teléfono, nombre o email) -> {'id', 'email'}; None si no existe.
+# Los negativos duran poco para que alguien recién registrado pueda entrar enseguida.
+login_cache = TTLCache(
+    maxsize=int(os.environ.get("LOGIN_CACHE_SIZE", 5000)),
+    ttl=float(os.environ.get("LOGIN_CACHE_TTL", 120)),
+)
+LOGIN_NEGATIVE_TTL = float(os.environ.get("LOGIN_NEGATIVE_TTL", 10))
+
+def clave_login(identificador):
+    identificador = identificador.strip()
+    return identificador.lower() if '@' in identificador else identificador
+
+def resolver_identificador(identificador):
+    clave = clave_login(identificador)
+    cuenta = login_cache.get(clave, default=False)
+    if cuenta is not False:
+        return cuenta
+
+    # Una sola consulta trae el email para autenticar y el rol para decidir a dónde redirigir.
+    valor = literal(clave)
+    response = supabase.table('usuarios').select('id, email, rol') \
+        .or_(f'telefono.eq.{valor},nombre.eq.{valor},email.eq.{valor}') \
+        .limit(1) \
+        .execute()
+    if not response.data:
+        login_cache.set(clave, None, ttl=LOGIN_NEGATIVE_TTL)
+        return None
+
+    fila = response.data[0]
+    roles_cache.set(fila['id'], fila.get('rol'))
+    cuenta = {'id': fila['id'], 'email': fila['email']}
+    login_cache.set(clave, cuenta)
+    return cuenta
+
+def olvidar_identificadores(*identificadores):
+    for identificador in identificadores:
+        if identificador:
+            login_cache.invalidate(clave_login(identificador))
+
 def role_required(required_role):
     def decorator(f):
         @wraps(f)
@@ -34,10 +298,7 @@ def role_required(required_role):
             if 'user_id' not in session:
                 return redirect('/')
             
-            user_id = session['user_id']
-            user_profile = supabase.table('usuarios').select('rol').eq('id', user_id).single().execute()
-
-            if not user_profile.data or user_profile.data.get('rol') != required_role:
+            if obtener_rol(session['user_id']) != required_role:
                 return redirect('/dashboard')
             
             return f(*args, **kwargs)
@@ -56,6 +317,10 @@ def index():
         action = request.form.get('action')
 
         if action == 'register':
+            espera = admitir('register', identificador=request.form.get('email'))
+            if espera:
+                return demasiadas_peticiones(espera)
+
             nombre = request.form['nombre'].strip()
             telefono = request.form['telefono'].strip()
             email = request.form['email'].strip()
@@ -89,25 +354,21 @@ def index():
             except ValueError:
                 return jsonify({'error': 'El formato de la fecha de nacimiento es inválido.'})
 
-            nombre_existente = supabase.table('usuarios').select('nombre').eq('nombre', nombre).execute()
-            if nombre_existente.data:
-                return jsonify({'error': 'Este nombre de usuario ya está en uso. Por favor, elige otro.'}), 409
-            telefono_existente = supabase.table('usuarios').select('telefono').eq('telefono', telefono).execute()
-            if telefono_existente.data:
-                return jsonify({'error': 'Este número de teléfono ya está registrado.'}), 409
+            en_uso = campos_en_uso(supabase, nombre=nombre, telefono=telefono, email=email)
+            if en_uso:
+                return jsonify({'error': MENSAJES_UNICIDAD[en_uso[0]], 'campos': en_uso}), 409
 
+            local_path = None
             try:
                 if rol == 'lanchero_pendiente' and request.files.get('foto_lancha'):
+                    if not upload_pipeline.has_capacity():
+                        return upload_ocupado()
                     foto = request.files['foto_lancha']
-                    file_ext = foto.filename.rsplit('.', 1)[-1] if '.' in foto.filename else 'jpg'
-                    file_name = f'solicitud_{telefono}_{int(time.time())}.{file_ext}'
+                    # Siempre .jpg: la foto se re-codifica a JPEG antes de subirse.
+                    file_name = f'solicitud_{telefono}_{int(time.time())}.jpg'
                     
-                    supabase.storage.from_('lanchas_fotos').upload(
-                        file=foto.read(), 
-                        path=file_name, 
-                        file_options={"content-type": foto.content_type, "cache-control": "3600"}
-                    )
-                    foto_lancha_url = supabase.storage.from_('lanchas_fotos').get_public_url(file_name)
+                    local_path = upload_pipeline.spool(foto)
+                    foto_lancha_url = upload_pipeline.public_url('lanchas_fotos', file_name)
 
                 auth_response = supabase.auth.sign_up({
                     "email": email,
@@ -125,8 +386,26 @@ def index():
                     }
                 })
 
+                if local_path:
+                    try:
+                        upload_pipeline.submit(local_path, 'lanchas_fotos', file_name, content_type=foto.content_type,
+                                               accion='lancha', params={'user_id': auth_response.user.id},
+                                               imagen=IMAGEN_LANCHA)
+                    except UploadQueueFull:
+                        print(f"[ERROR REGISTRO] Cola de subidas llena, se descartó la foto de la lancha de {email}")
+                        try:
+                            foto_lancha_fallida({'user_id': auth_response.user.id})
+                        except Exception as e:
+                            print(f"[ERROR REGISTRO] No se pudo quitar foto_lancha_url de {email}: {e}")
+                    local_path = None
+
+                olvidar_identificadores(nombre, telefono, email)
+                if rol == 'lanchero_pendiente':
+                    pendientes_cache.invalidate(PENDIENTES_KEY)
                 return jsonify({'success': True, 'redirect': f'/verificar?email={email}'})
             except Exception as e:
+                if local_path:
+                    upload_pipeline.discard(local_path)
                 error_msg = str(e)
                 app.logger.error(f"Internal server error during registration: {error_msg}", exc_info=True)
                 
@@ -136,17 +415,21 @@ def index():
                 return jsonify({'error': 'Ha ocurrido un error interno inesperado. Por favor, contacta a soporte.'}), 500
 
         elif action == 'login':
+            espera = admitir('login', identificador=request.form.get('identificador'))
+            if espera:
+                return demasiadas_peticiones(espera)
+
             identificador = request.form['identificador'].strip()
             contraseña = request.form['contraseña']
 
             try:
-                email_to_login = identificador
-                if '@' not in identificador:
-                    query = supabase.table('usuarios').select('email').or_(f'telefono.eq.{identificador},nombre.eq.{identificador}').limit(1).execute()
-                    
-                    if not query.data:
-                        return jsonify({'error': 'Datos incorrectos'})
-                    email_to_login = query.data[0]['email']
+                cuenta = resolver_identificador(identificador)
+                if cuenta:
+                    email_to_login = cuenta['email']
+                elif '@' in identificador:
+                    email_to_login = identificador
+                else:
+                    return jsonify({'error': 'Datos incorrectos'})
 
                 auth_response = supabase.auth.sign_in_with_password({
                     "email": email_to_login,
@@ -155,18 +438,17 @@ def index():
                 user = auth_response.user
                 session['user_id'] = user.id
 
-                profile_response = supabase.table('usuarios').select('rol').eq('id', user.id).single().execute()
+                # El rol ya quedó en caché con la misma consulta que resolvió el identificador.
+                rol = obtener_rol(user.id)
                 
                 redirect_url = '/dashboard'
-                if profile_response.data and profile_response.data.get('rol') == 'lanchero_pendiente':
+                if rol == 'lanchero_pendiente':
                     return jsonify({'error': 'Tu solicitud para ser lanchero aún está en revisión. Serás notificado por correo.'})
 
-                if profile_response.data:
-                    rol = profile_response.data.get('rol')
-                    if rol == 'lanchero':
-                        redirect_url = '/lanchero'
-                    elif rol == 'admin':
-                        redirect_url = '/admin/solicitudes'
+                if rol == 'lanchero':
+                    redirect_url = '/lanchero'
+                elif rol == 'admin':
+                    redirect_url = '/admin/solicitudes'
 
                 return jsonify({'success': True, 'redirect': redirect_url})
 
@@ -184,6 +466,11 @@ def verificar():
         if not email or not token:
             return render_template('verificar.html', email=email, error="El código es obligatorio.")
 
+        espera = admitir('verificar', identificador=email)
+        if espera:
+            return demasiadas_peticiones(espera, make_response(render_template(
+                'verificar.html', email=email, error="Demasiados intentos. Espera un momento y vuelve a intentarlo.")))
+
         try:
             verified_session = supabase.auth.verify_otp({
                 "email": email,
@@ -194,9 +481,7 @@ def verificar():
             user_id = verified_session.user.id
             session['user_id'] = user_id
 
-            profile_response = supabase.table('usuarios').select('rol').eq('id', user_id).single().execute()
-
-            if profile_response.data and profile_response.data.get('rol') == 'lanchero_pendiente':
+            if obtener_rol(user_id) == 'lanchero_pendiente':
                 session.pop('user_id', None)
                 return redirect('/?mensaje=lanchero_pendiente')
 
@@ -212,6 +497,10 @@ def request_password_reset():
     email = request.form.get('email')
     if not email:
         return jsonify({'success': False, 'error': 'El correo es obligatorio.'}), 400
+
+    espera = admitir('password_reset', identificador=email)
+    if espera:
+        return demasiadas_peticiones(espera)
     
     try:
         supabase.auth.reset_password_for_email(email, options={'redirect_to': '/reset-password'})
@@ -237,83 +526,125 @@ def dashboard():
     
     user_id = session['user_id']
     
-    if request.args.get('updated') == 'true':
-        time.sleep(1)
-        return redirect('/dashboard')
-
     try:
-        # QUITAMOS .single() para evitar el error PGRST116
-        response = supabase.table('usuarios').select('*').eq('id', user_id).execute()
+        user = perfiles.get(user_id)
         
-        if not response.data:
+        if not user:
             session.pop('user_id', None)
             return redirect('/')
 
-        user = response.data[0]
-
-        top_users_response = supabase.table('usuarios').select('nombre, kg_reciclados').order('kg_reciclados', desc=True).limit(3).execute()
-        top_users = top_users_response.data
+        top_users = leaderboard.top(3)
 
         user['kg_reciclados'] = float(user.get('kg_reciclados', 0.0))
         user['minutos'] = int(user.get('minutos', 0))
 
-        return render_template('dashboard.html', user=user, top_users=top_users, supabase_key=SUPABASE_KEY)
+        return render_template('dashboard.html', user=user, top_users=top_users)
 
     except Exception as e:
         print(f"[ERROR SUPABASE DASHBOARD] {e}")
         session.pop('user_id', None)
         return redirect('/')
 
+def payload_usuario(user, top_users):
+    return {'success': True, **datos_usuario(user), 'top_users': top_users}
+
+def etag_usuario(user_id, user, top_users):
+    # Solo con los datos de los que sale el payload; no hace falta armarlo para comparar.
+    return etag_de(user_id, user['nombre'], user['kg_reciclados'], user['minutos'], top_users)
+
 @app.route('/api/user')
+@politica('revalidar')
 def api_user():
     if 'user_id' not in session:
         return jsonify({'success': False})
 
     try:
-        resp = supabase.table('usuarios').select('nombre, kg_reciclados, minutos') \
-            .eq('id', session['user_id']) \
-            .execute()
-        if not resp.data:
+        user = perfiles.get(session['user_id'])
+        if not user:
             return jsonify({'success': False})
-        user = resp.data[0]
 
-        top_users_response = supabase.table('usuarios').select('nombre, kg_reciclados').order('kg_reciclados', desc=True).limit(3).execute()
-        top_users = top_users_response.data
+        top_users = leaderboard.top(3)
 
-        return jsonify({
-            'success': True,
-            'nombre': user['nombre'],
-            'kg_reciclados': float(user['kg_reciclados']),
-            'minutos': int(user['minutos']),
-            'arboles': int(float(user['kg_reciclados'])),
-            'co2_evitado': round(float(user['kg_reciclados']) * 2.5, 1),
-            'top_users': top_users
-        })
+        etag = etag_usuario(session['user_id'], user, top_users)
+        return no_modificado(request, etag) or con_etag(jsonify(payload_usuario(user, top_users)), etag)
     except Exception as e:
         print(f"[ERROR API USER] {e}")
         return jsonify({'success': False})
 
+@app.route('/api/user/stream')
+def api_user_stream():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+    if not WSGI_STREAMS:
+        # 204 cierra el EventSource y dashboard.js vuelve a pedir /api/user cada 10 segundos.
+        return Response(status=204)
+    # Como el feed de reportes: se cierra cada cierto tiempo y EventSource reconecta solo.
+    stream = dashboards.stream(session['user_id'], max_duration=DASHBOARD_STREAM_MAX_SECONDS)
+    return Response(
+        stream_with_context(stream),
+        mimetype='text/event-stream',
+        headers={'X-Accel-Buffering': 'no'},
+    )
+
+@app.route('/api/ranking')
+def api_ranking():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    try:
+        n = int(request.args.get('n', 10))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Parámetro n inválido.'}), 400
+
+    try:
+        return jsonify({'success': True, 'ranking': leaderboard.top(n)})
+    except Exception as e:
+        print(f"[ERROR API RANKING] {e}")
+        return jsonify({'success': False}), 500
+
+def rango_progreso(args):
+    try:
+        dias = int(args.get('dias', 7))
+    except ValueError:
+        dias = 0
+    if dias not in PROGRESO_RANGOS:
+        raise ValueError('Rango no válido.')
+    return dias
+
+def consulta_progreso(client, user_id, hoy, dias):
+    desde = hoy - timedelta(days=dias - 1)
+    return client.table('progreso_diario').select('dia, kg') \
+        .eq('user_id', user_id) \
+        .gte('dia', desde.isoformat())
+
+def totales_progreso(filas, hoy, dias):
+    daily_totals = { (hoy - timedelta(days=i)).isoformat(): 0 for i in range(dias) }
+    for fila in filas:
+        if fila['dia'] in daily_totals:
+            daily_totals[fila['dia']] = float(fila['kg'])
+    return daily_totals
+
 @app.route('/api/weekly_progress')
+@politica('revalidar')
 def weekly_progress():
     if 'user_id' not in session:
         return jsonify({'success': False, 'error': 'No autorizado'}), 401
 
+    try:
+        dias = rango_progreso(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
     try:
         user_id = session['user_id']
-        
-        response = supabase.table('reportes').select('created_at, kg_reportados') \
-            .eq('user_id', user_id) \
-            .eq('recogido', True) \
-            .gte('created_at', (datetime.now() - timedelta(days=7)).isoformat()) \
-            .execute()
+        hoy = datetime.now(APP_TIMEZONE).date()
 
-        daily_totals = { (datetime.now() - timedelta(days=i)).strftime('%Y-%m-%d'): 0 for i in range(7) }
-        for reporte in response.data:
-            report_date = datetime.fromisoformat(reporte['created_at']).strftime('%Y-%m-%d')
-            if report_date in daily_totals:
-                daily_totals[report_date] += float(reporte['kg_reportados'])
-        
-        return jsonify({'success': True, 'progress': daily_totals})
+        # Leemos los acumulados por día que se van sumando al recoger cada reporte.
+        response = consulta_progreso(supabase, user_id, hoy, dias).execute()
+
+        progress = totales_progreso(response.data, hoy, dias)
+        etag = etag_de(user_id, progress)
+        return no_modificado(request, etag) or con_etag(jsonify({'success': True, 'progress': progress}), etag)
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -332,8 +663,7 @@ def perfil():
             email = data.get('email', '').strip()
 
             if nombre:
-                existing_user = supabase.table('usuarios').select('id').eq('nombre', nombre).neq('id', user_id).execute()
-                if existing_user.data:
+                if campos_en_uso(supabase, nombre=nombre, excluir_id=user_id):
                     return jsonify({'success': False, 'error': 'Ese nombre ya está en uso. Por favor, elige otro.'}), 400
 
             update_data = {}
@@ -342,18 +672,24 @@ def perfil():
             if email: update_data['email'] = email
 
             if update_data:
+                # Las entradas del caché de login de los identificadores viejos apuntan a los datos
+                # de antes (el teléfono también: resuelve al email anterior); se leen antes de cambiarlos.
+                anterior = supabase.table('usuarios').select('nombre, telefono, email').eq('id', user_id).execute().data
+                anterior = anterior[0] if anterior else {}
                 supabase.table('usuarios').update(update_data).eq('id', user_id).execute()
+                perfiles.actualizar(user_id, update_data)
+                dashboards.publicar(user_id, update_data)
+                olvidar_identificadores(nombre, email, anterior.get('nombre'), anterior.get('telefono'), anterior.get('email'))
             
             return jsonify({'success': True}) # Devolvemos una respuesta JSON
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
     try:
-        response = supabase.table('usuarios').select('*').eq('id', user_id).execute()
-        if not response.data:
+        user = perfiles.get(user_id)
+        if not user:
             session.pop('user_id', None)
             return redirect('/')
-        user = response.data[0]
         return render_template('perfil.html', user=user)
     except Exception as e:
         print(f"[ERROR PERFIL] {e}")
@@ -370,19 +706,39 @@ def upload_avatar():
     if not foto:
         return jsonify({'success': False, 'error': 'No se ha seleccionado ninguna imagen.'})
 
+    espera = admitir('upload_avatar', user_id)
+    if espera:
+        return demasiadas_peticiones(espera)
+
+    if not upload_pipeline.has_capacity():
+        return upload_ocupado()
+
     try:
-        file_ext = foto.filename.split('.')[-1]
-        file_name = f'public/{user_id}.{file_ext}'
-        
-        supabase.storage.from_('avatars').upload(file=foto.read(), path=file_name, file_options={"content-type": foto.content_type, "cache-control": "3600", "upsert": "true"})
+        file_name = f'public/{user_id}.jpg'
         
-        image_url = supabase.storage.from_('avatars').get_public_url(file_name)
-
-        supabase.table('usuarios').update({'avatar_url': image_url}).eq('id', user_id).execute()
-        return jsonify({'success': True, 'url': image_url})
+        local_path = upload_pipeline.spool(foto)
+        upload_pipeline.submit(local_path, 'avatars', file_name, content_type=foto.content_type, upsert=True,
+                               accion='avatar', params={'user_id': user_id}, imagen=IMAGEN_AVATAR)
+
+        image_url = upload_pipeline.public_url('avatars', file_name)
+        return jsonify({'success': True, 'pendiente': True, 'url': image_url}), 202
+    except UploadQueueFull:
+        return upload_ocupado()
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def archivos_de_cuenta(user_id):
+    # Todo lo que la cuenta tiene en Storage (avatar, fotos de reportes y de la lancha), cada
+    # foto con sus miniaturas. Se lee antes de borrar la cuenta, que se lleva las filas.
+    perfil = supabase.table('usuarios').select('avatar_url, foto_lancha_url').eq('id', user_id).single().execute().data or {}
+    reportes = supabase.table('reportes').select('foto_url').eq('user_id', user_id).execute().data
+    return {
+        'avatars': rutas_en_bucket(perfil.get('avatar_url'), 'avatars', IMAGEN_AVATAR),
+        'reportes_fotos': [ruta for reporte in reportes
+                           for ruta in rutas_en_bucket(reporte.get('foto_url'), 'reportes_fotos', IMAGEN_REPORTE)],
+        'lanchas_fotos': rutas_foto_lancha(perfil),
+    }
+
 @app.route('/api/delete_account', methods=['POST'])
 def delete_account():
     if 'user_id' not in session:
@@ -390,14 +746,17 @@ def delete_account():
 
     user_id = session['user_id']
     try:
-        user_profile = supabase.table('usuarios').select('avatar_url').eq('id', user_id).single().execute()
-        if user_profile.data and user_profile.data.get('avatar_url'):
-            avatar_url = user_profile.data['avatar_url']
-            file_path = avatar_url.split('/avatars/')[-1]
-            if file_path:
-                supabase.storage.from_('avatars').remove([file_path])
-
+        archivos = archivos_de_cuenta(user_id)
         supabase.auth.admin.delete_user(user_id)
+        for bucket, rutas in archivos.items():
+            for i in range(0, len(rutas), ARCHIVOS_POR_LOTE):
+                try:
+                    supabase.storage.from_(bucket).remove(rutas[i:i + ARCHIVOS_POR_LOTE])
+                except Exception as e:
+                    # La cuenta ya se borró; una foto huérfana no cambia la respuesta.
+                    print(f"[ERROR DELETE ACCOUNT ARCHIVOS] {bucket}: {e}")
+        roles_cache.invalidate(user_id)
+        perfiles.invalidar(user_id)
         session.clear()
         return jsonify({'success': True})
     except Exception as e:
@@ -409,124 +768,729 @@ def delete_account():
 def lanchero_panel():
     return render_template('lanchero.html')
 
+def coordenadas_formulario(form):
+    # lat/lng los manda el navegador si el usuario dio permiso de ubicación; son opcionales.
+    lat, lng = form.get('lat'), form.get('lng')
+    if not lat or not lng:
+        return {}
+    try:
+        lat, lng = float(lat), float(lng)
+    except ValueError:
+        raise ValueError('Coordenadas inválidas.')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('Coordenadas inválidas.')
+    return {'lat': lat, 'lng': lng}
+
+def reporte_por_clave(user_id, clave):
+    response = supabase.table('reportes').select('id') \
+        .eq('user_id', user_id) \
+        .eq('clave_cliente', clave) \
+        .execute()
+    return response.data[0]['id'] if response.data else None
+
+class ReporteSinFoto(Exception):
+    # La foto no se pudo encolar y tampoco se pudo borrar la fila: el reporte ya existe con
+    # esa clave, así que reintentar solo devolvería 'repetido' sin foto.
+    pass
+
+def crear_reporte(user_id, datos, foto):
+    # Crea el reporte y encola su foto. Si trae 'clave' (la genera el navegador) y ya
+    # existe un reporte con esa clave, no crea otro. Devuelve (reporte_id, es_nuevo).
+    kg_reportados = datos.get('kg')
+    if not kg_reportados or not foto:
+        raise ValueError('Todos los campos son obligatorios.')
+    try:
+        kg_reportados = float(kg_reportados)
+    except (TypeError, ValueError):
+        raise ValueError('El peso debe ser un número.')
+    ubicacion = coordenadas_formulario(datos)
+    clave = datos.get('clave') or None
+
+    if clave:
+        existente = reporte_por_clave(user_id, clave)
+        if existente is not None:
+            return existente, False
+
+    if not upload_pipeline.has_capacity():
+        raise UploadQueueFull()
+
+    local_path = upload_pipeline.spool(foto)
+    reporte_id = None
+    try:
+        # El reporte queda sin foto_url hasta que la subida termina; mientras tanto no se muestra a los lancheros.
+        reporte_data = {
+            'user_id': user_id,
+            'kg_reportados': kg_reportados,
+            'ubicacion_desc': datos.get('ubicacion'),
+            'foto_url': None,
+            'recogido': False, # Nuevo campo para saber si ya se recogió
+            'clave_cliente': clave,
+            **ubicacion,
+        }
+        if clave:
+            response = supabase.table('reportes') \
+                .upsert(reporte_data, on_conflict='user_id,clave_cliente', ignore_duplicates=True) \
+                .execute()
+        else:
+            response = supabase.table('reportes').insert(reporte_data).execute()
+
+        if not response.data:
+            # Otro intento con la misma clave lo insertó entre nuestra consulta y el insert.
+            upload_pipeline.discard(local_path)
+            return reporte_por_clave(user_id, clave), False
+
+        reporte_id = response.data[0]['id']
+        file_name = f'public/{user_id}_{int(time.time())}_{reporte_id}.jpg'
+        upload_pipeline.submit(local_path, 'reportes_fotos', file_name, content_type=foto.content_type,
+                               accion='reporte', params={'reporte_id': reporte_id}, imagen=IMAGEN_REPORTE)
+        return reporte_id, True
+    except Exception:
+        # Sin foto encolada el reporte no se mostraría nunca; se borra para que el reintento lo vuelva a crear.
+        upload_pipeline.discard(local_path)
+        if reporte_id is not None and not borrar_reporte_sin_foto(reporte_id):
+            raise ReporteSinFoto(reporte_id)
+        raise
+
 @app.route('/reportar', methods=['GET', 'POST'])
 def reportar():
     if 'user_id' not in session:
         return redirect('/')
 
     if request.method == 'POST':
-        user_id = session['user_id']
-        kg_reportados = request.form.get('kg')
-        ubicacion_desc = request.form.get('ubicacion')
-        foto = request.files.get('foto')
-
-        if not kg_reportados or not foto:
-            return jsonify({'success': False, 'error': 'Todos los campos son obligatorios.'})
+        espera = admitir('reportar', session['user_id'])
+        if espera:
+            return demasiadas_peticiones(espera)
 
         try:
-            file_ext = foto.filename.split('.')[-1]
-            file_name = f'public/{user_id}_{int(time.time())}.{file_ext}'
-            
-            supabase.storage.from_('reportes_fotos').upload(file=foto.read(), path=file_name, file_options={"content-type": foto.content_type})
-            
-            image_url = supabase.storage.from_('reportes_fotos').get_public_url(file_name)
-
-            reporte_data = {
-                'user_id': user_id,
-                'kg_reportados': float(kg_reportados),
-                'ubicacion_desc': ubicacion_desc,
-                'foto_url': image_url,
-                'recogido': False # Nuevo campo para saber si ya se recogió
-            }
-            supabase.table('reportes').insert(reporte_data).execute()
-
-            return jsonify({'success': True})
-
+            reporte_id, _ = crear_reporte(session['user_id'], request.form, request.files.get('foto'))
+            return jsonify({'success': True, 'pendiente': True, 'reporte_id': reporte_id}), 202
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except UploadQueueFull:
+            return upload_ocupado()
         except Exception as e:
             print(f"Error al reportar: {e}")
             return jsonify({'success': False, 'error': str(e)})
 
     return render_template('reportar.html')
 
+SYNC_MAX_OPS = 50
+
+def aplicar_operacion(user_id, op):
+    # Aplica una operación de la cola del navegador. 'reintentar' le dice al cliente si
+    # debe conservarla para el próximo intento o descartarla.
+    clave = op.get('clave')
+    tipo = op.get('tipo')
+    datos = op.get('datos') or {}
+    base = {'clave': clave, 'tipo': tipo}
+    if not clave or not isinstance(datos, dict):
+        return {**base, 'estado': 'error', 'error': 'Operación sin clave o con datos inválidos.', 'reintentar': False}
+
+    try:
+        if tipo == 'reporte':
+            # Cada reporte de la cola gasta del mismo límite que /reportar.
+            espera = admitir('reportar', user_id)
+            if espera:
+                return {**base, 'estado': 'error', 'error': 'Demasiados reportes seguidos.', 'reintentar': True,
+                        'retry_after': max(1, math.ceil(espera))}
+            foto = request.files.get(op.get('foto') or '')
+            reporte_id, nuevo = crear_reporte(user_id, {**datos, 'clave': clave}, foto)
+            return {**base, 'estado': 'ok' if nuevo else 'repetido', 'reporte_id': reporte_id}
+
+        if tipo == 'recoger':
+            if obtener_rol(user_id) != 'lanchero':
+                return {**base, 'estado': 'error', 'error': 'Solo los lancheros pueden recoger reportes.', 'reintentar': False}
+            ids = sorted({int(i) for i in datos.get('ids') or []})
+            if not ids or len(ids) > RECOGER_LOTE_MAX:
+                raise ValueError(f'Entre 1 y {RECOGER_LOTE_MAX} reportes por operación.')
+            resultado = recoger_reportes(user_id, ids, clave)
+            return {
+                **base,
+                'estado': 'repetido' if resultado.get('repetido') else 'ok',
+                'recogidos': sorted(r['id'] for r in resultado['recogidos']),
+            }
+
+        return {**base, 'estado': 'error', 'error': 'Tipo de operación desconocido.', 'reintentar': False}
+    except (TypeError, ValueError) as e:
+        return {**base, 'estado': 'error', 'error': str(e), 'reintentar': False}
+    except UploadQueueFull:
+        return {**base, 'estado': 'error', 'error': 'Servidor ocupado.', 'reintentar': True}
+    except ReporteSinFoto:
+        # La fila se quedó; reintentar con la misma clave no subiría la foto.
+        return {**base, 'estado': 'error', 'error': 'No se pudo guardar la foto del reporte.', 'reintentar': False}
+    except Exception as e:
+        print(f"[ERROR SYNC] {tipo} {clave}: {e}")
+        return {**base, 'estado': 'error', 'error': 'Error temporal.', 'reintentar': True}
+
+@app.route('/api/sync', methods=['POST'])
+def sincronizar():
+    # Lo que el navegador guardó sin señal llega en una sola petición multipart: el campo
+    # 'ops' con la lista en orden y las fotos como archivos a los que cada operación se refiere.
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    try:
+        ops = json.loads(request.form.get('ops') or '[]')
+    except ValueError:
+        ops = None
+    if not isinstance(ops, list) or not all(isinstance(op, dict) for op in ops):
+        return jsonify({'success': False, 'error': 'ops debe ser una lista de operaciones.'}), 400
+    if len(ops) > SYNC_MAX_OPS:
+        return jsonify({'success': False, 'error': f'Máximo {SYNC_MAX_OPS} operaciones por sincronización.'}), 400
+
+    user_id = session['user_id']
+    return jsonify({'success': True, 'resultados': [aplicar_operacion(user_id, op) for op in ops]})
+
+@app.route('/sw.js')
+def service_worker():
+    # Se sirve desde la raíz para que el service worker controle todas las páginas.
+    return send_from_directory(os.path.join(app.static_folder, 'js'), 'sw.js', mimetype='application/javascript')
+
 @app.route('/mapa')
 def mapa():
     if 'user_id' not in session:
         return redirect('/')
     return render_template('mapa.html')
 
+REPORTES_PAGE_SIZE = int(os.environ.get("REPORTES_PAGE_SIZE", 50))
+REPORTES_MAX_PAGE_SIZE = 200
+# Columnas que se pueden pedir con ?fields=. 'usuarios' trae el nombre y barrio de quien reportó.
+REPORTES_CAMPOS = {
+    'id': 'id',
+    'created_at': 'created_at',
+    'user_id': 'user_id',
+    'kg_reportados': 'kg_reportados',
+    'ubicacion_desc': 'ubicacion_desc',
+    'foto_url': 'foto_url',
+    'foto_thumb_url': 'foto_thumb_url',
+    'recogido': 'recogido',
+    'lat': 'lat',
+    'lng': 'lng',
+    'usuarios': 'usuarios(nombre, barrio)',
+}
+# Lo que se manda de cada reporte en /api/reportes/bbox.
+REPORTES_BBOX_CAMPOS = ('id', 'created_at', 'lat', 'lng', 'kg_reportados', 'ubicacion_desc', 'foto_url',
+                        'foto_thumb_url', 'usuarios')
+
+def codificar_cursor(reporte):
+    raw = json.dumps([reporte['created_at'], reporte['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decodificar_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+    created_at, reporte_id = json.loads(raw)
+    # El cursor lo manda el cliente y created_at va entre comillas dentro del filtro or_():
+    # solo se acepta si es una fecha válida, reescrita por nosotros.
+    created_at = datetime.fromisoformat(str(created_at)).isoformat()
+    return created_at, int(reporte_id)
+
+def parametros_reportes(args):
+    try:
+        limit = min(max(int(args.get('limit', REPORTES_PAGE_SIZE)), 1), REPORTES_MAX_PAGE_SIZE)
+        cursor = args.get('cursor')
+        cursor = decodificar_cursor(cursor) if cursor else None
+    except (ValueError, TypeError):
+        raise ValueError('Parámetros de paginación inválidos.')
+
+    fields = args.get('fields')
+    if fields:
+        pedidos = [f.strip() for f in fields.split(',') if f.strip()]
+        if any(f not in REPORTES_CAMPOS for f in pedidos):
+            raise ValueError('Campo no permitido en fields.')
+        columnas = ['id', 'created_at'] + [REPORTES_CAMPOS[f] for f in pedidos if f not in ('id', 'created_at')]
+        select = ', '.join(columnas)
+    else:
+        select = '*, usuarios(nombre, barrio)'
+
+    count = args.get('count')
+    if count not in (None, 'exact', 'planned', 'estimated'):
+        raise ValueError('Valor de count inválido.')
+
+    return {'limit': limit, 'cursor': cursor, 'select': select, 'count': count}
+
+def consulta_reportes(client, params):
+    # Sirve igual con el cliente síncrono que con el asíncrono del modo ASGI.
+    query = client.postgrest.from_('reportes') \
+        .select(params['select'], count=params['count']) \
+        .eq('recogido', False) \
+        .not_.is_('foto_url', 'null')
+    if params['cursor']:
+        created_at, reporte_id = params['cursor']
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{reporte_id})')
+    return query.order('created_at', desc=True).order('id', desc=True) \
+        .limit(params['limit'] + 1)
+
+def pagina_reportes(response, params, args, path):
+    limit = params['limit']
+    reportes = response.data[:limit]
+    headers = {}
+    if len(response.data) > limit:
+        next_cursor = codificar_cursor(reportes[-1])
+        headers['X-Next-Cursor'] = next_cursor
+        args = dict(args)
+        args['cursor'] = next_cursor
+        headers['Link'] = f'<{path}?{urlencode(args)}>; rel="next"'
+    if params['count']:
+        headers['X-Total-Count'] = str(response.count)
+    return reportes, headers
+
 @app.route('/api/reportes')
+@politica('revalidar')
 @lanchero_required
 def get_reportes():
-    response = supabase.postgrest.from_('reportes') \
-        .select('*, usuarios(nombre, barrio)', count='exact') \
-        .eq('recogido', False).order('created_at', desc=True) \
-        .execute()
+    # Paginación por llave (created_at, id): cada página cuesta lo mismo sin importar cuántos reportes haya.
+    try:
+        params = parametros_reportes(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    response = consulta_reportes(supabase, params).execute()
+    reportes, headers = pagina_reportes(response, params, request.args.to_dict(), request.path)
+
+    etag = etag_de(reportes, headers)
+    no_cambio = no_modificado(request, etag)
+    if no_cambio:
+        return no_cambio
 
-    return jsonify(response.data)
+    result = con_etag(jsonify(reportes), etag)
+    result.headers.update(headers)
+    return result
+
+def parametros_bbox(args):
+    # bbox=oeste,sur,este,norte (el mismo orden que usan Leaflet y OpenStreetMap) y zoom del mapa.
+    try:
+        oeste, sur, este, norte = (float(v) for v in args.get('bbox', '').split(','))
+        zoom = int(args.get('zoom', ZOOM_SIN_GRUPOS))
+    except ValueError:
+        raise ValueError('Parámetros bbox o zoom inválidos.')
+    if not (-90 <= sur <= norte <= 90 and -180 <= oeste <= este <= 180):
+        raise ValueError('El bbox debe ser oeste,sur,este,norte.')
+    return sur, oeste, norte, este, min(max(zoom, 0), 22)
+
+@app.route('/api/reportes/bbox')
+@politica('revalidar')
+@lanchero_required
+def reportes_bbox():
+    # Solo los reportes abiertos que caen dentro del mapa visible; con poco zoom, agrupados.
+    try:
+        sur, oeste, norte, este, zoom = parametros_bbox(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    report_feed.esperar_listo()
+    sueltos, grupos = mapa_reportes.agrupar(sur, oeste, norte, este, zoom)
+    sueltos.sort(key=lambda r: (r.get('created_at') or '', r['id']), reverse=True)
+    truncado = len(sueltos) > REPORTES_BBOX_MAX
+    reportes = [{k: r.get(k) for k in REPORTES_BBOX_CAMPOS} for r in sueltos[:REPORTES_BBOX_MAX]]
+
+    etag = etag_de(reportes, grupos)
+    no_cambio = no_modificado(request, etag)
+    if no_cambio:
+        return no_cambio
+    return con_etag(jsonify({'success': True, 'reportes': reportes, 'grupos': grupos, 'truncado': truncado}), etag)
+
+def parametros_ruta(datos):
+    try:
+        lat, lng = float(datos.get('lat')), float(datos.get('lng'))
+        capacidad = datos.get('capacidad_kg')
+        capacidad = float(capacidad) if capacidad not in (None, '') else None
+        presupuesto = min(float(datos.get('presupuesto_ms', RUTA_PRESUPUESTO_MS)), 1000) / 1000
+    except (TypeError, ValueError):
+        raise ValueError('Faltan lat, lng o capacidad_kg válidos.')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('Coordenadas inválidas.')
+    if capacidad is not None and capacidad <= 0:
+        raise ValueError('La capacidad debe ser mayor que cero.')
+    return (lat, lng), capacidad, max(presupuesto, 0)
+
+@app.route('/api/rutas', methods=['POST'])
+@lanchero_required
+def planificar_ruta_lanchero():
+    # Ruta ordenada para este bote desde su posición, sin pasar de su capacidad y sin
+    # repetir los reportes que ya van en la ruta de otro lanchero activo.
+    try:
+        inicio, capacidad, presupuesto = parametros_ruta(request.get_json(silent=True) or request.form)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        report_feed.esperar_listo()
+        abiertos = report_feed.snapshot()
+        con_ubicacion = [r for r in abiertos if coordenadas(r) is not None]
+
+        red = red_fluvial(RED_FLUVIAL_PATH)
+        lanchero_id = session['user_id']
+        candidatos, de_otros = repartir(lanchero_id, inicio, con_ubicacion, lancheros_en_ruta.activos(), red)
+        ruta, distancia = planificar_ruta(inicio, capacidad, candidatos, red, presupuesto, RUTA_MAX_CANDIDATOS)
+        lancheros_en_ruta.registrar(lanchero_id, inicio, capacidad, [r['id'] for r in ruta])
+
+        acumulado = 0.0
+        paradas = []
+        for reporte in ruta:
+            acumulado += float(reporte.get('kg_reportados') or 0)
+            paradas.append({**{k: reporte.get(k) for k in REPORTES_BBOX_CAMPOS}, 'kg_acumulado': round(acumulado, 2)})
+
+        return jsonify({
+            'success': True,
+            'ruta': paradas,
+            'distancia_km': round(distancia, 3),
+            'kg_total': round(acumulado, 2),
+            'sin_capacidad': len(candidatos) - len(ruta),
+            'de_otros_lancheros': de_otros,
+            'sin_ubicacion': len(abiertos) - len(con_ubicacion),
+        })
+    except Exception as e:
+        print(f"[ERROR RUTAS] {e}")
+        return jsonify({'success': False, 'error': 'No se pudo calcular la ruta.'}), 500
+
+@app.route('/api/reportes/stream')
+@lanchero_required
+def reportes_stream():
+    if not WSGI_STREAMS:
+        # 204 hace que EventSource no reconecte; la página pasa a pedir /api/reportes.
+        return Response(status=204)
+    # Cerramos el stream cada cierto tiempo; EventSource reconecta solo y reanuda con Last-Event-ID.
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    stream = report_feed.stream(last_event_id, max_duration=REPORT_STREAM_MAX_SECONDS)
+    return Response(
+        stream_with_context(stream),
+        mimetype='text/event-stream',
+        headers={'X-Accel-Buffering': 'no'},
+    )
+
+RECOGER_LOTE_MAX = 100
+
+def recoger_reportes(lanchero_id, ids, clave=None):
+    # Una sola transacción en Supabase: reclama los reportes que sigan sin recoger y suma
+    # los kg, los minutos y el progreso diario de sus dueños. Con la misma clave, un
+    # reintento devuelve la respuesta original sin volver a sumar.
+    resultado = supabase.rpc('recoger_reportes', {
+        'p_lanchero': lanchero_id,
+        'p_ids': ids,
+        'p_clave': clave,
+        'p_zona': str(APP_TIMEZONE),
+        'p_minutos_por_kg': MINUTOS_POR_KG,
+    }).execute().data
+
+    for usuario in resultado['usuarios']:
+        cambios = {'kg_reciclados': usuario['kg_reciclados'], 'minutos': usuario['minutos']}
+        perfiles.actualizar(usuario['id'], cambios)
+        dashboards.publicar(usuario['id'], cambios)
+    for reporte in resultado['recogidos']:
+        mapa_reportes.quitar(reporte['id'])
+        report_feed.publicar_recogido(reporte['id'])
+    if resultado['recogidos']:
+        leaderboard.invalidate()
+        dashboards.despertar()
+    return resultado
 
 @app.route('/api/reporte/recoger/<int:reporte_id>', methods=['POST'])
 @lanchero_required
 def recoger_reporte(reporte_id):
     try:
-        supabase.table('reportes').update({'recogido': True}).eq('id', reporte_id).execute()
+        recoger_reportes(session['user_id'], [reporte_id])
+        # Si otro lanchero ya lo había recogido, igual lo sacamos de la lista de este.
+        mapa_reportes.quitar(reporte_id)
+        report_feed.publicar_recogido(reporte_id)
         return jsonify({'success': True})
     except Exception as e:
         print(f"Error al recoger reporte: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/reportes/recoger', methods=['POST'])
+@lanchero_required
+def recoger_reportes_lote():
+    # {"ids": [1, 2, 3]} y una clave en el header Idempotency-Key (o en "clave") para
+    # que los reintentos por mala señal en el río no cuenten dos veces.
+    datos = request.get_json(silent=True) or {}
+    clave = request.headers.get('Idempotency-Key') or datos.get('clave')
+    try:
+        ids = sorted({int(i) for i in datos.get('ids') or []})
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'ids debe ser una lista de números.'}), 400
+    if not ids:
+        return jsonify({'success': False, 'error': 'No se enviaron reportes.'}), 400
+    if len(ids) > RECOGER_LOTE_MAX:
+        return jsonify({'success': False, 'error': f'Máximo {RECOGER_LOTE_MAX} reportes por lote.'}), 400
+    if clave is not None and not 0 < len(clave) <= 200:
+        return jsonify({'success': False, 'error': 'Clave de idempotencia inválida.'}), 400
+
+    try:
+        resultado = recoger_reportes(session['user_id'], ids, clave)
+    except Exception as e:
+        print(f"[ERROR RECOGER LOTE] {e}")
+        return jsonify({'success': False, 'error': 'No se pudieron recoger los reportes.'}), 500
+
+    recogidos = {r['id'] for r in resultado['recogidos']}
+    return jsonify({
+        'success': True,
+        'repetido': resultado.get('repetido', False),
+        'recogidos': sorted(recogidos),
+        'resultados': {str(i): 'recogido' if i in recogidos else 'no_disponible' for i in ids},
+        'kg_total': round(sum(float(r['kg_reportados']) for r in resultado['recogidos']), 2),
+    })
+
+# Cola de revisión de lancheros: solo las columnas que muestra la tabla, por páginas
+# ordenadas por id (la página siguiente empieza después del último id que se vio).
+SOLICITUDES_CAMPOS = 'id, nombre, email, telefono, mensaje_lanchero, foto_lancha_url, foto_lancha_thumb_url'
+SOLICITUDES_POR_PAGINA = int(os.environ.get("SOLICITUDES_POR_PAGINA", 25))
+
+# El número de solicitudes pendientes para el contador del panel. Se borra cuando llega
+# una solicitud nueva o el admin procesa una; el TTL cubre a los otros workers.
+pendientes_cache = TTLCache(maxsize=1, ttl=float(os.environ.get("PENDIENTES_TTL", 30)))
+PENDIENTES_KEY = 'lanchero_pendiente'
+
+def contar_pendientes():
+    def cargar():
+        return supabase.table('usuarios').select('id', count='exact', head=True) \
+            .eq('rol', 'lanchero_pendiente') \
+            .execute().count or 0
+    return pendientes_cache.get_or_set(PENDIENTES_KEY, cargar)
+
+def pagina_solicitudes(despues=None):
+    query = supabase.table('usuarios') \
+        .select(SOLICITUDES_CAMPOS) \
+        .eq('rol', 'lanchero_pendiente')
+    if despues:
+        query = query.gt('id', despues)
+    filas = query.order('id').limit(SOLICITUDES_POR_PAGINA + 1).execute().data
+    solicitudes = filas[:SOLICITUDES_POR_PAGINA]
+    siguiente = solicitudes[-1]['id'] if len(filas) > SOLICITUDES_POR_PAGINA else None
+    return solicitudes, siguiente
+
 @app.route('/admin/solicitudes')
 @admin_required
 def admin_solicitudes():
     try:
         user_id = session['user_id']
-        user_response = supabase.table('usuarios').select('*').eq('id', user_id).single().execute()
-        user = user_response.data
-        solicitudes_response = supabase.table('usuarios') \
-            .select('*') \
-            .eq('rol', 'lanchero_pendiente') \
-            .execute()
-        
-        solicitudes = solicitudes_response.data
-        return render_template('admin_solicitudes.html', solicitudes=solicitudes, user=user)
+        user = perfiles.get(user_id)
+        solicitudes, siguiente = pagina_solicitudes()
+        return render_template('admin_solicitudes.html', solicitudes=solicitudes, siguiente=siguiente,
+                               pendientes=contar_pendientes(), user=user)
     except Exception as e:
         print(f"Error al cargar solicitudes de admin: {e}")
         return "Error al cargar la página de administrador.", 500
 
-@app.route('/admin/solicitud/procesar', methods=['POST'])
+@app.route('/admin/api/solicitudes')
 @admin_required
-def procesar_solicitud_admin():
-    data = request.get_json()
-    solicitud_id = data.get('solicitud_id')
-    accion = data.get('accion')
+def admin_api_solicitudes():
+    # Las páginas siguientes de la cola para el scroll infinito.
+    despues = request.args.get('despues')
+    if despues:
+        try:
+            despues = str(uuid.UUID(despues))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Parámetro despues inválido.'}), 400
+    try:
+        solicitudes, siguiente = pagina_solicitudes(despues)
+        return jsonify({
+            'success': True,
+            'solicitudes': solicitudes,
+            'siguiente': siguiente,
+            'pendientes': contar_pendientes(),
+        })
+    except Exception as e:
+        print(f"[ERROR SOLICITUDES] {e}")
+        return jsonify({'success': False, 'error': 'No se pudieron cargar las solicitudes.'}), 500
+
+SOLICITUDES_LOTE_MAX = int(os.environ.get("SOLICITUDES_LOTE_MAX", 200))
+# Cuántas cuentas se borran a la vez en Auth al rechazar un lote.
+RECHAZOS_HILOS = int(os.environ.get("RECHAZOS_HILOS", 4))
+ARCHIVOS_POR_LOTE = 100
+
+def rutas_foto_lancha(solicitud):
+    # La foto de la lancha y su miniatura, como rutas dentro del bucket lanchas_fotos.
+    return rutas_en_bucket(solicitud.get('foto_lancha_url'), 'lanchas_fotos', IMAGEN_LANCHA)
 
+def rechazar_solicitud(solicitud_id):
+    try:
+        supabase.auth.admin.delete_user(solicitud_id)
+        return solicitud_id, None
+    except Exception as e:
+        return solicitud_id, e
+
+def procesar_solicitudes(acciones):
+    # acciones: [(solicitud_id, 'aprobar' | 'rechazar'), ...]. Solo se tocan cuentas que
+    # siguen en lanchero_pendiente. Las aprobaciones van en un solo update; los rechazos
+    # borran la cuenta en Auth con pocos hilos y después sus fotos, por lotes.
+    # Devuelve ({id: {'estado': ...}}, archivos_borrados).
+    resultados = {}
+    aprobar = [i for i, accion in acciones if accion == 'aprobar']
+    rechazar = [i for i, accion in acciones if accion == 'rechazar']
+
+    if aprobar:
+        response = supabase.table('usuarios').update({'rol': 'lanchero'}) \
+            .in_('id', aprobar) \
+            .eq('rol', 'lanchero_pendiente') \
+            .execute()
+        aprobados = {fila['id'] for fila in response.data}
+        for solicitud_id in aprobar:
+            resultados[solicitud_id] = {'estado': 'aprobado' if solicitud_id in aprobados else 'no_pendiente'}
+
+    archivos_borrados = 0
+    if rechazar:
+        response = supabase.table('usuarios') \
+            .select('id, foto_lancha_url, foto_lancha_thumb_url') \
+            .in_('id', rechazar) \
+            .eq('rol', 'lanchero_pendiente') \
+            .execute()
+        pendientes = {fila['id']: fila for fila in response.data}
+        for solicitud_id in rechazar:
+            if solicitud_id not in pendientes:
+                resultados[solicitud_id] = {'estado': 'no_pendiente'}
+
+        # Cada tarea lleva una copia del contexto para que sus llamadas sigan contando en /metrics
+        # como parte de esta petición.
+        archivos = []
+        with ThreadPoolExecutor(max_workers=RECHAZOS_HILOS) as pool:
+            tareas = [pool.submit(contextvars.copy_context().run, rechazar_solicitud, solicitud_id)
+                      for solicitud_id in pendientes]
+            for tarea in tareas:
+                solicitud_id, error = tarea.result()
+                if error is None:
+                    resultados[solicitud_id] = {'estado': 'rechazado'}
+                    archivos.extend(rutas_foto_lancha(pendientes[solicitud_id]))
+                else:
+                    print(f"[ERROR RECHAZO] {solicitud_id}: {error}")
+                    resultados[solicitud_id] = {'estado': 'error', 'error': 'No se pudo eliminar la cuenta.'}
+
+        for i in range(0, len(archivos), ARCHIVOS_POR_LOTE):
+            try:
+                archivos_borrados += len(supabase.storage.from_('lanchas_fotos').remove(archivos[i:i + ARCHIVOS_POR_LOTE]))
+            except Exception as e:
+                # Una foto huérfana no debe cambiar el resultado del rechazo.
+                print(f"[ERROR RECHAZO ARCHIVOS] {e}")
+
+    for solicitud_id, resultado in resultados.items():
+        if resultado['estado'] in ('aprobado', 'rechazado'):
+            roles_cache.invalidate(solicitud_id)
+            perfiles.invalidar(solicitud_id)
+    pendientes_cache.invalidate(PENDIENTES_KEY)
+    return resultados, archivos_borrados
+
+def leer_accion_solicitud(item):
+    solicitud_id = item.get('solicitud_id') if isinstance(item, dict) else None
+    accion = item.get('accion') if isinstance(item, dict) else None
     if not solicitud_id or not accion:
-        return jsonify({'success': False, 'error': 'Faltan datos.'}), 400
+        raise ValueError('Faltan datos.')
+    if accion not in ('aprobar', 'rechazar'):
+        raise ValueError('Acción no válida.')
+    try:
+        return str(uuid.UUID(str(solicitud_id))), accion
+    except ValueError:
+        raise ValueError('Id de solicitud inválido.')
 
+@app.route('/admin/solicitud/procesar', methods=['POST'])
+@admin_required
+def procesar_solicitud_admin():
     try:
-        if accion == 'aprobar':
-            supabase.table('usuarios').update({'rol': 'lanchero'}).eq('id', solicitud_id).execute()
-            
-            return jsonify({'success': True})
-        elif accion == 'rechazar':
-            supabase.auth.admin.delete_user(solicitud_id)
-            
-            return jsonify({'success': True})
-        else:
-            return jsonify({'success': False, 'error': 'Acción no válida.'}), 400
+        solicitud_id, accion = leer_accion_solicitud(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        resultados, _ = procesar_solicitudes([(solicitud_id, accion)])
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+    resultado = resultados[solicitud_id]
+    if resultado['estado'] == 'no_pendiente':
+        return jsonify({'success': False, 'error': 'La solicitud ya no está pendiente.'}), 409
+    if resultado['estado'] == 'error':
+        return jsonify({'success': False, 'error': resultado['error']}), 500
+    return jsonify({'success': True})
+
+@app.route('/admin/solicitudes/procesar-lote', methods=['POST'])
+@admin_required
+def procesar_solicitudes_lote():
+    # {"solicitudes": [{"solicitud_id": "...", "accion": "aprobar" | "rechazar"}, ...]}
+    items = (request.get_json(silent=True) or {}).get('solicitudes')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'Falta la lista de solicitudes.'}), 400
+    if len(items) > SOLICITUDES_LOTE_MAX:
+        return jsonify({'success': False, 'error': f'Máximo {SOLICITUDES_LOTE_MAX} solicitudes por lote.'}), 400
+
+    acciones = {}
+    invalidos = {}
+    for item in items:
+        try:
+            solicitud_id, accion = leer_accion_solicitud(item)
+        except ValueError as e:
+            clave = str(item.get('solicitud_id')) if isinstance(item, dict) and item.get('solicitud_id') else f'#{len(invalidos)}'
+            invalidos[clave] = {'estado': 'error', 'error': str(e)}
+            continue
+        if acciones.get(solicitud_id, accion) != accion:
+            invalidos[solicitud_id] = {'estado': 'error', 'error': 'La misma solicitud no se puede aprobar y rechazar.'}
+            continue
+        acciones[solicitud_id] = accion
+    for solicitud_id in invalidos:
+        acciones.pop(solicitud_id, None)
+
+    try:
+        resultados, archivos_borrados = procesar_solicitudes(list(acciones.items()))
+    except Exception as e:
+        print(f"[ERROR LOTE SOLICITUDES] {e}")
+        return jsonify({'success': False, 'error': 'No se pudo procesar el lote.'}), 500
+
+    resultados.update(invalidos)
+    estados = [r['estado'] for r in resultados.values()]
+    return jsonify({
+        'success': True,
+        'resultados': resultados,
+        'aprobados': estados.count('aprobado'),
+        'rechazados': estados.count('rechazado'),
+        'archivos_borrados': archivos_borrados,
+        'pendientes': contar_pendientes(),
+    })
+
+@app.route('/admin/api/stats')
+@admin_required
+def admin_stats():
+    return jsonify({
+        'roles': roles_cache.stats(),
+        'login': login_cache.stats(),
+        'perfiles': perfiles.stats(),
+        'leaderboard': leaderboard.stats(),
+        'report_feed': report_feed.stats(),
+        'dashboards': dashboards.stats(),
+        'limites': limitador.stats(),
+        'mapa': mapa_reportes.stats(),
+        'rutas': {
+            'red_fluvial': red_fluvial(RED_FLUVIAL_PATH).stats(),
+            'lancheros_en_ruta': len(lancheros_en_ruta.activos()),
+        },
+        'uploads': upload_pipeline.stats(),
+    })
+
 @app.route('/logout')
 def logout():
     session.pop('user_id', None)
     return redirect('/')
 
+# Cada ruta declara su política con @politica(...); las que no lo hacen siguen siendo no-store.
+# Los estáticos llevan huella en la URL y se guardan un año.
+app.url_defaults(agregar_huella(app))
+
 @app.after_request
-def add_no_cache_headers(response):
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    return response
+def cache_headers(response):
+    return aplicar_politica(app, request, response)
+
+# El stream de reportes dura minutos a propósito; se mide pero no va al log de lentas.
+instrumentar(app, metricas, sin_log_lento={'/api/reportes/stream', '/api/user/stream'})
+
+# Con METRICS_TOKEN, /metrics pide 'Authorization: Bearer <token>'. Sin él solo responde a
+# quien la pide desde la misma máquina; para los demás la ruta no existe.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+@app.route('/metrics')
+def metrics():
+    if METRICS_TOKEN:
+        enviado = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(enviado, METRICS_TOKEN):
+            return Response('No autorizado\n', status=401, mimetype='text/plain')
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        return Response('No encontrado\n', status=404, mimetype='text/plain')
+    return Response(metricas.exposicion(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     print("CHOCÓ LIMPIO 2025 - INICIANDO EN http://127.0.0.1:5000")
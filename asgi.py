@@ -0,0 +1,240 @@
+# asgi.py
+# Modo asíncrono: uvicorn asgi:application --workers 2
+#
+# Las rutas que se consultan cada pocos segundos (dashboard, /api/user, /api/reportes,
+# el stream de reportes...) se atienden aquí con un cliente asíncrono de Supabase que
+# reutiliza conexiones. El resto de la app (formularios, subidas, admin) sigue siendo
+# la app Flask de app.py, servida a través de un adaptador WSGI.
+import asyncio
+import os
+from datetime import datetime
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, Response, jsonify, redirect, render_template, request, session
+from supabase import AsyncClientOptions, acreate_client
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+
+import app as wsgi
+from metricas import TransporteMedidoAsync, instrumentar_quart
+from http_cache import agregar_huella, aplicar_politica, con_etag, etag_de, no_modificado, politica
+
+POOL_SIZE = int(os.environ.get("ASGI_POOL_SIZE", 100))
+
+quart_app = Quart(__name__, template_folder='templates', static_folder='static')
+quart_app.secret_key = wsgi.app.secret_key
+quart_app.context_processor(wsgi.inject_now)
+
+asupabase = None
+
+
+@quart_app.before_serving
+async def conectar_supabase():
+    global asupabase
+    # Con un transporte propio (el que mide cada llamada) los límites van en el transporte.
+    transporte = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=POOL_SIZE,
+            keepalive_expiry=30,
+        ),
+    )
+    http_client = httpx.AsyncClient(
+        transport=TransporteMedidoAsync(wsgi.metricas, transporte),
+        timeout=10,
+    )
+    asupabase = await acreate_client(
+        wsgi.SUPABASE_URL,
+        wsgi.SUPABASE_KEY,
+        options=AsyncClientOptions(httpx_client=http_client),
+    )
+
+
+@quart_app.after_serving
+async def cerrar_supabase():
+    if asupabase is not None:
+        await asupabase.options.httpx_client.aclose()
+
+
+_SIN_ROL = object()
+
+
+async def obtener_rol(user_id):
+    rol = wsgi.roles_cache.get(user_id, default=_SIN_ROL)
+    if rol is _SIN_ROL:
+        response = await asupabase.table('usuarios').select('rol').eq('id', user_id).execute()
+        rol = response.data[0].get('rol') if response.data else None
+        wsgi.roles_cache.set(user_id, rol)
+    return rol
+
+
+async def obtener_perfil(user_id):
+    # Misma caché de perfiles que la app Flask; solo si no está se consulta con el cliente asíncrono.
+    perfil = wsgi.perfiles.peek(user_id)
+    if perfil is None:
+        response = await asupabase.table('usuarios').select('*').eq('id', user_id).execute()
+        if not response.data:
+            return None
+        perfil = response.data[0]
+        wsgi.perfiles.guardar(user_id, perfil)
+    return perfil
+
+
+async def top_usuarios(n=3):
+    # El leaderboard casi siempre está en memoria; solo al refrescar consulta (en un hilo).
+    return await asyncio.to_thread(wsgi.leaderboard.top, n)
+
+
+@quart_app.route('/dashboard')
+async def dashboard():
+    if 'user_id' not in session:
+        return redirect('/')
+
+    user_id = session['user_id']
+
+    try:
+        user, top_users = await asyncio.gather(obtener_perfil(user_id), top_usuarios(3))
+
+        if not user:
+            session.pop('user_id', None)
+            return redirect('/')
+        user['kg_reciclados'] = float(user.get('kg_reciclados', 0.0))
+        user['minutos'] = int(user.get('minutos', 0))
+
+        return await render_template('dashboard.html', user=user, top_users=top_users)
+
+    except Exception as e:
+        print(f"[ERROR SUPABASE DASHBOARD] {e}")
+        session.pop('user_id', None)
+        return redirect('/')
+
+
+@quart_app.route('/api/user')
+@politica('revalidar')
+async def api_user():
+    if 'user_id' not in session:
+        return jsonify({'success': False})
+
+    try:
+        user, top_users = await asyncio.gather(obtener_perfil(session['user_id']), top_usuarios(3))
+        if not user:
+            return jsonify({'success': False})
+        etag = wsgi.etag_usuario(session['user_id'], user, top_users)
+        return no_modificado(request, etag) or con_etag(jsonify(wsgi.payload_usuario(user, top_users)), etag)
+    except Exception as e:
+        print(f"[ERROR API USER] {e}")
+        return jsonify({'success': False})
+
+
+@quart_app.route('/api/user/stream')
+async def api_user_stream():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    stream = wsgi.dashboards.astream(session['user_id'], max_duration=wsgi.DASHBOARD_STREAM_MAX_SECONDS)
+    response = Response(stream, mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+    response.timeout = None
+    return response
+
+
+@quart_app.route('/api/ranking')
+async def api_ranking():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    try:
+        n = int(request.args.get('n', 10))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Parámetro n inválido.'}), 400
+
+    try:
+        return jsonify({'success': True, 'ranking': await top_usuarios(n)})
+    except Exception as e:
+        print(f"[ERROR API RANKING] {e}")
+        return jsonify({'success': False}), 500
+
+
+@quart_app.route('/api/weekly_progress')
+@politica('revalidar')
+async def weekly_progress():
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'error': 'No autorizado'}), 401
+
+    try:
+        dias = wsgi.rango_progreso(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    try:
+        hoy = datetime.now(wsgi.APP_TIMEZONE).date()
+        response = await wsgi.consulta_progreso(asupabase, session['user_id'], hoy, dias).execute()
+        progress = wsgi.totales_progreso(response.data, hoy, dias)
+        etag = etag_de(session['user_id'], progress)
+        return no_modificado(request, etag) or con_etag(jsonify({'success': True, 'progress': progress}), etag)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@quart_app.route('/api/reportes')
+@politica('revalidar')
+async def get_reportes():
+    if 'user_id' not in session:
+        return redirect('/')
+    if await obtener_rol(session['user_id']) != 'lanchero':
+        return redirect('/dashboard')
+
+    try:
+        params = wsgi.parametros_reportes(request.args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    response = await wsgi.consulta_reportes(asupabase, params).execute()
+    reportes, headers = wsgi.pagina_reportes(response, params, request.args.to_dict(), request.path)
+
+    etag = etag_de(reportes, headers)
+    no_cambio = no_modificado(request, etag)
+    if no_cambio:
+        return no_cambio
+
+    result = con_etag(jsonify(reportes), etag)
+    result.headers.update(headers)
+    return result
+
+
+@quart_app.route('/api/reportes/stream')
+async def reportes_stream():
+    if 'user_id' not in session:
+        return redirect('/')
+    if await obtener_rol(session['user_id']) != 'lanchero':
+        return redirect('/dashboard')
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    stream = wsgi.report_feed.astream(last_event_id, max_duration=wsgi.REPORT_STREAM_MAX_SECONDS)
+    response = Response(stream, mimetype='text/event-stream', headers={'X-Accel-Buffering': 'no'})
+    response.timeout = None
+    return response
+
+
+quart_app.url_defaults(agregar_huella(quart_app))
+
+
+@quart_app.after_request
+async def cache_headers(response):
+    return aplicar_politica(quart_app, request, response)
+
+
+instrumentar_quart(quart_app, wsgi.metricas, sin_log_lento={'/api/reportes/stream', '/api/user/stream'})
+
+
+flask_asgi = WsgiToAsgi(wsgi.app)
+_rutas_async = quart_app.url_map.bind('')
+
+
+async def application(scope, receive, send):
+    # Si la ruta (y el método) existe en la app asíncrona se atiende aquí; si no, va a Flask.
+    if scope['type'] in ('http', 'websocket'):
+        try:
+            _rutas_async.match(scope['path'], method=scope.get('method', 'GET'))
+        except (NotFound, MethodNotAllowed):
+            return await flask_asgi(scope, receive, send)
+    return await quart_app(scope, receive, send)
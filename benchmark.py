@@ -0,0 +1,287 @@
+# benchmark.py
+# Carga realista contra app.py con un Supabase falso en el mismo proceso (fake_supabase.py).
+# Simula dashboards que consultan /api/user cada 10 s, lancheros que consultan /api/reportes
+# cada 15 s y ráfagas de /reportar, y muestra por endpoint el throughput, los percentiles de
+# latencia y cuántas llamadas a Supabase hace cada petición.
+#
+#   python benchmark.py --duracion 60 --usuarios 300 --lancheros 20
+#   python benchmark.py --json base.json                 # guarda el resultado
+#   python benchmark.py --base base.json --tolerancia 0.2  # falla si algo empeoró
+#
+# La latencia se mide desde el momento en que la petición debía salir, no desde que un
+# hilo quedó libre, así la cola de espera también cuenta (como la vería el navegador).
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de Chocó Limpio contra un Supabase falso.')
+    parser.add_argument('--duracion', type=float, default=60, help='segundos de tráfico')
+    parser.add_argument('--hilos', type=int, default=32, help='peticiones simultáneas como máximo')
+    parser.add_argument('--usuarios', type=int, default=300, help='dashboards abiertos')
+    parser.add_argument('--intervalo-usuario', type=float, default=10, help='segundos entre consultas de /api/user')
+    parser.add_argument('--lancheros', type=int, default=20, help='páginas de lanchero abiertas')
+    parser.add_argument('--intervalo-lanchero', type=float, default=15, help='segundos entre consultas de /api/reportes')
+    parser.add_argument('--rafaga', type=int, default=30, help='reportes por ráfaga de /reportar')
+    parser.add_argument('--rafaga-cada', type=float, default=20, help='segundos entre ráfagas')
+    parser.add_argument('--latencia', type=float, default=0.02, help='latencia base de cada llamada a Supabase (s)')
+    parser.add_argument('--jitter', type=float, default=0.01, help='latencia extra aleatoria, de 0 a este valor (s)')
+    parser.add_argument('--latencia-storage', type=float, default=0.08, help='latencia base de Storage (s)')
+    parser.add_argument('--sembrar-usuarios', type=int, default=5000)
+    parser.add_argument('--sembrar-reportes', type=int, default=5000)
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--json', dest='salida', help='guarda el resultado en este archivo')
+    parser.add_argument('--base', help='resultado anterior para comparar')
+    parser.add_argument('--tolerancia', type=float, default=0.25, help='cuánto puede empeorar el p90 (0.25 = 25%%)')
+    return parser.parse_args(argv)
+
+
+def preparar_app(args):
+    # app.py lee la configuración al importarse; apuntamos todo a un entorno desechable.
+    os.environ['SUPABASE_URL'] = 'http://supabase.fake'
+    os.environ['SUPABASE_KEY'] = 'fake-service-key'
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    os.environ['UPLOAD_SPOOL_DIR'] = tempfile.mkdtemp(prefix='chocolimpio_bench_')
+    os.environ.pop('REDIS_URL', None)
+    # Todo el tráfico simulado sale de la misma IP; los límites por IP lo frenarían.
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    # La app corre en un solo proceso, así que el caché de perfiles es seguro sin Redis.
+    os.environ.setdefault('PROFILE_CACHE_TTL', '60')
+
+    import app as wsgi
+    from fake_supabase import FakeSupabase, instalar
+
+    fake = FakeSupabase(
+        latencia=args.latencia,
+        jitter=args.jitter,
+        por_servicio={'storage': (args.latencia_storage, args.jitter * 4)},
+        semilla=args.semilla,
+    )
+    ids = fake.sembrar(usuarios=args.sembrar_usuarios, lancheros=max(args.lancheros, 1),
+                       reportes=args.sembrar_reportes, semilla=args.semilla)
+    instalar(wsgi, fake)
+    return wsgi, fake, ids
+
+
+def foto_de_prueba():
+    # Una foto del tamaño de las de un teléfono (con ruido, para que el JPEG no sea trivial).
+    from PIL import Image
+    imagen = Image.effect_noise((1600, 1200), 40).convert('RGB')
+    buffer = io.BytesIO()
+    imagen.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class Cliente:
+    # Un navegador: su cookie de sesión y los ETag que ya tiene guardados.
+
+    def __init__(self, wsgi, user_id):
+        self.http = wsgi.app.test_client()
+        firmador = wsgi.app.session_interface.get_signing_serializer(wsgi.app)
+        self.http.set_cookie(wsgi.app.config['SESSION_COOKIE_NAME'], firmador.dumps({'user_id': user_id}))
+        self.etags = {}
+        self.lock = threading.Lock()
+
+    def get(self, ruta):
+        headers = {'If-None-Match': self.etags[ruta]} if ruta in self.etags else {}
+        response = self.http.get(ruta, headers=headers)
+        if response.headers.get('ETag'):
+            self.etags[ruta] = response.headers['ETag']
+        return response
+
+
+def planificar(args, ids, rng):
+    # [(segundo, escenario, índice del cliente)] ordenado por tiempo. Cada página abierta
+    # arranca en un momento al azar y después consulta a intervalo fijo (como setInterval).
+    plan = []
+    for escenario, clientes, intervalo in (('GET /api/user', args.usuarios, args.intervalo_usuario),
+                                           ('GET /api/reportes', args.lancheros, args.intervalo_lanchero)):
+        for i in range(clientes):
+            t = rng.uniform(0, intervalo)
+            while t < args.duracion:
+                plan.append((t, escenario, i))
+                t += intervalo
+    if args.rafaga:
+        t = args.rafaga_cada / 2
+        while t < args.duracion:
+            plan.extend((t + rng.uniform(0, 0.5), 'POST /reportar', rng.randrange(len(ids['usuarios'])))
+                        for _ in range(args.rafaga))
+            t += args.rafaga_cada
+    plan.sort()
+    return plan
+
+
+def ejecutar(args):
+    wsgi, fake, ids = preparar_app(args)
+    rng = random.Random(args.semilla)
+    foto = foto_de_prueba() if args.rafaga else None
+
+    dashboards = [Cliente(wsgi, ids['usuarios'][i % len(ids['usuarios'])]) for i in range(args.usuarios)]
+    lancheros = [Cliente(wsgi, ids['lancheros'][i % len(ids['lancheros'])]) for i in range(args.lancheros)]
+    plan = planificar(args, ids, rng)
+
+    resultados = defaultdict(list)
+    desglose = defaultdict(Counter)
+    lock = threading.Lock()
+
+    def atender(programado, escenario, i):
+        with fake.registrar() as llamadas:
+            try:
+                if escenario == 'GET /api/user':
+                    cliente = dashboards[i]
+                    with cliente.lock:
+                        status = cliente.get('/api/user').status_code
+                elif escenario == 'GET /api/reportes':
+                    cliente = lancheros[i]
+                    with cliente.lock:
+                        status = cliente.get('/api/reportes').status_code
+                else:
+                    status = Cliente(wsgi, ids['usuarios'][i]).http.post('/reportar', data={
+                        'kg': f'{rng.uniform(0.5, 12):.1f}',
+                        'ubicacion': 'Orilla del Atrato',
+                        'lat': '5.69', 'lng': '-76.66',
+                        'foto': (io.BytesIO(foto), 'foto.jpg', 'image/jpeg'),
+                    }, content_type='multipart/form-data').status_code
+            except Exception as e:
+                print(f"[ERROR BENCHMARK] {escenario}: {e}")
+                status = 599
+        latencia = time.perf_counter() - inicio - programado
+        with lock:
+            resultados[escenario].append((latencia, status, len(llamadas)))
+            desglose[escenario].update(llamadas)
+
+    # El feed de reportes hace su primera lectura antes de empezar a medir.
+    wsgi.report_feed.esperar_listo(timeout=30)
+    llamadas_previas = sum(fake.llamadas.values())
+
+    print(f"Benchmark: {len(plan)} peticiones en {args.duracion:.0f}s con {args.hilos} hilos "
+          f"(Supabase falso: {args.latencia * 1000:.0f}±{args.jitter * 1000:.0f} ms por llamada)")
+    with ThreadPoolExecutor(max_workers=args.hilos) as pool:
+        inicio = time.perf_counter()
+        for programado, escenario, i in plan:
+            espera = programado - (time.perf_counter() - inicio)
+            if espera > 0:
+                time.sleep(espera)
+            pool.submit(atender, programado, escenario, i)
+    total = time.perf_counter() - inicio
+
+    # Las fotos se suben en segundo plano; esperamos a que terminen para contar sus llamadas.
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        subidas = wsgi.upload_pipeline.stats()
+        if not subidas['queue_depth'] and not subidas['in_flight']:
+            break
+        time.sleep(0.2)
+
+    atribuidas = sum(sum(c.values()) for c in desglose.values())
+    fondo = sum(fake.llamadas.values()) - llamadas_previas - atribuidas
+    return resumir(resultados, desglose, total, fondo, wsgi.upload_pipeline.stats())
+
+
+def percentil(ordenados, p):
+    if not ordenados:
+        return None
+    return ordenados[min(int(p * len(ordenados)), len(ordenados) - 1)]
+
+
+def resumir(resultados, desglose, total, fondo, subidas):
+    escenarios = {}
+    for escenario, filas in sorted(resultados.items()):
+        latencias = sorted(l for l, _, _ in filas)
+        status = Counter(s for _, s, _ in filas)
+        escenarios[escenario] = {
+            'peticiones': len(filas),
+            'ok': sum(n for s, n in status.items() if 200 <= s < 300),
+            'no_modificado': status.get(304, 0),
+            '4xx': sum(n for s, n in status.items() if 400 <= s < 500),
+            '5xx': sum(n for s, n in status.items() if s >= 500),
+            'por_segundo': round(len(filas) / total, 2),
+            'p50_ms': round(percentil(latencias, 0.50) * 1000, 1),
+            'p90_ms': round(percentil(latencias, 0.90) * 1000, 1),
+            'p99_ms': round(percentil(latencias, 0.99) * 1000, 1),
+            'max_ms': round(latencias[-1] * 1000, 1),
+            'llamadas_por_peticion': round(sum(n for _, _, n in filas) / len(filas), 3),
+            'llamadas': dict(desglose[escenario].most_common()),
+        }
+    return {
+        'duracion_s': round(total, 1),
+        'escenarios': escenarios,
+        'llamadas_de_fondo': fondo,
+        'subidas': {k: subidas[k] for k in ('completed', 'failed', 'latency_p50', 'latency_p95')},
+    }
+
+
+def imprimir(resultado):
+    print()
+    print(f"{'Endpoint':<20}{'pet':>7}{'ok':>7}{'304':>6}{'4xx':>6}{'5xx':>6}{'pet/s':>8}"
+          f"{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}{'llam/pet':>10}")
+    for escenario, r in resultado['escenarios'].items():
+        print(f"{escenario:<20}{r['peticiones']:>7}{r['ok']:>7}{r['no_modificado']:>6}{r['4xx']:>6}{r['5xx']:>6}"
+              f"{r['por_segundo']:>8}{r['p50_ms']:>8}{r['p90_ms']:>8}{r['p99_ms']:>8}{r['max_ms']:>8}"
+              f"{r['llamadas_por_peticion']:>10}")
+    print("(latencias en ms)")
+    print()
+    for escenario, r in resultado['escenarios'].items():
+        llamadas = ', '.join(f'{k} x{n}' for k, n in r['llamadas'].items()) or 'ninguna'
+        print(f"{escenario}: {llamadas}")
+    print(f"Llamadas en segundo plano (feed, leaderboard, subidas): {resultado['llamadas_de_fondo']}")
+    subidas = resultado['subidas']
+    print(f"Subidas: {subidas['completed']} completas, {subidas['failed']} fallidas, "
+          f"p50 {subidas['latency_p50']}s, p95 {subidas['latency_p95']}s")
+
+
+def comparar(resultado, base, tolerancia):
+    # Empeoró si el p90 subió más que la tolerancia (y más de 5 ms, para no saltar por ruido)
+    # o si un endpoint hace más llamadas a Supabase por petición que antes.
+    regresiones = []
+    for escenario, r in resultado['escenarios'].items():
+        anterior = base['escenarios'].get(escenario)
+        if not anterior:
+            continue
+        if r['p90_ms'] > anterior['p90_ms'] * (1 + tolerancia) and r['p90_ms'] - anterior['p90_ms'] > 5:
+            regresiones.append(f"{escenario}: p90 {anterior['p90_ms']} -> {r['p90_ms']} ms")
+        if r['llamadas_por_peticion'] > anterior['llamadas_por_peticion'] + 0.05:
+            regresiones.append(f"{escenario}: llamadas/petición "
+                               f"{anterior['llamadas_por_peticion']} -> {r['llamadas_por_peticion']}")
+        if r['5xx'] > anterior['5xx']:
+            regresiones.append(f"{escenario}: 5xx {anterior['5xx']} -> {r['5xx']}")
+    return regresiones
+
+
+def main(argv=None):
+    args = parsear_argumentos(argv)
+    base = None
+    if args.base:
+        with open(args.base, encoding='utf-8') as f:
+            base = json.load(f)
+
+    resultado = ejecutar(args)
+    imprimir(resultado)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"\nResultado guardado en {args.salida}")
+
+    if base is not None:
+        regresiones = comparar(resultado, base, args.tolerancia)
+        if regresiones:
+            print("\nREGRESIONES frente a", args.base)
+            for linea in regresiones:
+                print(f"  {linea}")
+            return 1
+        print(f"\nSin regresiones frente a {args.base}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+# cache.py
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    # Cache en memoria con expiración por entrada y desalojo LRU cuando se llena.
+    # Es seguro entre hilos porque gunicorn puede correr con --threads.
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires_at = item
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            # TTL 0 apaga el caché: no se guarda nada y cada lectura va a la fuente.
+            self.invalidate(key)
+            return
+        expires_at = time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, loader, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+TOKEN_BUCKET_LUA = """
+local capacidad = tonumber(ARGV[1])
+local por_segundo = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacidad
+local ts = tonumber(bucket[2]) or ahora
+tokens = math.min(capacidad, tokens + math.max(0, ahora - ts) * por_segundo)
+local espera = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    espera = (1 - tokens) / por_segundo
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', ahora)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacidad / por_segundo) + 1)
+return tostring(espera)
+"""
+
+
+class RedisBackend:
+    # Almacén compartido entre workers de gunicorn. Los valores se guardan como JSON.
+
+    def __init__(self, url):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._token_bucket = None
+
+    def get(self, key):
+        raw = self._redis.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def add(self, key, value, ttl):
+        # Solo escribe si la llave no existe; sirve como candado entre procesos.
+        return bool(self._redis.set(key, json.dumps(value), ex=max(1, int(ttl)), nx=True))
+
+    def delete(self, key):
+        self._redis.delete(key)
+
+    def incr(self, key):
+        return self._redis.incr(key)
+
+    def tomar_token(self, key, capacidad, por_segundo):
+        # Token bucket atómico en Redis (con su reloj, igual para todos los workers).
+        # Devuelve los segundos que faltan para el próximo token, 0 si se admitió.
+        if self._token_bucket is None:
+            self._token_bucket = self._redis.register_script(TOKEN_BUCKET_LUA)
+        return float(self._token_bucket(keys=[key], args=[capacidad, por_segundo]))
+
+
+def shared_backend_from_env():
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        return None
+    try:
+        return RedisBackend(url)
+    except ImportError:
+        print("[AVISO CACHE] REDIS_URL está configurado pero el paquete 'redis' no está instalado; se usará solo memoria local.")
+        return None
+
+
+class ProfileCache:
+    # Perfiles de usuario por id, con TTL y desalojo LRU. Las escrituras de la app
+    # actualizan la entrada en el sitio (write-through). Con un backend compartido cada
+    # perfil lleva un número de versión en Redis: si otro worker escribió, la copia local
+    # queda vieja, se cuenta como lectura obsoleta evitada y se vuelve a leer.
+
+    def __init__(self, cargar, maxsize=5000, ttl=60, backend=None, prefix='chocolimpio:perfil:'):
+        self._cargar = cargar
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._backend = backend
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self.stale_reads = 0
+        self.loads = 0
+
+    def get(self, user_id):
+        perfil = self.peek(user_id)
+        if perfil is not None:
+            return perfil
+        # La versión se lee antes de cargar: si alguien escribe mientras tanto, lo que
+        # guardamos queda marcado como viejo y no se sirve.
+        version = self._version(user_id)
+        perfil = self._cargar(user_id)
+        with self._lock:
+            self.loads += 1
+        if perfil is not None:
+            self.guardar(user_id, perfil, version)
+        return perfil
+
+    def peek(self, user_id):
+        entrada = self._local.get(user_id)
+        if entrada is not None and self._backend is not None:
+            if self._version(user_id) != entrada['version']:
+                with self._lock:
+                    self.stale_reads += 1
+                self._local.invalidate(user_id)
+                entrada = None
+        if entrada is None and self._backend is not None:
+            entrada = self._leer_compartido(user_id)
+            if entrada is not None:
+                self._local.set(user_id, entrada)
+        return dict(entrada['perfil']) if entrada else None
+
+    def guardar(self, user_id, perfil, version=None):
+        if version is None:
+            version = self._version(user_id)
+        entrada = {'version': version, 'perfil': dict(perfil)}
+        self._local.set(user_id, entrada)
+        self._escribir_compartido(user_id, entrada)
+
+    def actualizar(self, user_id, cambios):
+        # Aplica una escritura que acabamos de hacer en Supabase sobre la copia en caché.
+        entrada = self._local.get(user_id)
+        version = self._nueva_version(user_id)
+        if entrada is None:
+            entrada = self._leer_compartido(user_id) if self._backend is not None else None
+        if entrada is None:
+            return
+        entrada = {'version': version, 'perfil': {**entrada['perfil'], **cambios}}
+        self._local.set(user_id, entrada)
+        self._escribir_compartido(user_id, entrada)
+
+    def invalidar(self, user_id):
+        self._local.invalidate(user_id)
+        if self._backend is not None:
+            self._nueva_version(user_id)
+            try:
+                self._backend.delete(self._prefix + str(user_id))
+            except Exception as e:
+                print(f"[ERROR PROFILE CACHE] {e}")
+
+    def stats(self):
+        stats = self._local.stats()
+        lecturas = stats['hits'] + stats['misses']
+        stats.update({
+            'stale_reads': self.stale_reads,
+            'stale_rate': round(self.stale_reads / lecturas, 4) if lecturas else 0.0,
+            'loads': self.loads,
+            'shared': self._backend is not None,
+        })
+        return stats
+
+    def _version(self, user_id):
+        if self._backend is None:
+            return 0
+        try:
+            return self._backend.get(self._prefix + str(user_id) + ':v') or 0
+        except Exception as e:
+            print(f"[ERROR PROFILE CACHE] {e}")
+            return 0
+
+    def _nueva_version(self, user_id):
+        if self._backend is None:
+            return 0
+        try:
+            return self._backend.incr(self._prefix + str(user_id) + ':v')
+        except Exception as e:
+            print(f"[ERROR PROFILE CACHE] {e}")
+            return 0
+
+    def _leer_compartido(self, user_id):
+        try:
+            entrada = self._backend.get(self._prefix + str(user_id))
+        except Exception as e:
+            print(f"[ERROR PROFILE CACHE] {e}")
+            return None
+        if entrada is not None and entrada.get('version') != self._version(user_id):
+            return None
+        return entrada
+
+    def _escribir_compartido(self, user_id, entrada):
+        if self._backend is None:
+            return
+        try:
+            self._backend.set(self._prefix + str(user_id), entrada, ttl=self._local.ttl)
+        except Exception as e:
+            print(f"[ERROR PROFILE CACHE] {e}")
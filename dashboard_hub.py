@@ -0,0 +1,229 @@
+# dashboard_hub.py
+# Los dashboards abiertos reciben sus datos de un hilo por worker que consulta a Supabase
+# cada `interval` segundos (DASHBOARD_HUB_INTERVAL, 10 por defecto), no de una suscripción
+# a cambios. El cliente síncrono de supabase-py no trae Realtime (SyncRealtimeClient.channel
+# lanza NotImplementedError) y el asíncrono pediría un event loop y un websocket propios en
+# cada worker de gunicorn. Con el sondeo, cada worker hace una consulta por intervalo para
+# todos sus usuarios conectados, sin importar cuántas pestañas haya, y ninguna si no hay
+# nadie. Las escrituras del propio worker (recogidas, cambios de nombre) no esperan al
+# sondeo: se publican al momento con publicar().
+import asyncio
+import json
+import threading
+import time
+
+PERFIL_COLUMNAS = 'id, nombre, kg_reciclados, minutos'
+
+
+def datos_usuario(perfil):
+    # Lo que muestra el dashboard de un usuario; /api/user devuelve lo mismo más el ranking.
+    kg = float(perfil['kg_reciclados'])
+    return {
+        'nombre': perfil['nombre'],
+        'kg_reciclados': kg,
+        'minutos': int(perfil['minutos']),
+        'arboles': int(kg),
+        'co2_evitado': round(kg * 2.5, 1),
+    }
+
+
+class SupabaseDashboardSource:
+    # Fuente real: los perfiles de todos los usuarios conectados en una consulta por
+    # tanda de ids, en vez de un /api/user por pestaña.
+
+    def __init__(self, client, tanda=200):
+        self._client = client
+        self._tanda = tanda
+
+    def perfiles(self, ids):
+        ids = list(ids)
+        filas = []
+        for i in range(0, len(ids), self._tanda):
+            response = self._client.table('usuarios') \
+                .select(PERFIL_COLUMNAS) \
+                .in_('id', ids[i:i + self._tanda]) \
+                .execute()
+            filas.extend(response.data)
+        return filas
+
+
+class DashboardHub:
+    # Un único hilo por worker trae cada `interval` segundos los perfiles de los usuarios
+    # con el dashboard abierto y el top del ranking, arma los datos de cada uno una sola
+    # vez y despierta solo a las conexiones cuyo contenido cambió. Mientras no hay nadie
+    # conectado no consulta nada.
+
+    def __init__(self, source, ranking, interval=10, heartbeat=15, top=3):
+        self._source = source
+        self._ranking_de = ranking
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.top = top
+        self._usuarios = {}
+        self._ranking = None
+        self._ranking_seq = 0
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._hilo = None
+        self._despertar = threading.Event()
+        self.clientes = 0
+        self.sincronizaciones = 0
+        self.eventos = 0
+
+    def start(self):
+        with self._cond:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._loop, name='dashboard-hub', daemon=True)
+            self._hilo.start()
+
+    def sincronizar(self):
+        with self._cond:
+            ids = list(self._usuarios)
+        if not ids:
+            return
+        filas = self._source.perfiles(ids)
+        top = self._ranking_de(self.top)
+        with self._cond:
+            for fila in filas:
+                entrada = self._usuarios.get(fila['id'])
+                if entrada is not None:
+                    self._actualizar(entrada, fila)
+            self._actualizar_ranking(top)
+            self.sincronizaciones += 1
+
+    def publicar(self, user_id, cambios):
+        # Aplica una escritura que acabamos de hacer (recogida, cambio de nombre) sin esperar
+        # a la próxima consulta. Si el usuario no está conectado a este worker no hace nada.
+        with self._cond:
+            entrada = self._usuarios.get(user_id)
+            if entrada is None:
+                return
+            if entrada['perfil'] is None:
+                self._despertar.set()
+                return
+            self._actualizar(entrada, {**entrada['perfil'], **cambios})
+
+    def despertar(self):
+        # Adelanta la próxima consulta, p. ej. cuando el ranking acaba de cambiar.
+        self._despertar.set()
+
+    def stream(self, user_id, max_duration=None):
+        inicio = time.monotonic()
+        self._conectar(user_id)
+        try:
+            yield f"retry: {int(self.interval * 1000)}\n\n"
+            vistos = (0, 0)
+            while max_duration is None or time.monotonic() - inicio < max_duration:
+                with self._cond:
+                    vistos, pendientes = self._pendientes(user_id, vistos)
+                    if not pendientes:
+                        restante = None if max_duration is None else max_duration - (time.monotonic() - inicio)
+                        self._cond.wait(timeout=self.heartbeat if restante is None else max(0, min(self.heartbeat, restante)))
+                        vistos, pendientes = self._pendientes(user_id, vistos)
+                if not pendientes:
+                    yield ": heartbeat\n\n"
+                    continue
+                for evento in pendientes:
+                    yield self._formatear(*evento)
+        finally:
+            self._desconectar(user_id)
+
+    async def astream(self, user_id, max_duration=None, poll=0.5):
+        # Versión para el modo ASGI: revisa cada `poll` segundos si hay algo nuevo para
+        # este usuario, que es solo una lectura en memoria.
+        inicio = time.monotonic()
+        self._conectar(user_id)
+        try:
+            yield f"retry: {int(self.interval * 1000)}\n\n"
+            vistos = (0, 0)
+            ultimo_envio = time.monotonic()
+            while max_duration is None or time.monotonic() - inicio < max_duration:
+                with self._cond:
+                    vistos, pendientes = self._pendientes(user_id, vistos)
+                if pendientes:
+                    for evento in pendientes:
+                        yield self._formatear(*evento)
+                    ultimo_envio = time.monotonic()
+                elif time.monotonic() - ultimo_envio >= self.heartbeat:
+                    ultimo_envio = time.monotonic()
+                    yield ": heartbeat\n\n"
+                await asyncio.sleep(poll)
+        finally:
+            self._desconectar(user_id)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'usuarios': len(self._usuarios),
+                'clientes': self.clientes,
+                'seq': self._seq,
+                'sincronizaciones': self.sincronizaciones,
+                'eventos': self.eventos,
+            }
+
+    def _loop(self):
+        while True:
+            try:
+                self.sincronizar()
+            except Exception as e:
+                print(f"[ERROR DASHBOARD HUB] {e}")
+            self._despertar.wait(timeout=self.interval)
+            self._despertar.clear()
+
+    def _conectar(self, user_id):
+        self.start()
+        with self._cond:
+            entrada = self._usuarios.setdefault(user_id, {'perfil': None, 'datos': None, 'seq': 0, 'conexiones': 0})
+            entrada['conexiones'] += 1
+            self.clientes += 1
+            sin_datos = entrada['datos'] is None or self._ranking is None
+        if sin_datos:
+            # Primera conexión de este usuario en el worker: se consulta en la próxima
+            # vuelta del hilo, junto con los demás que lleguen mientras tanto.
+            self._despertar.set()
+
+    def _desconectar(self, user_id):
+        with self._cond:
+            self.clientes -= 1
+            entrada = self._usuarios.get(user_id)
+            if entrada is None:
+                return
+            entrada['conexiones'] -= 1
+            if entrada['conexiones'] <= 0:
+                del self._usuarios[user_id]
+
+    def _actualizar(self, entrada, perfil):
+        datos = datos_usuario(perfil)
+        entrada['perfil'] = perfil
+        if datos == entrada['datos']:
+            return
+        entrada['datos'] = datos
+        self._seq += 1
+        entrada['seq'] = self._seq
+        self.eventos += 1
+        self._cond.notify_all()
+
+    def _actualizar_ranking(self, top):
+        if top == self._ranking:
+            return
+        self._ranking = top
+        self._seq += 1
+        self._ranking_seq = self._seq
+        self.eventos += 1
+        self._cond.notify_all()
+
+    def _pendientes(self, user_id, vistos):
+        visto_usuario, visto_ranking = vistos
+        pendientes = []
+        entrada = self._usuarios.get(user_id)
+        if entrada is not None and entrada['datos'] is not None and entrada['seq'] > visto_usuario:
+            pendientes.append(('usuario', entrada['datos']))
+            visto_usuario = entrada['seq']
+        if self._ranking is not None and self._ranking_seq > visto_ranking:
+            pendientes.append(('ranking', self._ranking))
+            visto_ranking = self._ranking_seq
+        return (visto_usuario, visto_ranking), pendientes
+
+    def _formatear(self, tipo, data):
+        return f"event: {tipo}\ndata: {json.dumps(data, default=str)}\n\n"
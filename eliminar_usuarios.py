@@ -4,10 +4,21 @@
 from datetime import datetime
 # Importo 'os' para poder interactuar con el sistema operativo, en este caso, para leer variables de entorno.
 import os
+# Importo 'threading' y 'time' para repartir los borrados en el tiempo entre varios hilos.
+import threading
+import time
+# Importo 'SimpleNamespace' para tratar las filas de cuentas como los usuarios que devuelve list_users.
+from types import SimpleNamespace
+# Importo el grupo de hilos para borrar varios usuarios al mismo tiempo.
+from concurrent.futures import ThreadPoolExecutor, as_completed
 # Importo 'load_dotenv' de la librería 'dotenv' para cargar las variables que guardé en el archivo .env.
 from dotenv import load_dotenv
 # Importo 'create_client' y 'Client' de la librería 'supabase' para poder conectarme y hablar con mi base de datos de Supabase.
 from supabase import create_client, Client
+# Importo la función que revisa de una sola vez si el nombre, teléfono o email ya están en uso.
+from unicidad import campos_en_uso
+# Importo la función que, dada una foto, me da también las rutas de sus miniaturas.
+from uploads import rutas_con_variantes
 
 # Con esta línea, cargo las variables de mi archivo .env para que el script pueda usarlas.
 load_dotenv()
@@ -71,31 +82,23 @@ def crear_usuario(supabase: Client):
 
     # Intento ejecutar el siguiente bloque de código, pero estoy atento a posibles errores.
     try:
-        # Reviso en mi tabla 'usuarios' si ya existe alguien con ese nombre de usuario.
-        nombre_existente = supabase.table('usuarios').select('nombre', count='exact').ilike('nombre', nombre).execute()
-        # Si la consulta devuelve algún resultado, significa que el nombre ya está en uso.
-        if nombre_existente.data:
+        # Reviso en una sola consulta si el nombre, el teléfono o el email ya los usa otro perfil.
+        # Uso la misma función que el registro web, así los dos lados aplican las mismas reglas.
+        en_uso = campos_en_uso(supabase, nombre=nombre, telefono=telefono, email=email)
+        # Si el nombre ya está en uso (sin importar mayúsculas)...
+        if 'nombre' in en_uso:
             # Muestro un mensaje de error diciendo que el nombre ya existe.
             print(f"\nError: El nombre de usuario '{nombre}' ya está en uso. Por favor, elige otro.")
-            # Salgo de la función para no continuar.
-            return
-        
-        # Ahora reviso en la tabla 'usuarios' si el número de teléfono ya está registrado.
-        telefono_existente = supabase.table('usuarios').select('telefono', count='exact').eq('telefono', telefono).execute()
-        # Si la consulta encuentra ese teléfono...
-        if telefono_existente.data:
+        # Si ese teléfono ya está registrado...
+        if 'telefono' in en_uso:
             # ...le aviso al usuario que ese teléfono ya está en uso.
             print(f"\nError: El número de teléfono '{telefono}' ya está registrado.")
-            # Y salgo de la función.
-            return
-
-        # Hago lo mismo para el email, verifico si ya existe en la tabla 'usuarios'.
-        email_existente = supabase.table('usuarios').select('email', count='exact').eq('email', email).execute()
         # Si el email ya está en la tabla...
-        if email_existente.data:
+        if 'email' in en_uso:
             # ...muestro un mensaje explicando que el email ya está asociado a un perfil.
             print(f"\nError: El email '{email}' ya está asociado a un perfil. Puede que el usuario exista pero no esté en el sistema de autenticación.")
-            # Y salgo de la función.
+        # Si encontré cualquier choque, salgo de la función para no continuar.
+        if en_uso:
             return
 
         # Si todas las validaciones pasaron, muestro un mensaje de que estoy creando el usuario.
@@ -134,22 +137,142 @@ def crear_usuario(supabase: Client):
         # ...lo capturo y muestro un mensaje de error con los detalles del problema.
         print(f"\nError al crear el usuario: {e}")
 
+# Cuántos usuarios le pido a Supabase en cada página de list_users (el máximo que acepta es 1000).
+USUARIOS_POR_PAGINA = 1000
+# Cuántos borrados hago al mismo tiempo. Más hilos no siempre es más rápido: Supabase limita las peticiones.
+HILOS_BORRADO = int(os.environ.get("HILOS_BORRADO", 8))
+# Cuántos borrados por segundo me permito como máximo, sumando todos los hilos.
+BORRADOS_POR_SEGUNDO = float(os.environ.get("BORRADOS_POR_SEGUNDO", 20))
+# Cuántas veces reintento un borrado que falló (por ejemplo, por un error 429 o un corte de red).
+REINTENTOS_BORRADO = 4
+# Cuántos archivos borro de Storage en cada llamada a remove().
+ARCHIVOS_POR_LOTE = 100
+# Cada cuántos usuarios muestro el progreso.
+PROGRESO_CADA = 50
+
+# Defino una función que recorre todas las páginas de usuarios de autenticación, no solo la primera.
+def listar_usuarios_auth(supabase: Client, por_pagina=USUARIOS_POR_PAGINA):
+    # Empiezo por la página 1, que es la primera para Supabase.
+    pagina = 1
+    # Sigo pidiendo páginas mientras lleguen llenas.
+    while True:
+        # Pido una página de usuarios.
+        usuarios = supabase.auth.admin.list_users(page=pagina, per_page=por_pagina)
+        # Devuelvo los usuarios uno por uno, sin guardar todas las páginas juntas.
+        yield from usuarios
+        # Si la página vino incompleta, ya no hay más usuarios.
+        if len(usuarios) < por_pagina:
+            return
+        # Si no, paso a la siguiente página.
+        pagina += 1
+
+# Una clase pequeña que reparte los turnos para no pasar de cierto número de peticiones por segundo.
+class LimitadorDeRitmo:
+    def __init__(self, por_segundo):
+        # El tiempo mínimo que tiene que pasar entre una petición y la siguiente.
+        self.intervalo = 1.0 / por_segundo if por_segundo > 0 else 0
+        # El momento en que le toca a la próxima petición.
+        self.proximo = time.monotonic()
+        # Un candado para que los hilos no se pisen al repartir los turnos.
+        self.lock = threading.Lock()
+
+    def esperar(self):
+        # Reservo mi turno y calculo cuánto me falta para que llegue.
+        with self.lock:
+            ahora = time.monotonic()
+            turno = max(self.proximo, ahora)
+            self.proximo = turno + self.intervalo
+        # Espero fuera del candado, así los demás hilos pueden reservar su turno mientras tanto.
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+# Borro un usuario de autenticación, reintentando con esperas cada vez más largas si falla.
+def borrar_usuario_con_reintentos(supabase: Client, user, limitador: LimitadorDeRitmo):
+    for intento in range(REINTENTOS_BORRADO + 1):
+        # Espero mi turno antes de cada intento, también en los reintentos.
+        limitador.esperar()
+        try:
+            # Le pido a Supabase que elimine al usuario usando su ID.
+            supabase.auth.admin.delete_user(user.id)
+            # Si se borró bien, devuelvo el usuario sin error.
+            return user, None
+        except Exception as e:
+            # Si ya no me quedan intentos, devuelvo el error para contarlo.
+            if intento == REINTENTOS_BORRADO:
+                return user, e
+            # Si no, espero 0.5s, 1s, 2s, 4s... antes de volver a intentarlo.
+            time.sleep(0.5 * (2 ** intento))
+
+# Las fotos de las lanchas se llaman 'solicitud_<teléfono>_<fecha>.jpg', así que no se pueden
+# encontrar por el ID: leo sus rutas de la tabla 'usuarios' antes de borrar las cuentas.
+def fotos_lancha_de_usuarios(supabase: Client, ids):
+    # Guardo la ruta de la foto de cada usuario que tenga una.
+    fotos = {}
+    # Pido los usuarios por tandas para que la URL no sea demasiado larga.
+    for i in range(0, len(ids), IDS_POR_BORRADO):
+        filas = supabase.table('usuarios').select('id, foto_lancha_url').in_('id', ids[i:i + IDS_POR_BORRADO]).execute().data
+        for fila in filas:
+            url = fila.get('foto_lancha_url')
+            # Me quedo con la parte de la URL que va después del nombre del bucket.
+            if url and '/lanchas_fotos/' in url:
+                fotos[fila['id']] = url.split('/lanchas_fotos/')[-1].split('?')[0]
+    return fotos
+
+# Armo la lista de archivos de Storage que pertenecen a los usuarios borrados.
+def archivos_de_usuarios(supabase: Client, ids, fotos_lancha=None):
+    # Uso un conjunto para buscar los IDs rápido.
+    ids = set(ids)
+    # Los avatares se llaman 'public/<id>.<ext>' (antes no siempre eran .jpg) y su miniatura
+    # 'public/<id>_128.jpg', así que los busco en la carpeta igual que las fotos de reportes.
+    avatares = archivos_de_ids(supabase, 'avatars', ids)
+    # Las fotos de las lanchas (que leí antes de borrar) con su miniatura de 320px.
+    lanchas = [ruta for user_id, foto in (fotos_lancha or {}).items() if user_id in ids
+               for ruta in rutas_con_variantes(foto, (320,))]
+    # Las fotos de reportes se llaman 'public/<id>_<fecha>.jpg' (y '_320' para la miniatura).
+    fotos_reportes = archivos_de_ids(supabase, 'reportes_fotos', ids)
+    return {'avatars': avatares, 'reportes_fotos': fotos_reportes, 'lanchas_fotos': lanchas}
+
+# Recorro la carpeta 'public' de un bucket por páginas y me quedo con los archivos cuyo
+# nombre empieza por uno de los IDs (seguido de '_' o de la extensión).
+def archivos_de_ids(supabase: Client, bucket, ids):
+    encontrados = []
+    offset = 0
+    while True:
+        # Pido una página de archivos de la carpeta 'public'.
+        archivos = supabase.storage.from_(bucket).list('public', {'limit': 1000, 'offset': offset})
+        for archivo in archivos:
+            # El ID del usuario es la parte antes del primer '_' o '.'.
+            if archivo['name'].split('_', 1)[0].split('.', 1)[0] in ids:
+                encontrados.append(f"public/{archivo['name']}")
+        # Si la página vino incompleta, ya revisé toda la carpeta.
+        if len(archivos) < 1000:
+            break
+        offset += 1000
+    return encontrados
+
+# Borro archivos de un bucket en lotes, con una sola llamada a remove() por lote.
+def borrar_archivos(supabase: Client, bucket, paths):
+    borrados = 0
+    for i in range(0, len(paths), ARCHIVOS_POR_LOTE):
+        lote = paths[i:i + ARCHIVOS_POR_LOTE]
+        try:
+            # remove() devuelve solo los archivos que sí existían y se borraron.
+            borrados += len(supabase.storage.from_(bucket).remove(lote))
+        except Exception as e:
+            # Si un lote falla, lo aviso y sigo con el siguiente.
+            print(f"  -> Error al borrar archivos de '{bucket}': {e}")
+    return borrados
+
 # Defino una función para eliminar usuarios, pasándole la conexión a Supabase.
 def eliminar_usuarios(supabase: Client):
     # Muestro un título para esta sección.
     print("\n--- Eliminación Masiva de Usuarios ---")
     # Muestro un mensaje de que estoy buscando a los usuarios.
-    print("Obteniendo la lista de usuarios...")
-    # Le pido a Supabase la lista completa de todos los usuarios registrados en la autenticación.
-    response = supabase.auth.admin.list_users()
-    
-    # Guardo la lista de usuarios en una variable para que sea más fácil de usar.
-    all_users = response
-    # Informo cuántos usuarios encontré en total.
-    print(f"Se encontraron {len(all_users)} usuarios en total.")
-
-    # Creo una nueva lista, pero esta vez filtro y dejo fuera a mi usuario administrador.
-    usuarios_a_eliminar = [user for user in all_users if user.email != ADMIN_EMAIL]
+    print("Obteniendo la lista de usuarios (todas las páginas)...")
+    # Recorro todas las páginas y dejo fuera a mi usuario administrador.
+    usuarios_a_eliminar = [user for user in listar_usuarios_auth(supabase) if user.email != ADMIN_EMAIL]
+    # Informo cuántos usuarios encontré (sin contar al administrador).
+    print(f"Se encontraron {len(usuarios_a_eliminar)} usuarios además del administrador.")
 
     # Si la lista de usuarios a eliminar está vacía...
     if not usuarios_a_eliminar:
@@ -160,6 +283,8 @@ def eliminar_usuarios(supabase: Client):
 
     # Informo cuántos usuarios se van a borrar y recuerdo que mi cuenta de admin no se tocará.
     print(f"Se van a eliminar {len(usuarios_a_eliminar)} usuarios. El administrador '{ADMIN_EMAIL}' será conservado.")
+    # Explico cómo se va a hacer el borrado.
+    print(f"Se usarán {HILOS_BORRADO} hilos, con un máximo de {BORRADOS_POR_SEGUNDO:g} borrados por segundo.")
     
     # Pido una confirmación final, porque borrar usuarios es una acción muy delicada.
     confirmacion = input("¿Estás seguro de que quieres continuar? Esta acción no se puede deshacer. (escribe 'si' para confirmar): ")
@@ -170,80 +295,201 @@ def eliminar_usuarios(supabase: Client):
         # Salgo de la función.
         return
 
-    # Si el usuario confirmó, empiezo el proceso de borrado.
+    # Si el usuario confirmó, antes de borrar leo dónde están sus fotos de lancha (después ya no estarán sus filas).
+    fotos_lancha = fotos_lancha_de_usuarios(supabase, [user.id for user in usuarios_a_eliminar])
+    # Y empiezo el proceso de borrado.
     print("\nIniciando eliminación...")
-    # Creo un contador para llevar la cuenta de cuántos usuarios he eliminado.
-    eliminados_count = 0
-    # Creo otro contador para los errores que puedan ocurrir.
+    # Guardo la hora de inicio para calcular la velocidad al final.
+    inicio = time.monotonic()
+    # Guardo los IDs que se borraron bien, para después limpiar sus archivos.
+    eliminados = []
+    # Creo un contador para los errores que puedan ocurrir.
     errores_count = 0
+    # Creo el limitador que compartirán todos los hilos.
+    limitador = LimitadorDeRitmo(BORRADOS_POR_SEGUNDO)
 
-    # Recorro la lista de usuarios que decidí eliminar.
-    for user in usuarios_a_eliminar:
-        # Intento borrar cada usuario.
-        try:
-            # Muestro a quién estoy intentando borrar en este momento.
-            print(f"Eliminando usuario: {user.email} (ID: {user.id})...")
-            # Le pido a Supabase que elimine al usuario usando su ID.
-            supabase.auth.admin.delete_user(user.id)
-            # Si se borró bien, aumento mi contador de eliminados.
-            eliminados_count += 1
-        # Si algo sale mal al intentar borrar un usuario...
-        except Exception as e:
-            # ...muestro un mensaje de error específico para ese usuario.
-            print(f"  -> Error al eliminar a {user.email}: {e}")
-            # Y aumento mi contador de errores.
-            errores_count += 1
+    # Creo un grupo fijo de hilos que irán borrando usuarios en paralelo.
+    with ThreadPoolExecutor(max_workers=HILOS_BORRADO) as pool:
+        futuros = [pool.submit(borrar_usuario_con_reintentos, supabase, user, limitador) for user in usuarios_a_eliminar]
+        # Voy recogiendo los resultados a medida que terminan.
+        for hechos, futuro in enumerate(as_completed(futuros), start=1):
+            user, error = futuro.result()
+            if error is None:
+                eliminados.append(user.id)
+            else:
+                # Muestro un mensaje de error específico para ese usuario.
+                print(f"  -> Error al eliminar a {user.email}: {error}")
+                errores_count += 1
+            # Cada cierto número de usuarios muestro cómo vamos.
+            if hechos % PROGRESO_CADA == 0 or hechos == len(futuros):
+                transcurrido = time.monotonic() - inicio
+                print(f"[{hechos}/{len(futuros)}] {hechos / transcurrido:.1f} usuarios/s, {errores_count} errores")
+
+    # Mido cuánto tardó la parte de autenticación.
+    tiempo_auth = time.monotonic() - inicio
+
+    # Ahora borro los archivos de los usuarios eliminados: avatares, fotos de reportes y de lanchas, con sus miniaturas.
+    print("\nBorrando archivos de Storage de los usuarios eliminados...")
+    archivos = archivos_de_usuarios(supabase, eliminados, fotos_lancha)
+    archivos_borrados = {bucket: borrar_archivos(supabase, bucket, paths) for bucket, paths in archivos.items()}
+
+    # Mido el tiempo total.
+    tiempo_total = time.monotonic() - inicio
     
-    # Al terminar el bucle, muestro un resumen de lo que pasó.
+    # Al terminar, muestro un resumen de lo que pasó.
     print("\n--- Proceso Finalizado ---")
     # Informo cuántos usuarios se borraron con éxito.
-    print(f"Usuarios eliminados exitosamente: {eliminados_count}")
+    print(f"Usuarios eliminados exitosamente: {len(eliminados)}")
     # Informo si hubo errores y cuántos.
     print(f"Errores durante la eliminación: {errores_count}")
+    # Informo cuántos archivos se borraron de cada bucket.
+    for bucket, cantidad in archivos_borrados.items():
+        print(f"Archivos borrados de '{bucket}': {cantidad}")
+    # Informo la velocidad del borrado y el tiempo total.
+    print(f"Velocidad: {len(usuarios_a_eliminar) / tiempo_auth:.1f} usuarios/s ({tiempo_auth:.1f}s en autenticación, {tiempo_total:.1f}s en total)")
 
-# Defino una función para limpiar perfiles que se quedaron sin un usuario de autenticación correspondiente.
-def limpiar_registros(supabase: Client):
+# Cuántas filas leo por página de cada lado al reconciliar perfiles y cuentas.
+FILAS_POR_PAGINA = 1000
+# Cuántos IDs borro en cada delete().in_(). Con demasiados, la URL de la petición se vuelve demasiado larga.
+IDS_POR_BORRADO = 100
+
+# Recorro la tabla 'usuarios' ordenada por ID, una página a la vez (paginación por llave, no por offset).
+def perfiles_ordenados(supabase: Client, por_pagina=FILAS_POR_PAGINA):
+    despues = None
+    while True:
+        # Pido solo las columnas que necesito para el informe.
+        query = supabase.table('usuarios').select('id, nombre, email').order('id').limit(por_pagina)
+        # Desde la segunda página, sigo después del último ID que ya vi.
+        if despues is not None:
+            query = query.gt('id', despues)
+        filas = query.execute().data
+        yield from filas
+        # Si la página vino incompleta, ya no hay más perfiles.
+        if len(filas) < por_pagina:
+            return
+        despues = filas[-1]['id']
+
+# Recorro las cuentas de autenticación ordenadas por ID. La API de admin no permite ordenar,
+# así que uso la función 'listar_auth_ids' (está en supabase/migrations).
+def cuentas_ordenadas(supabase: Client, por_pagina=FILAS_POR_PAGINA):
+    despues = None
+    while True:
+        filas = supabase.rpc('listar_auth_ids', {'p_despues': despues, 'p_limite': por_pagina}).execute().data
+        yield from filas
+        if len(filas) < por_pagina:
+            return
+        despues = filas[-1]['id']
+
+# Comparo las dos listas ordenadas avanzando por las dos al mismo tiempo (como al juntar dos mazos
+# de cartas ordenados). Así nunca tengo en memoria más de una página de cada lado.
+# Devuelve ('perfil', fila) si un perfil no tiene cuenta y ('cuenta', fila) si una cuenta no tiene perfil.
+def diferencias(perfiles, cuentas):
+    perfil = next(perfiles, None)
+    cuenta = next(cuentas, None)
+    while perfil is not None or cuenta is not None:
+        # Los IDs son UUID en minúsculas: compararlos como texto da el mismo orden que en Postgres.
+        id_perfil = str(perfil['id']) if perfil is not None else None
+        id_cuenta = str(cuenta['id']) if cuenta is not None else None
+        if id_cuenta is None or (id_perfil is not None and id_perfil < id_cuenta):
+            yield 'perfil', perfil
+            perfil = next(perfiles, None)
+        elif id_perfil is None or id_cuenta < id_perfil:
+            yield 'cuenta', cuenta
+            cuenta = next(cuentas, None)
+        else:
+            # Los dos lados tienen el mismo ID: todo bien, avanzo en ambos.
+            perfil = next(perfiles, None)
+            cuenta = next(cuentas, None)
+
+# Defino una función para limpiar perfiles que se quedaron sin un usuario de autenticación correspondiente,
+# y para encontrar lo contrario: cuentas de autenticación que nunca llegaron a tener perfil.
+def limpiar_registros(supabase: Client, solo_revisar=None):
     # Muestro un título para esta operación.
     print("\n--- Limpieza de Registros Incompletos ---")
+    # Si no me dijeron el modo, pregunto si solo se quiere ver el informe.
+    if solo_revisar is None:
+        solo_revisar = input("¿Solo quieres ver las diferencias, sin borrar nada? (si/no): ").strip().lower() == 'si'
+
+    borrar_cuentas = False
+    if not solo_revisar:
+        # Pido confirmación, porque los perfiles se irán borrando a medida que aparezcan.
+        confirmacion = input("Se borrarán los perfiles que no tengan cuenta de autenticación. ¿Continuar? (escribe 'si' para confirmar): ")
+        if confirmacion.lower() != 'si':
+            print("Operación cancelada por el usuario.")
+            return
+        # Las cuentas sin perfil pueden ser registros que se cortaron a la mitad; su borrado es opcional.
+        borrar_cuentas = input("¿Eliminar también las cuentas de autenticación que no tienen perfil? (si/no): ").strip().lower() == 'si'
+
     # Intento hacer la limpieza, preparado para cualquier error.
     try:
-        # Pido a Supabase todos los perfiles de mi tabla 'usuarios'.
-        perfiles_response = supabase.table('usuarios').select('id, nombre, email').execute()
-        # Guardo los datos de los perfiles en una variable.
-        perfiles = perfiles_response.data
-        # Informo cuántos perfiles encontré en la tabla.
-        print(f"Se encontraron {len(perfiles)} perfiles en la tabla 'usuarios'.")
-        # Ahora pido la lista de todos los usuarios que existen en el sistema de autenticación de Supabase.
-        auth_users_response = supabase.auth.admin.list_users()
-        # Guardo esa lista de usuarios de autenticación.
-        auth_users = auth_users_response
-        # Creo un conjunto (set) con los IDs de los usuarios de autenticación para buscar más rápido.
-        auth_user_ids = {user.id for user in auth_users}
-        # Informo cuántos usuarios de autenticación encontré.
-        print(f"Se encontraron {len(auth_user_ids)} usuarios en el sistema de autenticación.")
-
-        # Busco perfiles en mi tabla 'usuarios' cuyo ID no corresponda a ningún usuario de autenticación. A estos los llamo "huérfanos".
-        huerfanos = [p for p in perfiles if str(p['id']) not in auth_user_ids]
-
-        # Si no encontré ningún perfil huérfano...
-        if not huerfanos:
-            # ...lo celebro con un mensaje positivo.
-            print("¡Excelente! No se encontraron registros de perfiles incompletos.")
-            # Y salgo de la función.
-            return
+        # Guardo la hora de inicio para el resumen.
+        inicio = time.monotonic()
+        # Aquí junto los IDs hasta tener un lote completo para borrar.
+        perfiles_pendientes = []
+        cuentas_pendientes = []
+        # Contadores para el resumen final.
+        perfiles_huerfanos = 0
+        cuentas_sin_perfil = 0
+        perfiles_borrados = 0
+        cuentas_borradas = 0
+        # El limitador de los borrados de cuentas, el mismo que usa la eliminación masiva.
+        limitador = LimitadorDeRitmo(BORRADOS_POR_SEGUNDO)
 
-        # Si encontré perfiles huérfanos, informo cuántos son.
-        print(f"\nSe encontraron {len(huerfanos)} perfiles incompletos que serán eliminados:")
-        # Muestro los detalles de cada perfil que voy a borrar.
-        for h in huerfanos:
-            print(f"  -> Perfil a eliminar: Nombre='{h['nombre']}', Email='{h['email']}', ID='{h['id']}'")
-        
-        # Creo una lista con los IDs de los perfiles huérfanos que voy a eliminar.
-        ids_a_eliminar = [h['id'] for h in huerfanos]
-        # Le digo a Supabase que borre de la tabla 'usuarios' todas las filas cuyos IDs estén en mi lista.
-        supabase.table('usuarios').delete().in_('id', ids_a_eliminar).execute()
-        # Informo que la limpieza se completó.
-        print("\nLimpieza completada exitosamente.")
+        # Borro un lote de perfiles con una sola petición.
+        def borrar_perfiles():
+            nonlocal perfiles_borrados
+            if perfiles_pendientes:
+                supabase.table('usuarios').delete().in_('id', perfiles_pendientes).execute()
+                perfiles_borrados += len(perfiles_pendientes)
+                perfiles_pendientes.clear()
+
+        # Borro un lote de cuentas usando el grupo de hilos con reintentos.
+        def borrar_cuentas_pendientes():
+            nonlocal cuentas_borradas
+            if cuentas_pendientes:
+                with ThreadPoolExecutor(max_workers=HILOS_BORRADO) as pool:
+                    for user, error in pool.map(lambda c: borrar_usuario_con_reintentos(supabase, c, limitador), cuentas_pendientes):
+                        if error is None:
+                            cuentas_borradas += 1
+                        else:
+                            print(f"  -> Error al eliminar la cuenta {user.email}: {error}")
+                cuentas_pendientes.clear()
+
+        # Recorro las diferencias a medida que aparecen; este es el informe de diferencias.
+        print("\n(- perfil sin cuenta de autenticación, + cuenta de autenticación sin perfil)")
+        for lado, fila in diferencias(perfiles_ordenados(supabase), cuentas_ordenadas(supabase)):
+            if lado == 'perfil':
+                perfiles_huerfanos += 1
+                print(f"- perfil  ID='{fila['id']}' Nombre='{fila['nombre']}' Email='{fila['email']}'")
+                if not solo_revisar:
+                    perfiles_pendientes.append(fila['id'])
+                    if len(perfiles_pendientes) >= IDS_POR_BORRADO:
+                        borrar_perfiles()
+            else:
+                # Mi cuenta de administrador nunca se toca, tenga perfil o no.
+                if fila.get('email') == ADMIN_EMAIL:
+                    continue
+                cuentas_sin_perfil += 1
+                print(f"+ cuenta  ID='{fila['id']}' Email='{fila.get('email')}'")
+                if borrar_cuentas:
+                    cuentas_pendientes.append(SimpleNamespace(id=fila['id'], email=fila.get('email')))
+                    if len(cuentas_pendientes) >= IDS_POR_BORRADO:
+                        borrar_cuentas_pendientes()
+
+        # Borro lo que haya quedado en los últimos lotes incompletos.
+        borrar_perfiles()
+        borrar_cuentas_pendientes()
+
+        # Muestro el resumen.
+        print("\n--- Resumen ---")
+        print(f"Perfiles sin cuenta de autenticación: {perfiles_huerfanos} (borrados: {perfiles_borrados})")
+        print(f"Cuentas de autenticación sin perfil: {cuentas_sin_perfil} (borradas: {cuentas_borradas})")
+        print(f"Tiempo: {time.monotonic() - inicio:.1f}s")
+        # Si todo estaba en orden, lo celebro con un mensaje positivo.
+        if not perfiles_huerfanos and not cuentas_sin_perfil:
+            print("¡Excelente! No se encontraron registros incompletos.")
+        elif solo_revisar:
+            print("Modo revisión: no se borró nada.")
 
     # Si ocurre algún error durante la limpieza...
     except Exception as e:
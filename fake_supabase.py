@@ -0,0 +1,506 @@
+# fake_supabase.py
+# Supabase falso dentro del mismo proceso, para medir la app sin tocar el proyecto real.
+# Es un transporte de httpx: el cliente de supabase-py habla con él igual que con el
+# servidor, así que corren las mismas consultas, filtros y RPC que en producción.
+# Implementa solo lo que usa la app (PostgREST, Storage y Auth) y le añade una latencia
+# configurable a cada llamada.
+import contextlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
+
+import httpx
+
+from metricas import TransporteMedido, clasificar
+
+# Para los embeds de PostgREST: reportes?select=*,usuarios(nombre) une por reportes.user_id.
+RELACIONES = {('reportes', 'usuarios'): 'user_id'}
+# Tablas con id numérico que asigna la base (el resto usa uuid o llave compuesta).
+SECUENCIAS = ('reportes',)
+DEFAULTS = {
+    'usuarios': {'rol': 'usuario', 'kg_reciclados': 0, 'minutos': 0},
+    'reportes': {'recogido': False, 'foto_url': None, 'foto_thumb_url': None, 'lat': None, 'lng': None},
+}
+
+BARRIOS = ('La Yesquita', 'Kennedy', 'Zona Minera', 'Cabí', 'Medrano', 'Niño Jesús', 'El Jardín', 'Pandeyuca')
+# Quibdó, para que los reportes caigan sobre el Atrato y sirvan al mapa y a las rutas.
+CENTRO = (5.6947, -76.6611)
+CLAVE_SEMILLA = 'benchmark'
+
+
+class FakeSupabase(httpx.BaseTransport):
+
+    def __init__(self, latencia=0.02, jitter=0.01, por_servicio=None, semilla=0):
+        # latencia y jitter en segundos; por_servicio = {'storage': (base, jitter), ...}
+        self.latencia = latencia
+        self.jitter = jitter
+        self.por_servicio = por_servicio or {}
+        self.tablas = {'usuarios': [], 'reportes': [], 'progreso_diario': [], 'recogidas_idempotencia': []}
+        self.auth_users = {}
+        self.objetos = {}
+        self.llamadas = Counter()
+        self._secuencias = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._rng = random.Random(semilla)
+
+    # --- datos de prueba ---
+
+    def sembrar(self, usuarios=2000, lancheros=40, reportes=3000, abiertos=0.3, dias=90, semilla=1):
+        # Devuelve {'usuarios': [ids], 'lancheros': [ids], 'admins': [ids]}.
+        rng = random.Random(semilla)
+        ahora = datetime.now(timezone.utc)
+        ids = {'usuarios': [], 'lancheros': [], 'admins': []}
+        for i in range(usuarios + lancheros + 1):
+            user_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+            rol = 'admin' if i == 0 else 'lanchero' if i <= lancheros else 'usuario'
+            ids['admins' if rol == 'admin' else rol + 's'].append(user_id)
+            email = f'usuario{i}@chocolimpio.test'
+            self.auth_users[user_id] = {'id': user_id, 'email': email, 'password': CLAVE_SEMILLA}
+            self.tablas['usuarios'].append({
+                'id': user_id,
+                'nombre': f'Usuario {i}',
+                'email': email,
+                'telefono': f'31{i:08d}',
+                'barrio': rng.choice(BARRIOS),
+                'fecha_nac': '1995-03-15',
+                'rol': rol,
+                'kg_reciclados': 0,
+                'minutos': 0,
+                'avatar_url': None,
+                'avatar_thumb_url': None,
+                'created_at': (ahora - timedelta(days=rng.uniform(0, 365))).isoformat(),
+            })
+
+        perfiles = {u['id']: u for u in self.tablas['usuarios']}
+        progreso, conteo = Counter(), Counter()
+        for n in range(reportes):
+            dueño = rng.choice(ids['usuarios'])
+            creado = ahora - timedelta(days=rng.uniform(0, dias))
+            kg = round(rng.lognormvariate(1, 0.6), 2)
+            recogido = rng.random() >= abiertos
+            reporte = self._insertar_fila('reportes', {
+                'user_id': dueño,
+                'kg_reportados': kg,
+                'ubicacion_desc': f'Orilla cerca de {rng.choice(BARRIOS)}',
+                'foto_url': f'https://fake.supabase/storage/v1/object/public/reportes_fotos/public/{dueño}_{n}.jpg',
+                'foto_thumb_url': None,
+                'recogido': recogido,
+                'created_at': creado.isoformat(),
+                'lat': round(CENTRO[0] + rng.gauss(0, 0.02), 6),
+                'lng': round(CENTRO[1] + rng.gauss(0, 0.02), 6),
+            })
+            if recogido:
+                perfiles[dueño]['kg_reciclados'] = round(perfiles[dueño]['kg_reciclados'] + kg, 2)
+                perfiles[dueño]['minutos'] += round(kg * 15)
+                progreso[(dueño, creado.date().isoformat())] += kg
+                conteo[(dueño, creado.date().isoformat())] += 1
+        for (user_id, dia), kg in progreso.items():
+            self.tablas['progreso_diario'].append(
+                {'user_id': user_id, 'dia': dia, 'kg': round(kg, 2), 'reportes': conteo[(user_id, dia)]})
+        return ids
+
+    # --- conteo de llamadas ---
+
+    @contextlib.contextmanager
+    def registrar(self):
+        # Las llamadas hechas por este hilo dentro del bloque quedan en la lista devuelta.
+        llamadas = []
+        self._local.llamadas = llamadas
+        try:
+            yield llamadas
+        finally:
+            self._local.llamadas = None
+
+    # --- transporte ---
+
+    def handle_request(self, request):
+        request.read()
+        partes = [unquote(p) for p in request.url.path.split('/') if p]
+        servicio = partes[0] if partes else ''
+        base, jitter = self.por_servicio.get(servicio, (self.latencia, self.jitter))
+        time.sleep(base + self._rng.uniform(0, jitter))
+
+        try:
+            if servicio == 'rest':
+                response = self._rest(request, partes[2:])
+            elif servicio == 'storage':
+                response = self._storage(request, partes[2:])
+            elif servicio == 'auth':
+                response = self._auth(request, partes[2:])
+            else:
+                response = _json(404, {'message': 'Ruta desconocida'})
+        except ErrorPostgrest as e:
+            response = _json(e.status, {'code': e.code, 'message': str(e), 'details': None, 'hint': None})
+
+        llamada = '{} {}:{}'.format(request.method, *clasificar(request.url.path))
+        with self._lock:
+            self.llamadas[llamada] += 1
+        llamadas = getattr(self._local, 'llamadas', None)
+        if llamadas is not None:
+            llamadas.append(llamada)
+        return response
+
+    # --- PostgREST ---
+
+    def _rest(self, request, partes):
+        if partes[:1] == ['rpc']:
+            return self._rpc(partes[1], _cuerpo(request))
+        tabla = partes[0]
+        if tabla not in self.tablas:
+            raise ErrorPostgrest(404, '42P01', f'relation "public.{tabla}" does not exist')
+
+        params = request.url.params
+        prefer = request.headers.get('Prefer', '')
+        filtros = [(k, v) for k, v in params.multi_items()
+                   if k not in ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns')]
+        representacion = 'return=representation' in prefer
+
+        with self._lock:
+            if request.method in ('GET', 'HEAD'):
+                filas = [f for f in self.tablas[tabla] if _cumple(f, filtros)]
+                total = len(filas)
+                filas = _ordenar(filas, params.get('order'))
+                inicio = int(params.get('offset', 0))
+                fin = inicio + int(params['limit']) if 'limit' in params else None
+                indices = {}
+                filas = [self._proyectar(tabla, f, params.get('select', '*'), indices) for f in filas[inicio:fin]]
+            elif request.method == 'POST':
+                filas = self._insertar(tabla, _cuerpo(request), params.get('on_conflict'), prefer)
+                indices = {}
+                filas = [self._proyectar(tabla, f, params.get('select', '*'), indices) for f in filas]
+            elif request.method == 'PATCH':
+                cambios = _cuerpo(request)
+                filas = [f for f in self.tablas[tabla] if _cumple(f, filtros)]
+                for fila in filas:
+                    fila.update(cambios)
+                filas = [dict(f) for f in filas]
+            elif request.method == 'DELETE':
+                filas = [f for f in self.tablas[tabla] if _cumple(f, filtros)]
+                borrar = {id(f) for f in filas}
+                self.tablas[tabla] = [f for f in self.tablas[tabla] if id(f) not in borrar]
+            else:
+                return _json(405, {'message': 'Método no soportado'})
+
+        headers = {}
+        if 'count=' in prefer:
+            headers['Content-Range'] = f'0-{max(len(filas) - 1, 0)}/{total if request.method in ("GET", "HEAD") else len(filas)}'
+        if 'vnd.pgrst.object' in request.headers.get('Accept', ''):
+            if len(filas) != 1:
+                raise ErrorPostgrest(406, 'PGRST116', 'JSON object requested, multiple (or no) rows returned')
+            return _json(200, filas[0], headers)
+        if request.method != 'GET' and not representacion:
+            return httpx.Response(204 if request.method != 'POST' else 201, headers=headers)
+        return _json(200 if request.method != 'POST' else 201, filas, headers)
+
+    def _insertar(self, tabla, cuerpo, on_conflict, prefer):
+        nuevas = cuerpo if isinstance(cuerpo, list) else [cuerpo]
+        llave = on_conflict.split(',') if on_conflict else None
+        insertadas = []
+        for datos in nuevas:
+            if llave:
+                existente = next((f for f in self.tablas[tabla]
+                                  if all(f.get(c) == datos.get(c) and f.get(c) is not None for c in llave)), None)
+                if existente is not None:
+                    if 'resolution=ignore-duplicates' not in prefer:
+                        existente.update(datos)
+                        insertadas.append(dict(existente))
+                    continue
+            insertadas.append(dict(self._insertar_fila(tabla, datos)))
+        return insertadas
+
+    def _insertar_fila(self, tabla, datos):
+        fila = {**DEFAULTS.get(tabla, {}), 'created_at': datetime.now(timezone.utc).isoformat(), **datos}
+        if tabla in SECUENCIAS and fila.get('id') is None:
+            self._secuencias[tabla] += 1
+            fila['id'] = self._secuencias[tabla]
+        self.tablas[tabla].append(fila)
+        return fila
+
+    def _proyectar(self, tabla, fila, select, indices):
+        # `indices` guarda, para toda la consulta, las tablas embebidas indexadas por id.
+        resultado = {}
+        for columna in _partir(select):
+            columna = columna.strip()
+            if '(' in columna:
+                relacion, subselect = columna[:-1].split('(', 1)
+                if relacion not in indices:
+                    indices[relacion] = {f.get('id'): f for f in self.tablas.get(relacion, [])}
+                relacionada = indices[relacion].get(fila.get(RELACIONES.get((tabla, relacion))))
+                resultado[relacion] = self._proyectar(relacion, relacionada, subselect, indices) if relacionada else None
+            elif columna == '*':
+                resultado.update(fila)
+            else:
+                resultado[columna] = fila.get(columna)
+        return resultado
+
+    def _rpc(self, nombre, args):
+        if nombre == 'recoger_reportes':
+            with self._lock:
+                return _json(200, self._recoger_reportes(**args))
+        if nombre == 'listar_auth_ids':
+            despues, limite = args.get('p_despues'), args.get('p_limite', 1000)
+            with self._lock:
+                ids = sorted((u['id'], u['email']) for u in self.auth_users.values())
+            ids = [{'id': i, 'email': e} for i, e in ids if despues is None or i > despues]
+            return _json(200, ids[:min(max(limite, 1), 5000)])
+        raise ErrorPostgrest(404, 'PGRST202', f'Could not find the function public.{nombre}')
+
+    def _recoger_reportes(self, p_lanchero, p_ids, p_clave=None, p_zona='America/Bogota', p_minutos_por_kg=15):
+        # La misma lógica que supabase/migrations/..._recoger_reportes.sql.
+        if p_clave is not None:
+            for fila in self.tablas['recogidas_idempotencia']:
+                if fila['lanchero_id'] == p_lanchero and fila['clave'] == p_clave:
+                    return {**fila['resultado'], 'repetido': True}
+
+        ids = set(p_ids)
+        reclamados = [r for r in self.tablas['reportes'] if r['id'] in ids and not r['recogido']]
+        kg_por_usuario = Counter()
+        for reporte in reclamados:
+            reporte['recogido'] = True
+            kg_por_usuario[reporte['user_id']] += float(reporte['kg_reportados'])
+
+        usuarios = []
+        for perfil in self.tablas['usuarios']:
+            if perfil['id'] in kg_por_usuario:
+                kg = kg_por_usuario[perfil['id']]
+                perfil['kg_reciclados'] = float(perfil.get('kg_reciclados') or 0) + kg
+                perfil['minutos'] = int(perfil.get('minutos') or 0) + round(kg * p_minutos_por_kg)
+                usuarios.append({k: perfil[k] for k in ('id', 'kg_reciclados', 'minutos')})
+
+        resultado = {
+            'recogidos': [{k: r[k] for k in ('id', 'user_id', 'kg_reportados')} for r in reclamados],
+            'usuarios': usuarios,
+            'dias': len({(r['user_id'], r['created_at'][:10]) for r in reclamados}),
+        }
+        if p_clave is not None:
+            self.tablas['recogidas_idempotencia'].append(
+                {'lanchero_id': p_lanchero, 'clave': p_clave, 'resultado': resultado})
+        return {**resultado, 'repetido': False}
+
+    # --- Storage ---
+
+    def _storage(self, request, partes):
+        if partes[:1] != ['object']:
+            return _json(404, {'message': 'Ruta desconocida'})
+        resto = partes[1:]
+        if resto[:1] == ['list']:
+            cuerpo = _cuerpo(request)
+            prefijo = f'{resto[1]}/{cuerpo.get("prefix", "")}'.rstrip('/') + '/'
+            with self._lock:
+                nombres = sorted(k[len(prefijo):] for k in self.objetos if k.startswith(prefijo))
+            inicio = int(cuerpo.get('offset', 0))
+            nombres = nombres[inicio:inicio + int(cuerpo.get('limit', 100))]
+            return _json(200, [{'name': n, 'id': n, 'metadata': {}} for n in nombres])
+        if request.method in ('POST', 'PUT'):
+            llave = '/'.join(resto)
+            with self._lock:
+                self.objetos[llave] = len(request.content)
+            return _json(200, {'Key': llave, 'Id': str(uuid.uuid4())})
+        if request.method == 'DELETE':
+            bucket = resto[0]
+            borrados = []
+            with self._lock:
+                for prefijo in _cuerpo(request).get('prefixes', []):
+                    if self.objetos.pop(f'{bucket}/{prefijo}', None) is not None:
+                        borrados.append({'name': prefijo})
+            return _json(200, borrados)
+        return _json(405, {'message': 'Método no soportado'})
+
+    # --- Auth ---
+
+    def _auth(self, request, partes):
+        cuerpo = _cuerpo(request) if request.content else {}
+        if partes == ['token']:
+            with self._lock:
+                cuenta = next((u for u in self.auth_users.values()
+                               if u['email'] == cuerpo.get('email') and u['password'] == cuerpo.get('password')), None)
+            if cuenta is None:
+                return _json(400, {'error': 'invalid_grant', 'error_description': 'Invalid login credentials'})
+            return _json(200, {
+                'access_token': f'fake-{cuenta["id"]}',
+                'refresh_token': str(uuid.uuid4()),
+                'token_type': 'bearer',
+                'expires_in': 3600,
+                'expires_at': int(time.time()) + 3600,
+                'user': _usuario_auth(cuenta),
+            })
+        if partes == ['signup']:
+            user_id = str(uuid.uuid4())
+            datos = (cuerpo.get('data') or {})
+            with self._lock:
+                if any(u['email'] == cuerpo.get('email') for u in self.auth_users.values()):
+                    return _json(422, {'code': 422, 'msg': 'User already registered'})
+                cuenta = {'id': user_id, 'email': cuerpo.get('email'), 'password': cuerpo.get('password')}
+                self.auth_users[user_id] = cuenta
+                # Lo que hace el trigger de la base al crear la cuenta.
+                self._insertar_fila('usuarios', {'id': user_id, 'email': cuenta['email'], **datos})
+            return _json(200, _usuario_auth(cuenta))
+        if partes[:2] == ['admin', 'users']:
+            if request.method == 'DELETE' and len(partes) == 3:
+                with self._lock:
+                    self.auth_users.pop(partes[2], None)
+                    self.tablas['usuarios'] = [u for u in self.tablas['usuarios'] if u['id'] != partes[2]]
+                return _json(200, {})
+            if request.method == 'GET':
+                pagina = int(request.url.params.get('page', 1))
+                por_pagina = int(request.url.params.get('per_page', 50))
+                with self._lock:
+                    cuentas = list(self.auth_users.values())
+                cuentas = cuentas[(pagina - 1) * por_pagina:pagina * por_pagina]
+                return _json(200, {'users': [_usuario_auth(c) for c in cuentas], 'aud': 'authenticated'})
+        return _json(404, {'message': 'Ruta desconocida'})
+
+
+class ErrorPostgrest(Exception):
+
+    def __init__(self, status, code, mensaje):
+        super().__init__(mensaje)
+        self.status = status
+        self.code = code
+
+
+def instalar(wsgi, fake):
+    # Pone el Supabase falso debajo del cliente de `app.py` (conservando la medición de
+    # metricas.py, para que /metrics también funcione durante el benchmark).
+    wsgi.http_client._transport = TransporteMedido(wsgi.metricas, fake)
+
+
+def _usuario_auth(cuenta):
+    return {
+        'id': cuenta['id'],
+        'aud': 'authenticated',
+        'role': 'authenticated',
+        'email': cuenta['email'],
+        'app_metadata': {'provider': 'email'},
+        'user_metadata': {},
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def _json(status, datos, headers=None):
+    return httpx.Response(status, json=datos, headers=headers)
+
+
+def _cuerpo(request):
+    return json.loads(request.content or b'{}')
+
+
+def _partir(texto):
+    # Separa por comas que no estén dentro de paréntesis ni de comillas.
+    partes, actual, nivel, comillas = [], '', 0, False
+    for c in texto:
+        if c == '"':
+            comillas = not comillas
+        elif not comillas and c == '(':
+            nivel += 1
+        elif not comillas and c == ')':
+            nivel -= 1
+        if c == ',' and nivel == 0 and not comillas:
+            partes.append(actual)
+            actual = ''
+        else:
+            actual += c
+    if actual:
+        partes.append(actual)
+    return partes
+
+
+def _literal(valor):
+    if len(valor) >= 2 and valor[0] == valor[-1] == '"':
+        return valor[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+    return valor
+
+
+def _cumple(fila, filtros):
+    for columna, condicion in filtros:
+        if columna in ('or', 'and'):
+            condiciones = [c.split('.', 1) for c in _partir(condicion[1:-1])]
+            resultados = [_compara(fila.get(c), cond) for c, cond in condiciones]
+            if not (any(resultados) if columna == 'or' else all(resultados)):
+                return False
+        elif not _compara(fila.get(columna), condicion):
+            return False
+    return True
+
+
+def _compara(valor, condicion):
+    negado = condicion.startswith('not.')
+    if negado:
+        condicion = condicion[4:]
+    op, arg = condicion.split('.', 1)
+    if op == 'is':
+        resultado = valor is None if arg == 'null' else valor is (arg == 'true')
+    elif op == 'in':
+        resultado = any(_igual(valor, _literal(v)) for v in _partir(arg[1:-1]))
+    elif op in ('like', 'ilike'):
+        patron = _literal(arg)
+        texto = '' if valor is None else str(valor)
+        if op == 'ilike':
+            patron, texto = patron.casefold(), texto.casefold()
+        resultado = _like(texto, patron)
+    else:
+        arg = _literal(arg)
+        if valor is None:
+            resultado = False
+        elif op == 'eq':
+            resultado = _igual(valor, arg)
+        elif op == 'neq':
+            resultado = not _igual(valor, arg)
+        else:
+            a, b = _coercer(valor, arg)
+            resultado = {'gt': a > b, 'gte': a >= b, 'lt': a < b, 'lte': a <= b}[op]
+    return not resultado if negado else resultado
+
+
+def _igual(valor, arg):
+    if valor is None:
+        return False
+    a, b = _coercer(valor, arg)
+    return a == b
+
+
+def _coercer(valor, arg):
+    if isinstance(valor, bool):
+        return valor, arg == 'true'
+    if isinstance(valor, (int, float)):
+        return float(valor), float(arg)
+    return str(valor), arg
+
+
+def _like(texto, patron):
+    # '%' y '*' = cualquier cosa, '_' = un carácter; '\%' y '\_' son literales.
+    regex, escapado = '', False
+    for c in patron:
+        if escapado:
+            regex += re.escape(c)
+            escapado = False
+        elif c == '\\':
+            escapado = True
+        elif c in '%*':
+            regex += '.*'
+        elif c == '_':
+            regex += '.'
+        else:
+            regex += re.escape(c)
+    return re.fullmatch(regex, texto, re.DOTALL) is not None
+
+
+def _ordenar(filas, order):
+    if not order:
+        return filas
+    for criterio in reversed(order.split(',')):
+        partes = criterio.split('.')
+        columna, desc = partes[0], 'desc' in partes[1:]
+        # Como en Postgres: los nulos van al final en asc y al principio en desc.
+        con = [f for f in filas if f.get(columna) is not None]
+        sin = [f for f in filas if f.get(columna) is None]
+        con.sort(key=lambda f: f[columna], reverse=desc)
+        filas = sin + con if desc else con + sin
+    return filas
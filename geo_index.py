@@ -0,0 +1,130 @@
+# geo_index.py
+import math
+import threading
+from collections import defaultdict
+
+# Lado de la celda del índice en grados (~1,1 km en el Chocó).
+CELDA_GRADOS = 0.01
+# Por debajo de este zoom los reportes cercanos se devuelven agrupados.
+ZOOM_SIN_GRUPOS = 15
+# Cuántos grupos caben, como mucho, a lo ancho de una tesela de 256 px.
+GRUPOS_POR_TESELA = 4
+
+
+def coordenadas(reporte):
+    lat, lng = reporte.get('lat'), reporte.get('lng')
+    if lat is None or lng is None:
+        return None
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+class GridIndex:
+    # Índice espacial en memoria de los reportes abiertos: una rejilla de celdas fijas
+    # con los reportes de cada celda. Una consulta por rectángulo solo revisa las celdas
+    # que toca, y agregar o quitar un reporte no obliga a reconstruir nada.
+    # Se asume que los rectángulos no cruzan el antimeridiano (oeste <= este).
+
+    def __init__(self, celda=CELDA_GRADOS):
+        self.celda = celda
+        self._celdas = defaultdict(dict)
+        self._posiciones = {}
+        self._lock = threading.Lock()
+
+    def insertar(self, reporte):
+        # Reportes sin coordenadas no entran (y si ya estaban, se quitan).
+        punto = coordenadas(reporte)
+        if punto is None:
+            self.quitar(reporte['id'])
+            return False
+        clave = self._clave(*punto)
+        with self._lock:
+            anterior = self._posiciones.get(reporte['id'])
+            if anterior is not None and anterior != clave:
+                self._sacar(reporte['id'], anterior)
+            self._celdas[clave][reporte['id']] = reporte
+            self._posiciones[reporte['id']] = clave
+        return True
+
+    def quitar(self, reporte_id):
+        with self._lock:
+            clave = self._posiciones.pop(reporte_id, None)
+            if clave is not None:
+                self._sacar(reporte_id, clave)
+
+    def consultar(self, sur, oeste, norte, este):
+        i0, j0 = self._clave(sur, oeste)
+        i1, j1 = self._clave(norte, este)
+        encontrados = []
+        with self._lock:
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self._celdas):
+                # Rectángulo enorme (zoom muy lejano): sale más barato recorrer las celdas ocupadas.
+                celdas = [r for (i, j), r in self._celdas.items() if i0 <= i <= i1 and j0 <= j <= j1]
+            else:
+                celdas = [self._celdas[(i, j)] for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)
+                          if (i, j) in self._celdas]
+            for reportes in celdas:
+                for reporte in reportes.values():
+                    lat, lng = coordenadas(reporte)
+                    if sur <= lat <= norte and oeste <= lng <= este:
+                        encontrados.append(reporte)
+        return encontrados
+
+    def agrupar(self, sur, oeste, norte, este, zoom):
+        # Devuelve (reportes, grupos). Con zoom alto no agrupa; con zoom bajo junta los
+        # reportes que caen en la misma celda de pantalla (~64 px) en un solo grupo.
+        reportes = self.consultar(sur, oeste, norte, este)
+        if zoom >= ZOOM_SIN_GRUPOS:
+            return reportes, []
+        lado = 360.0 / (2 ** zoom) / GRUPOS_POR_TESELA
+        cubetas = defaultdict(list)
+        for reporte in reportes:
+            lat, lng = coordenadas(reporte)
+            cubetas[(math.floor(lat / lado), math.floor(lng / lado))].append(reporte)
+
+        sueltos, grupos = [], []
+        for miembros in cubetas.values():
+            if len(miembros) == 1:
+                sueltos.append(miembros[0])
+                continue
+            puntos = [coordenadas(r) for r in miembros]
+            grupos.append({
+                'lat': sum(p[0] for p in puntos) / len(puntos),
+                'lng': sum(p[1] for p in puntos) / len(puntos),
+                'cantidad': len(miembros),
+                'kg': round(sum(float(r.get('kg_reportados') or 0) for r in miembros), 2),
+                'sur': min(p[0] for p in puntos),
+                'oeste': min(p[1] for p in puntos),
+                'norte': max(p[0] for p in puntos),
+                'este': max(p[1] for p in puntos),
+            })
+        return sueltos, grupos
+
+    def escuchar_feed(self, tipo, data):
+        # Oyente para ReportFeed: mantiene el índice al día con los cambios que ve
+        # el feed, incluidos los que hicieron otros workers.
+        if tipo == 'nuevo':
+            self.insertar(data)
+        elif tipo == 'recogido':
+            self.quitar(data['id'])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'reportes': len(self._posiciones),
+                'celdas': len(self._celdas),
+                'celda_grados': self.celda,
+            }
+
+    def _clave(self, lat, lng):
+        return math.floor(lat / self.celda), math.floor(lng / self.celda)
+
+    def _sacar(self, reporte_id, clave):
+        celda = self._celdas.get(clave)
+        if celda is None:
+            return
+        celda.pop(reporte_id, None)
+        if not celda:
+            del self._celdas[clave]
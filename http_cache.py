@@ -0,0 +1,117 @@
+# http_cache.py
+# Políticas de caché HTTP por ruta y validación con ETag. Lo usan tanto la app Flask
+# como la de Quart (asgi.py): las dos trabajan con objetos request/response de werkzeug.
+import hashlib
+import json
+import os
+import threading
+
+from werkzeug.http import quote_etag
+
+POLITICAS = {
+    # Páginas y respuestas con datos de la sesión: nunca se guardan.
+    'no-store': {
+        'Cache-Control': 'no-store, no-cache, must-revalidate, max-age=0',
+        'Pragma': 'no-cache',
+        'Expires': '0',
+    },
+    # JSON que se consulta cada pocos segundos: el navegador lo guarda, pero lo revalida
+    # siempre con If-None-Match. Si no cambió, la respuesta es un 304 sin cuerpo.
+    'revalidar': {
+        'Cache-Control': 'private, no-cache',
+    },
+    # Archivos estáticos pedidos con su huella (?v=...): el contenido de esa URL no cambia nunca.
+    'inmutable': {
+        'Cache-Control': 'public, max-age=31536000, immutable',
+    },
+    # Estáticos pedidos sin huella (enlaces viejos, el manifest...).
+    'estatico': {
+        'Cache-Control': 'public, max-age=300',
+    },
+}
+
+POLITICA_POR_DEFECTO = 'no-store'
+
+
+def politica(nombre):
+    # @politica('revalidar') sobre una vista cambia la política que aplica aplicar_politica().
+    def decorator(f):
+        f.cache_policy = nombre
+        return f
+    return decorator
+
+
+def aplicar_politica(app, request, response):
+    # Se llama desde el after_request de cada app. Para los estáticos reemplaza lo que
+    # pone send_file; en las vistas respeta un Cache-Control que la vista haya puesto.
+    if request.endpoint == 'static':
+        nombre = 'inmutable' if _huella_valida(app, request) else 'estatico'
+        response.headers.update(POLITICAS[nombre])
+        return response
+    vista = app.view_functions.get(request.endpoint)
+    nombre = getattr(vista, 'cache_policy', POLITICA_POR_DEFECTO)
+    for header, valor in POLITICAS[nombre].items():
+        response.headers.setdefault(header, valor)
+    if nombre == 'revalidar':
+        response.headers.setdefault('Vary', 'Cookie')
+    return response
+
+
+def etag_de(*partes):
+    # ETag derivado del contenido de los datos con los que se arma la respuesta.
+    h = hashlib.blake2b(digest_size=12)
+    for parte in partes:
+        h.update(json.dumps(parte, sort_keys=True, default=str).encode())
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def no_modificado(request, etag):
+    # Devuelve la respuesta 304 si el cliente ya tiene esta versión; si no, None.
+    if etag in request.if_none_match:
+        return '', 304, {'ETag': quote_etag(etag), **POLITICAS['revalidar'], 'Vary': 'Cookie'}
+    return None
+
+
+def con_etag(response, etag):
+    response.set_etag(etag)
+    return response
+
+
+_huellas = {}
+_huellas_lock = threading.Lock()
+
+
+def huella(static_folder, filename):
+    # Los primeros caracteres del hash del archivo. Se recalcula solo si cambia el mtime.
+    path = os.path.join(static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _huellas_lock:
+        guardada = _huellas.get(path)
+    if guardada and guardada[0] == mtime:
+        return guardada[1]
+    with open(path, 'rb') as f:
+        valor = hashlib.md5(f.read()).hexdigest()[:10]
+    with _huellas_lock:
+        _huellas[path] = (mtime, valor)
+    return valor
+
+
+def agregar_huella(app):
+    # url_for('static', filename=...) añade ?v=<huella> a la URL; al cambiar el archivo
+    # cambia la URL, por eso el navegador puede guardarlo un año sin revalidar.
+    def url_defaults(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            valor = huella(app.static_folder, values['filename'])
+            if valor:
+                values['v'] = valor
+    return url_defaults
+
+
+def _huella_valida(app, request):
+    filename = (request.view_args or {}).get('filename')
+    valor = request.args.get('v')
+    return bool(filename and valor) and valor == huella(app.static_folder, filename)
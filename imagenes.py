@@ -0,0 +1,31 @@
+# imagenes.py
+from PIL import Image, ImageOps
+
+JPEG_QUALITY = 82
+
+
+def procesar_imagen(local_path, max_lado=1600, miniaturas=(320,)):
+    # Corre dentro del pool de procesos. Endereza la foto según el EXIF, la re-codifica
+    # como JPEG sin metadatos (se pierden GPS y datos del teléfono) con el lado mayor
+    # limitado a `max_lado`, y genera una miniatura cuadrada por cada tamaño pedido.
+    # Devuelve {sufijo: ruta_local}; el sufijo '' es la imagen principal.
+    with Image.open(local_path) as original:
+        imagen = ImageOps.exif_transpose(original)
+        if imagen.mode != 'RGB':
+            imagen = imagen.convert('RGB')
+
+        variantes = {}
+        principal = imagen.copy()
+        principal.thumbnail((max_lado, max_lado), Image.LANCZOS)
+        variantes[''] = _guardar(principal, f'{local_path}.main.jpg')
+
+        for lado in miniaturas:
+            miniatura = ImageOps.fit(imagen, (lado, lado), Image.LANCZOS)
+            variantes[f'_{lado}'] = _guardar(miniatura, f'{local_path}.{lado}.jpg')
+
+    return variantes
+
+
+def _guardar(imagen, path):
+    imagen.save(path, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return path
@@ -0,0 +1,99 @@
+# leaderboard.py
+import threading
+import time
+
+
+class Leaderboard:
+    # Guarda en memoria el top-N de usuarios por kg reciclados y lo refresca como mucho
+    # una vez por intervalo. Con un backend compartido (Redis) todos los workers leen la
+    # misma foto y solo uno de ellos consulta a Supabase cuando toca refrescar.
+
+    def __init__(self, cargar, size=10, interval=20, backend=None, key='chocolimpio:leaderboard'):
+        self._cargar = cargar
+        self.size = size
+        self.interval = interval
+        self._backend = backend
+        self._key = key
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.refreshes = 0
+
+    def top(self, n=3):
+        snapshot = self.snapshot()
+        return snapshot['items'][:max(0, min(n, self.size))]
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot and not self._expirado(snapshot):
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot and not self._expirado(snapshot):
+                return snapshot
+
+            if self._backend is not None:
+                compartido = self._leer_compartido()
+                if compartido and not self._expirado(compartido):
+                    self._snapshot = compartido
+                    return compartido
+                if not self._tomar_candado():
+                    # Otro worker está refrescando (o Redis falló); sirvo lo que haya mientras tanto.
+                    if compartido or snapshot:
+                        return compartido or snapshot
+
+            try:
+                snapshot = {'ts': time.time(), 'items': self._cargar(self.size)}
+            except Exception as e:
+                print(f"[ERROR LEADERBOARD] {e}")
+                if self._snapshot:
+                    return self._snapshot
+                raise
+            self.refreshes += 1
+            self._snapshot = snapshot
+            if self._backend is not None:
+                self._escribir_compartido(snapshot)
+            return snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+        if self._backend is not None:
+            try:
+                self._backend.delete(self._key)
+                self._backend.delete(self._key + ':lock')
+            except Exception as e:
+                print(f"[ERROR LEADERBOARD] {e}")
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'size': self.size,
+            'interval': self.interval,
+            'refreshes': self.refreshes,
+            'age': round(time.time() - snapshot['ts'], 3) if snapshot else None,
+            'shared': self._backend is not None,
+        }
+
+    def _expirado(self, snapshot):
+        return time.time() - snapshot['ts'] >= self.interval
+
+    def _tomar_candado(self):
+        # Si Redis falla se trata como candado no tomado: sin foto en memoria se consulta igual.
+        try:
+            return self._backend.add(self._key + ':lock', 1, self.interval)
+        except Exception as e:
+            print(f"[ERROR LEADERBOARD] {e}")
+            return False
+
+    def _leer_compartido(self):
+        try:
+            return self._backend.get(self._key)
+        except Exception as e:
+            print(f"[ERROR LEADERBOARD] {e}")
+            return None
+
+    def _escribir_compartido(self, snapshot):
+        try:
+            self._backend.set(self._key, snapshot, ttl=self.interval * 10)
+        except Exception as e:
+            print(f"[ERROR LEADERBOARD] {e}")
@@ -0,0 +1,136 @@
+# limites.py
+# Control de admisión con token buckets para las rutas que terminan en Supabase Auth o
+# Storage. Cada ruta puede tener un bucket por IP, por usuario y uno global de la ruta;
+# si alguno está vacío la petición se rechaza antes de llamar a Supabase.
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+ALCANCES = ('ip', 'usuario', 'ruta')
+
+
+class Limite:
+
+    def __init__(self, capacidad, segundos):
+        # `capacidad` peticiones seguidas como máximo; el bucket se llena entero en `segundos`.
+        self.capacidad = capacidad
+        self.por_segundo = capacidad / segundos
+
+    def __repr__(self):
+        return f'Limite({self.capacidad}, {self.capacidad / self.por_segundo:g})'
+
+
+def leer_limite(texto):
+    # '10/60' -> 10 peticiones por minuto; '', '0' u 'off' -> sin límite.
+    texto = (texto or '').strip().lower()
+    if texto in ('', '0', 'off'):
+        return None
+    capacidad, _, segundos = texto.partition('/')
+    capacidad, segundos = int(capacidad), float(segundos or 1)
+    if capacidad <= 0 or segundos <= 0:
+        raise ValueError(f'Límite inválido: {texto!r}')
+    return Limite(capacidad, segundos)
+
+
+def reglas_desde_entorno(por_defecto, environ=os.environ, prefijo='RATE_LIMIT'):
+    # Cada límite se puede cambiar con RATE_LIMIT_<RUTA>_<ALCANCE>=N/S (p. ej.
+    # RATE_LIMIT_LOGIN_IP=20/300) y RATE_LIMIT_ENABLED=0 los apaga todos.
+    if environ.get(f'{prefijo}_ENABLED', '1').strip().lower() in ('0', 'false', 'off'):
+        return {}
+    reglas = {}
+    for ruta, limites in por_defecto.items():
+        for alcance in ALCANCES:
+            texto = environ.get(f'{prefijo}_{ruta.upper()}_{alcance.upper()}', limites.get(alcance))
+            limite = leer_limite(texto)
+            if limite is not None:
+                reglas.setdefault(ruta, {})[alcance] = limite
+    return reglas
+
+
+class BucketsLocales:
+    # Token buckets en memoria del worker, con desalojo LRU para no crecer sin fin
+    # cuando llegan muchas IPs distintas.
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def tomar_token(self, key, capacidad, por_segundo):
+        ahora = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.pop(key, (capacidad, ahora))
+            tokens = min(capacidad, tokens + (ahora - ts) * por_segundo)
+            espera = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                espera = (1 - tokens) / por_segundo
+            self._buckets[key] = (tokens, ahora)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return espera
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class Limitador:
+    # Con un backend compartido (Redis) los buckets son los mismos para todos los workers;
+    # si Redis falla se sigue con los buckets locales en vez de dejar pasar todo.
+
+    def __init__(self, reglas, backend=None, metricas=None, prefix='chocolimpio:limite:', maxsize=10000):
+        self.reglas = reglas
+        self._backend = backend
+        self._metricas = metricas
+        self._prefix = prefix
+        self._locales = BucketsLocales(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._admitidas = defaultdict(int)
+        self._rechazadas = defaultdict(int)
+
+    def revisar(self, ruta, ip=None, usuario=None):
+        # Devuelve cuántos segundos tiene que esperar el cliente, 0 si puede pasar. Los
+        # buckets por IP y por usuario van antes que el de la ruta, así un cliente que
+        # insiste no se gasta los tokens de todos los demás.
+        limites = self.reglas.get(ruta)
+        if not limites:
+            return 0.0
+        valores = {'ip': ip, 'usuario': usuario, 'ruta': '*'}
+        for alcance in ALCANCES:
+            limite = limites.get(alcance)
+            if limite is None or not valores[alcance]:
+                continue
+            espera = self._tomar(f'{ruta}:{alcance}:{valores[alcance]}', limite)
+            if espera > 0:
+                self._registrar(ruta, alcance)
+                return espera
+        self._registrar(ruta, None)
+        return 0.0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rutas': {ruta: {'admitidas': self._admitidas[ruta], 'rechazadas': self._rechazadas[ruta]}
+                          for ruta in self.reglas},
+                'buckets_locales': len(self._locales),
+                'shared': self._backend is not None,
+            }
+
+    def _tomar(self, key, limite):
+        if self._backend is not None:
+            try:
+                return self._backend.tomar_token(self._prefix + key, limite.capacidad, limite.por_segundo)
+            except Exception as e:
+                print(f"[ERROR LIMITES] {e}")
+        return self._locales.tomar_token(key, limite.capacidad, limite.por_segundo)
+
+    def _registrar(self, ruta, alcance):
+        with self._lock:
+            if alcance is None:
+                self._admitidas[ruta] += 1
+            else:
+                self._rechazadas[ruta] += 1
+        if self._metricas is not None:
+            self._metricas.registrar_admision(ruta, alcance)
@@ -0,0 +1,276 @@
+# metricas.py
+# Latencia por ruta y por llamada a Supabase, expuesta en formato Prometheus (/metrics).
+# Las llamadas se miden en el transporte HTTP del cliente de Supabase, así se cuentan
+# todas (tablas, RPC, Storage, Auth) sin tocar cada consulta.
+import contextvars
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Llamadas hechas durante la petición actual: [(nombre, segundos), ...]. Los hilos de
+# fondo (subidas, feed, leaderboard) no tienen petición y solo suman a los totales.
+_llamadas = contextvars.ContextVar('llamadas_upstream', default=None)
+
+
+class Histograma:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.conteos[i] += 1
+                break
+        else:
+            self.conteos[-1] += 1
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre, etiquetas):
+        acumulado = 0
+        for limite, conteo in zip(self.buckets, self.conteos):
+            acumulado += conteo
+            yield f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}'
+        yield f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {self.total}'
+        yield f'{nombre}_sum{{{etiquetas}}} {self.suma:.6f}'
+        yield f'{nombre}_count{{{etiquetas}}} {self.total}'
+
+
+class Metricas:
+
+    def __init__(self, prefijo='chocolimpio', lento=1.0):
+        self.prefijo = prefijo
+        self.lento = lento
+        self._rutas = defaultdict(Histograma)
+        self._upstream = defaultdict(Histograma)
+        self._errores_upstream = defaultdict(int)
+        self._admisiones = defaultdict(int)
+        self._rechazos = defaultdict(int)
+        self._lock = threading.Lock()
+        self.lentas = 0
+
+    def registrar_llamada(self, servicio, objetivo, metodo, segundos, status=None):
+        with self._lock:
+            self._upstream[(servicio, objetivo, metodo)].observar(segundos)
+            if status is None or status >= 500:
+                self._errores_upstream[(servicio, objetivo, metodo)] += 1
+        llamadas = _llamadas.get()
+        if llamadas is not None:
+            llamadas.append((f'{metodo} {servicio}:{objetivo}', segundos))
+
+    def registrar_paso(self, nombre, segundos):
+        # Para tiempos que no son HTTP pero sirven en el desglose (p. ej. render de plantillas).
+        llamadas = _llamadas.get()
+        if llamadas is not None:
+            llamadas.append((nombre, segundos))
+
+    def registrar_admision(self, ruta, alcance=None):
+        # Una decisión del limitador: `alcance` es el bucket que rechazó, None si se admitió.
+        with self._lock:
+            self._admisiones[ruta] += 1
+            if alcance is not None:
+                self._rechazos[(ruta, alcance)] += 1
+
+    def iniciar_peticion(self):
+        return _llamadas.set([]), time.perf_counter()
+
+    def terminar_peticion(self, inicio, metodo, ruta, status, log_lento=True):
+        token, empezo = inicio
+        segundos = time.perf_counter() - empezo
+        llamadas = _llamadas.get() or []
+        try:
+            _llamadas.reset(token)
+        except ValueError:
+            # Respuestas en streaming pueden terminar en otro contexto.
+            _llamadas.set(None)
+        lenta = log_lento and segundos >= self.lento
+        with self._lock:
+            self._rutas[(metodo, ruta, str(status))].observar(segundos)
+            if lenta:
+                self.lentas += 1
+        if lenta:
+            self._log_lenta(metodo, ruta, status, segundos, llamadas)
+        return segundos
+
+    def exposicion(self):
+        p = self.prefijo
+        lineas = [
+            f'# HELP {p}_http_request_duration_seconds Latencia de las peticiones por ruta.',
+            f'# TYPE {p}_http_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            for (metodo, ruta, status), h in sorted(self._rutas.items()):
+                lineas.extend(h.lineas(f'{p}_http_request_duration_seconds',
+                                       f'method="{metodo}",route="{_escapar(ruta)}",status="{status}"'))
+            lineas += [
+                f'# HELP {p}_upstream_call_duration_seconds Latencia de cada llamada a Supabase.',
+                f'# TYPE {p}_upstream_call_duration_seconds histogram',
+            ]
+            for (servicio, objetivo, metodo), h in sorted(self._upstream.items()):
+                lineas.extend(h.lineas(f'{p}_upstream_call_duration_seconds',
+                                       f'service="{servicio}",target="{_escapar(objetivo)}",method="{metodo}"'))
+            lineas += [
+                f'# HELP {p}_upstream_call_errors_total Llamadas a Supabase fallidas o con 5xx.',
+                f'# TYPE {p}_upstream_call_errors_total counter',
+            ]
+            for (servicio, objetivo, metodo), n in sorted(self._errores_upstream.items()):
+                lineas.append(f'{p}_upstream_call_errors_total'
+                              f'{{service="{servicio}",target="{_escapar(objetivo)}",method="{metodo}"}} {n}')
+            lineas += [
+                f'# HELP {p}_rate_limit_checks_total Peticiones que pasaron por el limitador.',
+                f'# TYPE {p}_rate_limit_checks_total counter',
+            ]
+            for ruta, n in sorted(self._admisiones.items()):
+                lineas.append(f'{p}_rate_limit_checks_total{{route="{_escapar(ruta)}"}} {n}')
+            lineas += [
+                f'# HELP {p}_rate_limit_rejections_total Peticiones rechazadas con 429, por bucket.',
+                f'# TYPE {p}_rate_limit_rejections_total counter',
+            ]
+            for (ruta, alcance), n in sorted(self._rechazos.items()):
+                lineas.append(f'{p}_rate_limit_rejections_total{{route="{_escapar(ruta)}",scope="{alcance}"}} {n}')
+            lineas += [
+                f'# HELP {p}_slow_requests_total Peticiones más lentas que el umbral del log.',
+                f'# TYPE {p}_slow_requests_total counter',
+                f'{p}_slow_requests_total {self.lentas}',
+            ]
+        return '\n'.join(lineas) + '\n'
+
+    def _log_lenta(self, metodo, ruta, status, segundos, llamadas):
+        medido = sum(s for _, s in llamadas)
+        desglose = ', '.join(f'{nombre}={s * 1000:.0f}ms' for nombre, s in llamadas) or 'sin llamadas'
+        print(f"[LENTA] {metodo} {ruta} {status} {segundos * 1000:.0f}ms "
+              f"(upstream {medido * 1000:.0f}ms, resto {(segundos - medido) * 1000:.0f}ms): {desglose}")
+
+
+class TransporteMedido(httpx.BaseTransport):
+    # Envuelve el transporte del httpx.Client que usa el cliente de Supabase y mide cada
+    # petición hasta que llegan los headers de la respuesta.
+
+    def __init__(self, metricas, transporte=None):
+        self._metricas = metricas
+        self._transporte = transporte or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        servicio, objetivo = clasificar(request.url.path)
+        inicio = time.perf_counter()
+        status = None
+        try:
+            response = self._transporte.handle_request(request)
+            status = response.status_code
+            return response
+        finally:
+            self._metricas.registrar_llamada(servicio, objetivo, request.method, time.perf_counter() - inicio, status)
+
+    def close(self):
+        self._transporte.close()
+
+
+class TransporteMedidoAsync(httpx.AsyncBaseTransport):
+    # Lo mismo para el cliente asíncrono del modo ASGI.
+
+    def __init__(self, metricas, transporte=None):
+        self._metricas = metricas
+        self._transporte = transporte or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request):
+        servicio, objetivo = clasificar(request.url.path)
+        inicio = time.perf_counter()
+        status = None
+        try:
+            response = await self._transporte.handle_async_request(request)
+            status = response.status_code
+            return response
+        finally:
+            self._metricas.registrar_llamada(servicio, objetivo, request.method, time.perf_counter() - inicio, status)
+
+    async def aclose(self):
+        await self._transporte.aclose()
+
+
+def clasificar(path):
+    # '/rest/v1/usuarios' -> ('rest', 'usuarios'); '/rest/v1/rpc/recoger_reportes' -> ('rpc', 'recoger_reportes')
+    # '/storage/v1/object/avatars/public/x.jpg' -> ('storage', 'object/avatars'); '/auth/v1/admin/users/<id>' -> ('auth', 'admin/users')
+    partes = [p for p in path.split('/') if p]
+    if len(partes) < 2:
+        return 'otro', path
+    servicio, resto = partes[0], partes[2:]
+    if servicio == 'rest':
+        if resto[:1] == ['rpc'] and len(resto) > 1:
+            return 'rpc', resto[1]
+        return 'rest', resto[0] if resto else ''
+    if servicio == 'storage':
+        return 'storage', '/'.join(resto[:2])
+    if servicio == 'auth':
+        return 'auth', '/'.join(resto[:2])
+    return servicio, '/'.join(resto[:1])
+
+
+def instrumentar(app, metricas, sin_log_lento=()):
+    # Mide cada petición de la app Flask y el render de plantillas dentro de ella.
+    # Las rutas en `sin_log_lento` (streams largos) se miden pero no van al log de lentas.
+    from flask import before_render_template, g, request, template_rendered
+
+    @app.before_request
+    def _iniciar():
+        g._metricas_inicio = metricas.iniciar_peticion()
+
+    @app.after_request
+    def _status(response):
+        g._metricas_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _terminar(error=None):
+        inicio = g.pop('_metricas_inicio', None)
+        if inicio is None:
+            return
+        status = 500 if error is not None else g.pop('_metricas_status', 200)
+        ruta = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        metricas.terminar_peticion(inicio, request.method, ruta, status, log_lento=ruta not in sin_log_lento)
+
+    def _antes_de_render(sender, template, context, **extra):
+        g._metricas_render = time.perf_counter()
+
+    def _despues_de_render(sender, template, context, **extra):
+        inicio = g.pop('_metricas_render', None)
+        if inicio is not None:
+            metricas.registrar_paso(f'render:{template.name}', time.perf_counter() - inicio)
+
+    before_render_template.connect(_antes_de_render, app, weak=False)
+    template_rendered.connect(_despues_de_render, app, weak=False)
+
+
+def instrumentar_quart(app, metricas, sin_log_lento=()):
+    # Versión para la app de Quart (asgi.py). Los hooks tienen que ser async: si fueran
+    # funciones normales Quart las correría en otro hilo y se perdería el contexto.
+    from quart import g, request
+
+    @app.before_request
+    async def _iniciar():
+        g._metricas_inicio = metricas.iniciar_peticion()
+
+    @app.after_request
+    async def _status(response):
+        g._metricas_status = response.status_code
+        return response
+
+    @app.teardown_request
+    async def _terminar(error=None):
+        inicio = g.pop('_metricas_inicio', None)
+        if inicio is None:
+            return
+        status = 500 if error is not None else g.pop('_metricas_status', 200)
+        ruta = request.url_rule.rule if request.url_rule is not None else 'sin_ruta'
+        metricas.terminar_peticion(inicio, request.method, ruta, status, log_lento=ruta not in sin_log_lento)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"')
@@ -0,0 +1,260 @@
+# report_feed.py
+import asyncio
+import json
+import threading
+import time
+import uuid
+from collections import deque
+
+REPORTE_COLUMNAS = '*, usuarios(nombre, barrio)'
+
+
+class SupabaseReportSource:
+    # Fuente real: una consulta ligera de ids abiertos por ciclo y el join completo
+    # solo para los reportes que son nuevos.
+
+    def __init__(self, client):
+        self._client = client
+
+    def ids_abiertos(self):
+        # Los reportes cuya foto aún se está subiendo (foto_url nulo) no se publican todavía.
+        response = self._client.table('reportes') \
+            .select('id') \
+            .eq('recogido', False) \
+            .not_.is_('foto_url', 'null') \
+            .execute()
+        return {row['id'] for row in response.data}
+
+    def obtener(self, ids):
+        if not ids:
+            return []
+        response = self._client.table('reportes') \
+            .select(REPORTE_COLUMNAS) \
+            .in_('id', list(ids)) \
+            .execute()
+        return response.data
+
+
+class InMemoryReportSource:
+    # Sustituto local de Supabase para pruebas y desarrollo sin conexión.
+
+    def __init__(self, reportes=None):
+        self._lock = threading.Lock()
+        self._reportes = {r['id']: dict(r) for r in (reportes or [])}
+
+    def agregar(self, reporte):
+        with self._lock:
+            self._reportes[reporte['id']] = dict(reporte, recogido=reporte.get('recogido', False))
+
+    def recoger(self, reporte_id):
+        with self._lock:
+            if reporte_id in self._reportes:
+                self._reportes[reporte_id]['recogido'] = True
+
+    def ids_abiertos(self):
+        with self._lock:
+            return {i for i, r in self._reportes.items() if not r.get('recogido')}
+
+    def obtener(self, ids):
+        with self._lock:
+            return [dict(self._reportes[i]) for i in ids if i in self._reportes]
+
+
+class ReportFeed:
+    # Un único hilo consulta la fuente cada `interval` segundos, calcula los cambios y
+    # los reparte a todos los lancheros conectados. Los eventos recientes se guardan en
+    # un buffer para que un cliente pueda reanudar con Last-Event-ID.
+
+    def __init__(self, source, interval=5, buffer_size=500, heartbeat=15):
+        self._source = source
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self.epoch = uuid.uuid4().hex[:8]
+        self._eventos = deque(maxlen=buffer_size)
+        self._abiertos = {}
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._hilo = None
+        self._listo = threading.Event()
+        self._despertar = threading.Event()
+        self._oyentes = []
+        self.clientes = 0
+
+    def start(self):
+        with self._cond:
+            if self._hilo is not None:
+                return
+            self._hilo = threading.Thread(target=self._loop, name='report-feed', daemon=True)
+            self._hilo.start()
+
+    def escuchar(self, oyente):
+        # oyente(tipo, data) se llama con cada evento 'nuevo' o 'recogido', dentro del candado del feed.
+        self._oyentes.append(oyente)
+
+    def esperar_listo(self, timeout=None):
+        # Arranca el hilo si hace falta y espera a la primera sincronización.
+        self.start()
+        return self._listo.wait(timeout=self.interval * 2 if timeout is None else timeout)
+
+    def sincronizar(self):
+        ids = self._source.ids_abiertos()
+        with self._cond:
+            nuevos = ids - self._abiertos.keys()
+            recogidos = self._abiertos.keys() - ids
+        filas = self._source.obtener(nuevos)
+        with self._cond:
+            for reporte_id in recogidos:
+                self._quitar(reporte_id)
+            for fila in filas:
+                if fila.get('recogido'):
+                    continue
+                self._agregar(fila)
+            self._listo.set()
+
+    def publicar_nuevo(self, reporte):
+        with self._cond:
+            self._agregar(reporte)
+
+    def publicar_recogido(self, reporte_id):
+        with self._cond:
+            self._quitar(reporte_id)
+
+    def despertar(self):
+        # Adelanta la próxima sincronización, p. ej. justo después de insertar un reporte.
+        self._despertar.set()
+
+    def snapshot(self):
+        with self._cond:
+            return self._snapshot_locked()
+
+    def stream(self, last_event_id=None, max_duration=None):
+        self.start()
+        self._listo.wait(timeout=self.interval * 2)
+        inicio = time.monotonic()
+        with self._cond:
+            self.clientes += 1
+        try:
+            yield f"retry: {int(self.interval * 1000)}\n\n"
+            with self._cond:
+                seq, pendientes = self._inicio(last_event_id)
+            for evento in pendientes:
+                yield self._formatear(*evento)
+
+            while max_duration is None or time.monotonic() - inicio < max_duration:
+                with self._cond:
+                    if self._seq <= seq:
+                        self._cond.wait(timeout=self.heartbeat)
+                    seq, pendientes = self._siguientes(seq)
+                if not pendientes:
+                    yield ": heartbeat\n\n"
+                    continue
+                for evento in pendientes:
+                    yield self._formatear(*evento)
+        finally:
+            with self._cond:
+                self.clientes -= 1
+
+    async def astream(self, last_event_id=None, max_duration=None, poll=0.5):
+        # Versión para el modo ASGI: en vez de bloquear un hilo esperando, revisa el
+        # contador de eventos cada `poll` segundos, que es solo una lectura en memoria.
+        self.start()
+        inicio = time.monotonic()
+        while not self._listo.is_set() and time.monotonic() - inicio < self.interval * 2:
+            await asyncio.sleep(poll)
+        with self._cond:
+            self.clientes += 1
+        try:
+            yield f"retry: {int(self.interval * 1000)}\n\n"
+            with self._cond:
+                seq, pendientes = self._inicio(last_event_id)
+            for evento in pendientes:
+                yield self._formatear(*evento)
+
+            ultimo_envio = time.monotonic()
+            while max_duration is None or time.monotonic() - inicio < max_duration:
+                await asyncio.sleep(poll)
+                if self._seq <= seq:
+                    if time.monotonic() - ultimo_envio >= self.heartbeat:
+                        ultimo_envio = time.monotonic()
+                        yield ": heartbeat\n\n"
+                    continue
+                with self._cond:
+                    seq, pendientes = self._siguientes(seq)
+                for evento in pendientes:
+                    yield self._formatear(*evento)
+                ultimo_envio = time.monotonic()
+        finally:
+            with self._cond:
+                self.clientes -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                'epoch': self.epoch,
+                'seq': self._seq,
+                'abiertos': len(self._abiertos),
+                'buffer': len(self._eventos),
+                'clientes': self.clientes,
+            }
+
+    def _loop(self):
+        while True:
+            try:
+                self.sincronizar()
+            except Exception as e:
+                print(f"[ERROR REPORT FEED] {e}")
+            self._despertar.wait(timeout=self.interval)
+            self._despertar.clear()
+
+    def _agregar(self, reporte):
+        if reporte['id'] in self._abiertos:
+            return
+        self._abiertos[reporte['id']] = reporte
+        self._emitir('nuevo', reporte)
+
+    def _quitar(self, reporte_id):
+        if self._abiertos.pop(reporte_id, None) is None:
+            return
+        self._emitir('recogido', {'id': reporte_id})
+
+    def _emitir(self, tipo, data):
+        self._seq += 1
+        self._eventos.append((self._seq, tipo, data))
+        self._cond.notify_all()
+        for oyente in self._oyentes:
+            try:
+                oyente(tipo, data)
+            except Exception as e:
+                print(f"[ERROR REPORT FEED OYENTE] {e}")
+
+    def _inicio(self, last_event_id):
+        seq = self._seq_desde(last_event_id)
+        if seq is None:
+            return self._seq, [(self._seq, 'snapshot', self._snapshot_locked())]
+        return self._siguientes(seq)
+
+    def _siguientes(self, seq):
+        if self._eventos and self._eventos[0][0] > seq + 1:
+            # El cliente se quedó atrás más de lo que guarda el buffer.
+            return self._seq, [(self._seq, 'snapshot', self._snapshot_locked())]
+        pendientes = [e for e in self._eventos if e[0] > seq]
+        return (pendientes[-1][0] if pendientes else seq), pendientes
+
+    def _snapshot_locked(self):
+        return sorted(self._abiertos.values(), key=lambda r: (r.get('created_at') or '', r['id']), reverse=True)
+
+    def _seq_desde(self, last_event_id):
+        if not last_event_id or '-' not in last_event_id:
+            return None
+        epoch, _, seq = last_event_id.partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self._seq:
+            return None
+        if seq < self._seq and (not self._eventos or self._eventos[0][0] > seq + 1):
+            return None
+        return seq
+
+    def _formatear(self, seq, tipo, data):
+        return f"id: {self.epoch}-{seq}\nevent: {tipo}\ndata: {json.dumps(data, default=str)}\n\n"
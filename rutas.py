@@ -0,0 +1,271 @@
+# rutas.py
+import heapq
+import json
+import math
+import os
+import threading
+import time
+
+from cache import TTLCache
+
+RADIO_TIERRA_KM = 6371.0
+
+
+def haversine_km(a, b):
+    lat1, lng1 = map(math.radians, a)
+    lat2, lng2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * math.asin(math.sqrt(h))
+
+
+class RedFluvial:
+    # Puntos de paso del río (muelles, bocas de quebrada, curvas) y los tramos navegables
+    # entre ellos. La matriz de distancias entre todos los puntos de paso se calcula una
+    # sola vez (Dijkstra desde cada uno) y se guarda. La distancia entre dos lugares es:
+    # ir al punto de paso más cercano, seguir el río y salir del punto de paso más cercano
+    # al destino. Sin puntos de paso se usa la distancia en línea recta.
+
+    def __init__(self, waypoints=None, tramos=None):
+        self.waypoints = {str(k): (float(v[0]), float(v[1])) for k, v in (waypoints or {}).items()}
+        self._vecinos = {k: [] for k in self.waypoints}
+        for tramo in tramos or []:
+            a, b = str(tramo[0]), str(tramo[1])
+            km = float(tramo[2]) if len(tramo) > 2 and tramo[2] is not None \
+                else haversine_km(self.waypoints[a], self.waypoints[b])
+            self._vecinos[a].append((b, km))
+            self._vecinos[b].append((a, km))
+        self._matriz = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_archivo(cls, path):
+        # {"waypoints": {"muelle": [lat, lng], ...}, "tramos": [["muelle", "yesquita"], ["a", "b", km], ...]}
+        with open(path, encoding='utf-8') as f:
+            datos = json.load(f)
+        return cls(datos.get('waypoints'), datos.get('tramos'))
+
+    def matriz(self):
+        with self._lock:
+            if self._matriz is None:
+                self._matriz = {origen: self._dijkstra(origen) for origen in self.waypoints}
+            return self._matriz
+
+    def matriz_puntos(self, puntos):
+        # Distancias entre todos los `puntos`, buscando el punto de paso de cada uno una sola vez.
+        # Son n² distancias: solo para los pocos puntos de una ruta, no para todo el backlog.
+        n = len(puntos)
+        d = [[0.0] * n for _ in range(n)]
+        if not self.waypoints:
+            for i in range(n):
+                for j in range(i + 1, n):
+                    d[i][j] = d[j][i] = haversine_km(puntos[i], puntos[j])
+            return d
+        matriz = self.matriz()
+        accesos = self._accesos(puntos)
+        for i in range(n):
+            for j in range(i + 1, n):
+                d[i][j] = d[j][i] = self._por_rio(matriz, puntos[i], accesos[i], puntos[j], accesos[j])
+        return d
+
+    def distancias(self, origenes, destinos):
+        # Solo el bloque origenes × destinos (p. ej. de cada bote a cada reporte), sin las
+        # distancias entre destinos que no se van a usar.
+        if not self.waypoints:
+            return [[haversine_km(o, p) for p in destinos] for o in origenes]
+        matriz = self.matriz()
+        accesos_destinos = self._accesos(destinos)
+        filas = []
+        for origen, acceso_origen in zip(origenes, self._accesos(origenes)):
+            filas.append([self._por_rio(matriz, origen, acceso_origen, p, acceso)
+                          for p, acceso in zip(destinos, accesos_destinos)])
+        return filas
+
+    def stats(self):
+        return {
+            'waypoints': len(self.waypoints),
+            'tramos': sum(len(v) for v in self._vecinos.values()) // 2,
+            'matriz_calculada': self._matriz is not None,
+        }
+
+    def _mas_cercano(self, punto):
+        return min(self.waypoints, key=lambda k: haversine_km(punto, self.waypoints[k]))
+
+    def _accesos(self, puntos):
+        # (punto de paso más cercano, km hasta él) de cada punto.
+        accesos = []
+        for p in puntos:
+            w = self._mas_cercano(p)
+            accesos.append((w, haversine_km(p, self.waypoints[w])))
+        return accesos
+
+    def _por_rio(self, matriz, a, acceso_a, b, acceso_b):
+        por_rio = matriz[acceso_a[0]].get(acceso_b[0])
+        if por_rio is None:
+            # Sin camino por el río entre los dos: la línea recta, penalizada.
+            return haversine_km(a, b) * 3
+        return acceso_a[1] + por_rio + acceso_b[1]
+
+    def _dijkstra(self, origen):
+        distancias = {origen: 0.0}
+        pendientes = [(0.0, origen)]
+        while pendientes:
+            d, nodo = heapq.heappop(pendientes)
+            if d > distancias.get(nodo, math.inf):
+                continue
+            for vecino, km in self._vecinos[nodo]:
+                nueva = d + km
+                if nueva < distancias.get(vecino, math.inf):
+                    distancias[vecino] = nueva
+                    heapq.heappush(pendientes, (nueva, vecino))
+        return distancias
+
+
+_redes = {}
+_redes_lock = threading.Lock()
+
+
+def red_fluvial(path):
+    # La red se vuelve a leer (y su matriz a calcular) solo si cambia el archivo.
+    if not path or not os.path.exists(path):
+        return RedFluvial()
+    mtime = os.path.getmtime(path)
+    with _redes_lock:
+        guardada = _redes.get(path)
+        if guardada and guardada[0] == mtime:
+            return guardada[1]
+    red = RedFluvial.desde_archivo(path)
+    with _redes_lock:
+        _redes[path] = (mtime, red)
+    return red
+
+
+def punto(reporte):
+    return float(reporte['lat']), float(reporte['lng'])
+
+
+def candidatos_cercanos(inicio, capacidad, reportes, red, maximo):
+    # Los `maximo` reportes más cercanos a `inicio` que caben en el bote. Con miles de
+    # reportes abiertos la matriz de la ruta crecería con el cuadrado del backlog; así
+    # depende solo de `maximo`.
+    if capacidad is not None:
+        reportes = [r for r in reportes if float(r.get('kg_reportados') or 0) <= capacidad]
+    if len(reportes) <= maximo:
+        return reportes
+    desde_inicio = red.distancias([inicio], [punto(r) for r in reportes])[0]
+    orden = sorted(range(len(reportes)), key=lambda j: (desde_inicio[j], j))
+    return [reportes[j] for j in orden[:maximo]]
+
+
+def planificar_ruta(inicio, capacidad, reportes, red, presupuesto=0.2, max_candidatos=150):
+    # Vecino más cercano respetando la capacidad del bote y después 2-opt hasta agotar el
+    # presupuesto de tiempo (segundos), que cuenta desde que empieza la llamada. Solo se
+    # consideran los `max_candidatos` reportes más cercanos a `inicio`. La ruta empieza en
+    # `inicio` y no vuelve al muelle. Devuelve (reportes_en_orden, distancia_total_km).
+    limite = time.monotonic() + presupuesto
+    reportes = candidatos_cercanos(inicio, capacidad, reportes, red, max_candidatos)
+    puntos = [inicio] + [punto(r) for r in reportes]
+    n = len(puntos)
+    d = red.matriz_puntos(puntos)
+
+    kg = [0.0] + [float(r.get('kg_reportados') or 0) for r in reportes]
+    libre = math.inf if capacidad is None else float(capacidad)
+    orden = [0]
+    pendientes = set(range(1, n))
+    while pendientes:
+        actual = orden[-1]
+        caben = [j for j in pendientes if kg[j] <= libre]
+        if not caben:
+            break
+        siguiente = min(caben, key=lambda j: (d[actual][j], j))
+        orden.append(siguiente)
+        pendientes.discard(siguiente)
+        libre -= kg[siguiente]
+
+    mejoro = True
+    while mejoro and time.monotonic() < limite:
+        mejoro = False
+        for i in range(1, len(orden) - 1):
+            for k in range(i + 1, len(orden)):
+                a, b, c = orden[i - 1], orden[i], orden[k]
+                antes = d[a][b]
+                despues = d[a][c]
+                if k + 1 < len(orden):
+                    e = orden[k + 1]
+                    antes += d[c][e]
+                    despues += d[b][e]
+                if despues < antes - 1e-9:
+                    orden[i:k + 1] = reversed(orden[i:k + 1])
+                    mejoro = True
+            if time.monotonic() >= limite:
+                break
+
+    total = sum(d[orden[i]][orden[i + 1]] for i in range(len(orden) - 1))
+    return [reportes[j - 1] for j in orden[1:]], total
+
+
+class RegistroLancheros:
+    # Lancheros que pidieron ruta hace poco: su posición, capacidad y los reportes que
+    # llevan en su ruta. Con un backend compartido lo ven todos los workers.
+
+    def __init__(self, ttl=900, backend=None, key='chocolimpio:rutas:activos'):
+        self.ttl = ttl
+        self._local = TTLCache(maxsize=1000, ttl=ttl)
+        self._backend = backend
+        self._key = key
+        self._lock = threading.Lock()
+
+    def activos(self):
+        ahora = time.time()
+        with self._lock:
+            activos = self._leer()
+        return {k: v for k, v in activos.items() if ahora - v['actualizado'] < self.ttl}
+
+    def registrar(self, lanchero_id, posicion, capacidad, ruta_ids):
+        entrada = {
+            'posicion': list(posicion),
+            'capacidad': capacidad,
+            'ruta': list(ruta_ids),
+            'actualizado': time.time(),
+        }
+        with self._lock:
+            activos = self._leer()
+            activos[str(lanchero_id)] = entrada
+            ahora = time.time()
+            activos = {k: v for k, v in activos.items() if ahora - v['actualizado'] < self.ttl}
+            self._escribir(activos)
+
+    def _leer(self):
+        if self._backend is not None:
+            try:
+                return self._backend.get(self._key) or {}
+            except Exception as e:
+                print(f"[ERROR RUTAS] {e}")
+        return self._local.get(self._key) or {}
+
+    def _escribir(self, activos):
+        self._local.set(self._key, activos)
+        if self._backend is not None:
+            try:
+                self._backend.set(self._key, activos, ttl=self.ttl)
+            except Exception as e:
+                print(f"[ERROR RUTAS] {e}")
+
+
+def repartir(lanchero_id, posicion, reportes, activos, red):
+    # Qué reportes le tocan a `lanchero_id`. Los que ya van en la ruta de otro lanchero
+    # activo siguen siendo suyos; el resto se reparte al bote más cercano.
+    lanchero_id = str(lanchero_id)
+    otros = [v for k, v in activos.items() if k != lanchero_id]
+    tomados = {rid for v in otros for rid in v['ruta']}
+    libres = [r for r in reportes if r['id'] not in tomados]
+    if not otros:
+        return libres, len(reportes) - len(libres)
+
+    # Fila 0: este bote; filas 1..k: los otros botes; una columna por reporte libre.
+    botes = [tuple(posicion)] + [tuple(v['posicion']) for v in otros]
+    d = red.distancias(botes, [punto(r) for r in libres])
+    mios = []
+    for j, reporte in enumerate(libres):
+        if all(d[0][j] <= d[i][j] for i in range(1, len(botes))):
+            mios.append(reporte)
+    return mios, len(reportes) - len(mios)
@@ -1,20 +1,257 @@
 // Cuando todo el contenido de la página se ha cargado, ejecuto esta función.
 document.addEventListener('DOMContentLoaded', function() {
     // Esto es para inicializar los 'tooltips' de Bootstrap. Son esas pequeñas ayudas que aparecen cuando pasas el ratón sobre algo.
-    // Busco todos los elementos que tengan el atributo 'data-bs-toggle="tooltip"'.
-    var tooltipTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle="tooltip"]'))
-    // Luego, para cada uno de esos elementos, creo un nuevo objeto Tooltip de Bootstrap para que funcione.
-    var tooltipList = tooltipTriggerList.map(function (tooltipTriggerEl) {
-        return new bootstrap.Tooltip(tooltipTriggerEl)
+    activarTooltips(document);
+
+    // Escucho los clics de toda la tabla una sola vez; así también funcionan las filas que llegan después con el scroll.
+    document.getElementById('solicitudes-body').addEventListener('click', function(event) {
+        // Me fijo si el clic fue en un botón de aprobar o rechazar.
+        const button = event.target.closest('button[data-accion]');
+        if (button) {
+            procesarSolicitud(button, button.dataset.solicitud, button.dataset.accion);
+        }
+    });
+
+    // Cada vez que se marca o desmarca una fila, actualizo los botones de lote.
+    document.getElementById('solicitudes-body').addEventListener('change', actualizarSeleccion);
+    // La casilla del encabezado marca o desmarca todas las filas que ya están cargadas.
+    document.getElementById('seleccionar-todas').addEventListener('change', function() {
+        document.querySelectorAll('#solicitudes-body .seleccion').forEach((casilla) => { casilla.checked = this.checked; });
+        actualizarSeleccion();
     });
+    // Los botones de la barra mandan todas las filas marcadas en una sola petición.
+    document.querySelectorAll('[data-accion-lote]').forEach((button) => {
+        button.addEventListener('click', () => procesarSeleccionadas(button.dataset.accionLote));
+    });
+
+    // Si hay más páginas, pido la siguiente cuando el aviso del final de la tabla aparece en pantalla.
+    const aviso = document.getElementById('mas-solicitudes');
+    if (aviso) {
+        const observer = new IntersectionObserver((entries) => {
+            if (entries[0].isIntersecting) {
+                cargarMasSolicitudes(aviso, observer);
+            }
+        }, { rootMargin: '300px' }); // Empiezo a cargar un poco antes de llegar al final, para que no se note la espera.
+        observer.observe(aviso);
+    }
 });
 
+// Busco los elementos que tengan el atributo 'data-bs-toggle="tooltip"' dentro de 'contenedor' y creo su Tooltip de Bootstrap.
+function activarTooltips(contenedor) {
+    contenedor.querySelectorAll('[data-bs-toggle="tooltip"]').forEach((el) => new bootstrap.Tooltip(el));
+}
+
+// Guardo si ya estoy pidiendo una página, para no pedir la misma dos veces.
+let cargandoSolicitudes = false;
+
+// Pido la página siguiente de solicitudes y agrego sus filas al final de la tabla.
+async function cargarMasSolicitudes(aviso, observer) {
+    if (cargandoSolicitudes || !aviso.dataset.siguiente) {
+        return;
+    }
+    cargandoSolicitudes = true;
+    try {
+        const response = await fetch(`/admin/api/solicitudes?despues=${encodeURIComponent(aviso.dataset.siguiente)}`);
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.error);
+        }
+
+        const tbody = document.getElementById('solicitudes-body');
+        result.solicitudes.forEach((solicitud) => tbody.appendChild(filaSolicitud(solicitud)));
+        activarTooltips(tbody);
+        actualizarContador(result.pendientes);
+
+        if (result.siguiente) {
+            // Todavía hay más: guardo dónde sigue la próxima página.
+            aviso.dataset.siguiente = result.siguiente;
+        } else {
+            // Ya no hay más: dejo de observar y quito el aviso.
+            observer.disconnect();
+            aviso.remove();
+        }
+    } catch (error) {
+        console.error('Error al cargar más solicitudes:', error);
+        aviso.textContent = 'No se pudieron cargar más solicitudes. Recarga la página para intentar de nuevo.';
+        observer.disconnect();
+    } finally {
+        cargandoSolicitudes = false;
+    }
+}
+
+// Armo la fila de una solicitud igual a las que pinta la plantilla. Uso textContent para que ningún dato se interprete como HTML.
+function filaSolicitud(solicitud) {
+    const row = document.createElement('tr');
+
+    const seleccion = document.createElement('td');
+    const casilla = document.createElement('input');
+    casilla.type = 'checkbox';
+    casilla.className = 'form-check-input seleccion';
+    casilla.value = solicitud.id;
+    seleccion.appendChild(casilla);
+
+    const nombre = document.createElement('td');
+    nombre.textContent = solicitud.nombre || '';
+
+    const contacto = document.createElement('td');
+    contacto.append(icono('bi-envelope'), ` ${solicitud.email || ''}`, document.createElement('br'),
+                    icono('bi-phone'), ` ${solicitud.telefono || ''}`);
+
+    const mensaje = document.createElement('td');
+    const mensajeDiv = document.createElement('div');
+    mensajeDiv.className = 'mensaje-col';
+    mensajeDiv.dataset.bsToggle = 'tooltip';
+    mensajeDiv.title = solicitud.mensaje_lanchero || '';
+    mensajeDiv.textContent = solicitud.mensaje_lanchero || '';
+    mensaje.appendChild(mensajeDiv);
+
+    const foto = document.createElement('td');
+    if (solicitud.foto_lancha_url) {
+        // El enlace abre la foto completa; en la tabla va la miniatura y se carga solo cuando está por verse.
+        const enlace = document.createElement('a');
+        enlace.href = solicitud.foto_lancha_url;
+        enlace.target = '_blank';
+        const img = document.createElement('img');
+        img.src = solicitud.foto_lancha_thumb_url || solicitud.foto_lancha_url;
+        img.alt = 'Foto de la lancha';
+        img.className = 'lancha-img';
+        img.width = 100;
+        img.height = 75;
+        img.loading = 'lazy';
+        img.decoding = 'async';
+        enlace.appendChild(img);
+        foto.appendChild(enlace);
+    } else {
+        const sinFoto = document.createElement('span');
+        sinFoto.className = 'text-muted fst-italic';
+        sinFoto.textContent = 'No hay foto';
+        foto.appendChild(sinFoto);
+    }
+
+    const acciones = document.createElement('td');
+    acciones.className = 'text-nowrap';
+    acciones.append(botonAccion(solicitud.id, 'aprobar', 'btn-success', 'Aprobar'), ' ',
+                    botonAccion(solicitud.id, 'rechazar', 'btn-danger', 'Rechazar'));
+
+    row.append(seleccion, nombre, contacto, mensaje, foto, acciones);
+    return row;
+}
+
+function icono(clase) {
+    const i = document.createElement('i');
+    i.className = `bi ${clase}`;
+    return i;
+}
+
+function botonAccion(solicitudId, accion, clase, texto) {
+    const button = document.createElement('button');
+    button.className = `btn ${clase} btn-sm`;
+    button.dataset.solicitud = solicitudId;
+    button.dataset.accion = accion;
+    button.textContent = texto;
+    return button;
+}
+
+// Pongo el número de solicitudes pendientes en el contador del título.
+function actualizarContador(pendientes) {
+    const badge = document.getElementById('pendientes-badge');
+    if (badge && typeof pendientes === 'number') {
+        badge.textContent = Math.max(pendientes, 0);
+    }
+}
+
+// Devuelvo las casillas marcadas de la tabla.
+function casillasMarcadas() {
+    return Array.from(document.querySelectorAll('#solicitudes-body .seleccion:checked'));
+}
+
+// Muestro cuántas filas hay marcadas y activo los botones de lote solo si hay alguna.
+function actualizarSeleccion() {
+    const marcadas = casillasMarcadas().length;
+    document.getElementById('seleccion-contador').textContent = marcadas
+        ? `${marcadas} seleccionada${marcadas === 1 ? '' : 's'}`
+        : 'Ninguna seleccionada';
+    document.querySelectorAll('[data-accion-lote]').forEach((button) => { button.disabled = marcadas === 0; });
+}
+
+// Saco una fila de la tabla con la misma animación que uso al procesar una sola solicitud.
+function quitarFila(row) {
+    row.style.transition = 'opacity 0.5s ease';
+    row.style.opacity = '0';
+    setTimeout(() => {
+        row.remove();
+        actualizarSeleccion();
+    }, 500);
+}
+
+// El servidor acepta hasta 200 solicitudes por lote; si hay más marcadas, las mando en varias tandas.
+const SOLICITUDES_POR_LOTE = 200;
+
+// Aprueba o rechaza todas las filas marcadas y deja en la tabla solo las que fallaron.
+async function procesarSeleccionadas(accion) {
+    const casillas = casillasMarcadas();
+    if (!casillas.length) {
+        return;
+    }
+    const confirmationText = accion === 'aprobar'
+        ? `¿Aprobar a ${casillas.length} lancheros?`
+        : `¿Rechazar y eliminar a ${casillas.length} usuarios? Esta acción no se puede deshacer.`;
+    if (!confirm(confirmationText)) {
+        return;
+    }
+
+    // Desactivo los botones mientras trabajo para no mandar el mismo lote dos veces.
+    document.querySelectorAll('[data-accion-lote]').forEach((button) => { button.disabled = true; });
+    let fallidas = 0;
+    try {
+        for (let i = 0; i < casillas.length; i += SOLICITUDES_POR_LOTE) {
+            const lote = casillas.slice(i, i + SOLICITUDES_POR_LOTE);
+            const response = await fetch('/admin/solicitudes/procesar-lote', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    solicitudes: lote.map((casilla) => ({ solicitud_id: casilla.value, accion: accion })),
+                }),
+            });
+            const result = await response.json();
+            if (!result.success) {
+                throw new Error(result.error);
+            }
+
+            // Cada id trae su propio resultado: quito las filas ya resueltas y marco las que fallaron.
+            lote.forEach((casilla) => {
+                const row = casilla.closest('tr');
+                const resultado = result.resultados[casilla.value];
+                if (resultado && resultado.estado !== 'error') {
+                    casilla.checked = false;
+                    quitarFila(row);
+                } else {
+                    fallidas++;
+                    row.classList.add('table-danger');
+                    row.title = resultado ? resultado.error : 'Sin respuesta para esta solicitud.';
+                }
+            });
+            actualizarContador(result.pendientes);
+        }
+        if (fallidas) {
+            alert(`${fallidas} solicitudes no se pudieron procesar. Quedaron marcadas en rojo.`);
+        }
+    } catch (error) {
+        console.error('Error al procesar el lote:', error);
+        alert('Error al procesar las solicitudes: ' + error.message);
+    } finally {
+        document.getElementById('seleccionar-todas').checked = false;
+        // Las filas que fallaron siguen marcadas para poder reintentarlas.
+        actualizarSeleccion();
+    }
+}
+
 // Defino una función que se va a encargar de procesar una solicitud, ya sea para aprobarla o rechazarla.
 async function procesarSolicitud(button, solicitudId, accion) {
     // Encuentro la fila de la tabla (el 'tr') que contiene el botón que apreté.
     const row = button.closest('tr');
     // Preparo el mensaje de confirmación. Si la acción es 'aprobar', muestro un texto; si es 'rechazar', muestro otro.
-    const confirmationText = accion === 'aprobar' 
+    const confirmationText = accion === 'aprobar'
         ? '¿Estás seguro de que quieres aprobar a este lanchero?'
         : '¿Estás seguro de que quieres rechazar y eliminar a este usuario? Esta acción no se puede deshacer.';
 
@@ -44,11 +281,13 @@ async function procesarSolicitud(button, solicitudId, accion) {
 
         // Si el servidor me dice que todo salió bien ('success' es true)...
         if (result.success) {
-            // ...hago que la fila de la tabla desaparezca con una animación suave.
-            row.style.transition = 'opacity 0.5s ease';
-            row.style.opacity = '0';
-            // Y después de medio segundo, elimino la fila por completo de la página.
-            setTimeout(() => row.remove(), 500);
+            // ...hago que la fila de la tabla desaparezca con una animación suave y después la elimino.
+            quitarFila(row);
+            // Descuento esta solicitud del contador sin volver a preguntarle al servidor.
+            const badge = document.getElementById('pendientes-badge');
+            if (badge) {
+                actualizarContador(parseInt(badge.textContent, 10) - 1);
+            }
         } else {
             // Si algo salió mal, muestro una alerta con el error que me devolvió el servidor.
             alert('Error al procesar la solicitud: ' + result.error);
@@ -59,4 +298,4 @@ async function procesarSolicitud(button, solicitudId, accion) {
         // Y le muestro una alerta al usuario.
         alert('Error de conexión al procesar la solicitud.');
     }
-}
\ No newline at end of file
+}
@@ -84,46 +84,57 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
-    // Defino una función para obtener y mostrar los datos del usuario (estadísticas y ranking).
-    async function fetchUserData() {
+    // Pongo en la página las estadísticas del usuario (nombre, kilos, minutos, árboles y CO2).
+    function pintarUsuario(data) {
+        document.getElementById('userName').textContent = data.nombre.split(' ')[0] + '!'; // Muestro solo el primer nombre.
+        document.getElementById('kgTotal').textContent = data.kg_reciclados.toFixed(2) + ' kg'; // Muestro los kilos con 2 decimales.
+        document.getElementById('minutosTotal').textContent = data.minutos; // Muestro los minutos.
+        document.getElementById('arbolesTotal').textContent = data.arboles; // Muestro los árboles salvados.
+        document.getElementById('co2Evitado').textContent = data.co2_evitado.toFixed(1) + ' kg de CO₂'; // Muestro el CO2 con 1 decimal.
+    }
+
+    // Vuelvo a dibujar el ranking con la lista de los mejores usuarios.
+    function pintarRanking(topUsers) {
         // Busco el contenedor donde voy a poner la lista del ranking.
         const rankingContainer = document.getElementById('ranking-list');
+        // Si no existe el contenedor, no hay nada que dibujar.
+        if (!rankingContainer) {
+            return;
+        }
+        // Limpio el contenido actual del ranking.
+        rankingContainer.innerHTML = '';
+        // Y por cada usuario en el top...
+        topUsers.forEach((rankedUser, index) => {
+            // ...creo un nuevo elemento HTML para mostrar su posición, nombre y kilos.
+            const rankItem = `
+                <div class="list-group-item bg-transparent text-white border-secondary d-flex align-items-center py-3">
+                    <div class="ranking-badge me-3">${index + 1}</div>
+                    <div>
+                        ${rankedUser.nombre.split(' ')[0]} 
+                        <strong class="kg-top kg-${index + 1}">${parseFloat(rankedUser.kg_reciclados).toFixed(1)} kg</strong>
+                    </div>
+                </div>
+            `;
+            // Añado este nuevo elemento al contenedor del ranking.
+            rankingContainer.innerHTML += rankItem;
+        });
+    }
+
+    // Defino una función para obtener y mostrar los datos del usuario (estadísticas y ranking) con una petición normal.
+    async function fetchUserData() {
         try {
-            // Añado un parámetro a la URL para evitar que el navegador use una versión guardada (caché) de los datos.
-            const cacheBuster = `?t=${new Date().getTime()}`;
-            // Hago una petición a mi API para obtener los datos del usuario.
-            const response = await fetch(`/api/user${cacheBuster}`);
+            // Hago una petición a mi API para obtener los datos del usuario. El navegador manda solo el ETag que tiene guardado y, si nada cambió, el servidor responde 304 sin cuerpo y se usa la copia guardada.
+            const response = await fetch('/api/user');
             // Convierto la respuesta a un objeto JavaScript.
             const data = await response.json();
 
             // Si la respuesta del servidor fue exitosa...
             if (data.success) {
                 // ...actualizo los elementos en la página con los nuevos datos.
-                document.getElementById('userName').textContent = data.nombre.split(' ')[0] + '!'; // Muestro solo el primer nombre.
-                document.getElementById('kgTotal').textContent = data.kg_reciclados.toFixed(2) + ' kg'; // Muestro los kilos con 2 decimales.
-                document.getElementById('minutosTotal').textContent = data.minutos; // Muestro los minutos.
-                document.getElementById('arbolesTotal').textContent = data.arboles; // Muestro los árboles salvados.
-                document.getElementById('co2Evitado').textContent = data.co2_evitado.toFixed(1) + ' kg de CO₂'; // Muestro el CO2 con 1 decimal.
-
-                // Si recibí la lista de los mejores usuarios y existe el contenedor del ranking...
-                if (data.top_users && rankingContainer) {
-                    // ...limpio el contenido actual del ranking.
-                    rankingContainer.innerHTML = '';
-                    // Y por cada usuario en el top...
-                    data.top_users.forEach((rankedUser, index) => {
-                        // ...creo un nuevo elemento HTML para mostrar su posición, nombre y kilos.
-                        const rankItem = `
-                            <div class="list-group-item bg-transparent text-white border-secondary d-flex align-items-center py-3">
-                                <div class="ranking-badge me-3">${index + 1}</div>
-                                <div>
-                                    ${rankedUser.nombre.split(' ')[0]} 
-                                    <strong class="kg-top kg-${index + 1}">${parseFloat(rankedUser.kg_reciclados).toFixed(1)} kg</strong>
-                                </div>
-                            </div>
-                        `;
-                        // Añado este nuevo elemento al contenedor del ranking.
-                        rankingContainer.innerHTML += rankItem;
-                    });
+                pintarUsuario(data);
+                // Si recibí la lista de los mejores usuarios, redibujo el ranking.
+                if (data.top_users) {
+                    pintarRanking(data.top_users);
                 }
             }
         } catch (error) { // Si algo falla...
@@ -132,6 +143,38 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Guardo el intervalo de respaldo, por si el navegador no puede mantener la conexión en vivo.
+    let intervaloRespaldo = null;
+
+    // Si no hay conexión en vivo, vuelvo a preguntar al servidor cada 10 segundos, como antes.
+    function usarRespaldo() {
+        if (!intervaloRespaldo) {
+            intervaloRespaldo = setInterval(fetchUserData, 10000);
+        }
+    }
+
+    // Me conecto al servidor para que él me avise cuando cambien mis datos o el ranking.
+    // Un solo proceso en el servidor consulta por todos los dashboards abiertos, así que esta pestaña ya no pregunta cada 10 segundos.
+    function escucharCambios() {
+        // Si el navegador no sabe recibir eventos del servidor, uso el respaldo.
+        if (!window.EventSource) {
+            usarRespaldo();
+            return;
+        }
+        // Abro la conexión; si se corta, el navegador reconecta solo.
+        const fuente = new EventSource('/api/user/stream');
+        // Cuando llegan mis estadísticas nuevas, las pinto.
+        fuente.addEventListener('usuario', (event) => pintarUsuario(JSON.parse(event.data)));
+        // Cuando cambia el ranking, lo redibujo.
+        fuente.addEventListener('ranking', (event) => pintarRanking(JSON.parse(event.data)));
+        // Si la conexión quedó cerrada del todo (por ejemplo, se cerró la sesión), paso al respaldo.
+        fuente.addEventListener('error', () => {
+            if (fuente.readyState === EventSource.CLOSED) {
+                usarRespaldo();
+            }
+        });
+    }
+
     // Llamo a la función para que cargue la gráfica de progreso semanal en cuanto se carga la página.
     fetchWeeklyProgress();
 
@@ -142,8 +185,8 @@ document.addEventListener('DOMContentLoaded', () => {
         fetchUserData();
     }
 
-    // Configuro un intervalo para que los datos del usuario se actualicen automáticamente cada 10 segundos.
-    setInterval(fetchUserData, 10000);
+    // Empiezo a escuchar los cambios de mis datos y del ranking en tiempo real.
+    escucharCambios();
 
     // Busco el elemento para mostrar la hora en vivo.
     const liveTimeEl = document.getElementById('liveTime');
@@ -155,31 +198,3 @@ document.addEventListener('DOMContentLoaded', () => {
         }, 1000);
     }
 });
-
-// Defino una función para suscribirme a las actualizaciones en tiempo real de Supabase.
-function subscribeToUpdates() {
-    // Verifico que las variables de Supabase (URL y KEY) existan en la página.
-    if (typeof supabaseUrl !== 'undefined' && typeof supabaseKey !== 'undefined') {
-        // Si existen, creo un cliente de Supabase.
-        const supabase = window.supabase.createClient(supabaseUrl, supabaseKey);
-
-        // Me conecto a un "canal" de Supabase para escuchar cambios.
-        const channel = supabase
-            .channel('public:usuarios') // Escucho específicamente en la tabla 'usuarios'.
-            // Le digo que me avise cuando haya una ACTUALIZACIÓN (UPDATE) en esa tabla.
-            .on('postgres_changes', { event: 'UPDATE', schema: 'public', table: 'usuarios' }, payload => {
-                // Cuando reciba un aviso, muestro un mensaje en la consola.
-                console.log('Cambio detectado en la tabla de usuarios, actualizando dashboard...', payload);
-                // Y llamo a mi función para refrescar los datos del dashboard.
-                fetchUserData(); // Esto es lo que hace que el dashboard sea "en tiempo real".
-            })
-            // Finalmente, me suscribo para empezar a escuchar.
-            .subscribe();
-    }
-}
-
-// Le digo al navegador que llame a la función 'subscribeToUpdates' cuando la página se haya cargado.
-document.addEventListener('DOMContentLoaded', subscribeToUpdates);
-        // Estas líneas las inyecta mi servidor (Flask) en el HTML para pasarle las claves de Supabase al JavaScript.
-        const supabaseUrl = "{{ SUPABASE_URL }}";
-        const supabaseKey = "{{ SUPABASE_KEY }}";
\ No newline at end of file
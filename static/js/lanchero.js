@@ -15,14 +15,27 @@ document.addEventListener('DOMContentLoaded', () => {
     // Defino una función para ir a buscar los reportes al servidor.
     async function fetchReportes() {
         try {
-            // Hago una petición a mi API. Le añado la fecha actual para que la respuesta no se quede en caché.
-            const response = await fetch(`/api/reportes?_=${Date.now()}`);
-            // Si la respuesta del servidor no fue buena (ej: error 404 o 500), lanzo un error.
-            if (!response.ok) {
-                throw new Error('Error al obtener los reportes');
-            }
-            // Convierto la respuesta (que es JSON) a un objeto que pueda usar.
-            const reportes = await response.json();
+            // Aquí junto los reportes de todas las páginas.
+            const reportes = [];
+            // El servidor entrega los reportes por páginas; la primera no lleva cursor.
+            let cursor = null;
+            do {
+                // Hago una petición a mi API pidiendo solo las columnas que muestro en las tarjetas. Si los reportes no cambiaron, el servidor responde 304 (gracias al ETag) y el navegador reutiliza la respuesta guardada.
+                let url = '/api/reportes?fields=kg_reportados,ubicacion_desc,foto_url,foto_thumb_url,usuarios';
+                // Si no es la primera página, le digo desde dónde seguir.
+                if (cursor) {
+                    url += '&cursor=' + encodeURIComponent(cursor);
+                }
+                const response = await fetch(url);
+                // Si la respuesta del servidor no fue buena (ej: error 404 o 500), lanzo un error.
+                if (!response.ok) {
+                    throw new Error('Error al obtener los reportes');
+                }
+                // Convierto la respuesta (que es JSON) a un objeto que pueda usar y la añado a la lista.
+                reportes.push(...await response.json());
+                // Si hay más páginas, el servidor me manda el cursor de la siguiente en este header.
+                cursor = response.headers.get('X-Next-Cursor');
+            } while (cursor);
             // Llamo a la función que se encarga de mostrar estos reportes en la página.
             renderReportes(reportes);
         } catch (error) { // Si algo falló en el 'try'...
@@ -61,7 +74,12 @@ document.addEventListener('DOMContentLoaded', () => {
             
             // Busco la imagen dentro de la tarjeta y le pongo la URL de la foto del reporte. Si no hay foto, pongo una imagen genérica.
             const reporteImagen = clone.querySelector('.reporte-imagen');
-            reporteImagen.src = reporte.foto_url || 'https://via.placeholder.com/300x200.png?text=Sin+Imagen';
+            // En la tarjeta uso la miniatura, que pesa mucho menos; si es una foto vieja sin miniatura, uso la original.
+            reporteImagen.src = reporte.foto_thumb_url || reporte.foto_url || 'https://via.placeholder.com/300x200.png?text=Sin+Imagen';
+            // Guardo la foto original para mostrarla en grande solo cuando la abran.
+            reporteImagen.dataset.full = reporte.foto_url || reporteImagen.src;
+            // Y le digo al navegador que no la descargue hasta que la tarjeta esté cerca de verse.
+            reporteImagen.loading = 'lazy';
 
             // Relleno los demás datos de la tarjeta con la información del reporte.
             clone.querySelector('.reporte-kg').textContent = reporte.kg_reportados;
@@ -99,17 +117,23 @@ document.addEventListener('DOMContentLoaded', () => {
         boton.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Procesando...';
 
         try {
-            // Hago una petición POST al servidor para marcar el reporte como recogido.
-            const response = await fetch(`/api/reporte/recoger/${reporteId}`, { method: 'POST' });
-            // Convierto la respuesta del servidor a un objeto.
-            const result = await response.json();
+            // Marco el reporte como recogido. La clave hace que, si la señal se cae y reintento, no se cuente dos veces.
+            const result = await recogerConReintentos([Number(reporteId)], nuevaClave());
 
             // Si el servidor me dice que todo salió bien...
             if (result.success) {
+                // Sin señal: la recogida quedó en la cola del teléfono y se enviará cuando vuelva la conexión.
+                if (result.encolado) {
+                    alert('Sin señal: la recogida quedó guardada y se enviará cuando vuelva la conexión.');
+                } else if (result.resultados[reporteId] !== 'recogido') {
+                    // Si otro lanchero se me adelantó, le aviso (igual quito la tarjeta, ya no está pendiente).
+                    alert('Este reporte ya lo había recogido otro lanchero.');
+                }
                 // ...elimino la tarjeta del reporte de la pantalla.
                 boton.closest('.col-md-6').remove();
-                // Y vuelvo a pedir la lista de reportes para actualizar el contador.
-                fetchReportes(); 
+                // Y lo quito de mis reportes guardados para actualizar el contador.
+                reportesActuales.delete(Number(reporteId));
+                contadorReportes.textContent = listaReportes.children.length;
             } else {
                 // Si algo salió mal, muestro una alerta con el error.
                 alert(`Error: ${result.error}`);
@@ -117,9 +141,38 @@ document.addEventListener('DOMContentLoaded', () => {
                 boton.disabled = false;
                 boton.innerHTML = '<i class="bi bi-check-lg"></i> Marcar como Recogido';
             }
-        } catch (error) { // Si hubo un error de conexión...
-            // ...lo muestro en la consola.
+        } catch (error) { // Si hubo un error de conexión aun después de los reintentos...
+            // ...lo muestro en la consola y dejo el botón listo para intentarlo otra vez.
             console.error('Error de red:', error);
+            boton.disabled = false;
+            boton.innerHTML = '<i class="bi bi-check-lg"></i> Marcar como Recogido';
+        }
+    }
+
+    // Una clave única para cada recogida; el servidor la usa para reconocer los reintentos.
+    function nuevaClave() {
+        return window.crypto && crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    // Mando los reportes recogidos en una sola petición y, si falla la conexión, reintento con la misma clave esperando 1s, 2s, 4s...
+    async function recogerConReintentos(ids, clave, intentos = 4) {
+        for (let intento = 0; ; intento++) {
+            try {
+                const response = await fetch('/api/reportes/recoger', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json', 'Idempotency-Key': clave },
+                    body: JSON.stringify({ ids: ids })
+                });
+                // Un error del servidor (5xx) también se reintenta; uno de datos (4xx) no.
+                if (response.status < 500 || intento + 1 >= intentos) {
+                    return await response.json();
+                }
+            } catch (error) {
+                if (intento + 1 >= intentos) {
+                    throw error;
+                }
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * (2 ** intento)));
         }
     }
 
@@ -129,16 +182,87 @@ document.addEventListener('DOMContentLoaded', () => {
     imageModal.addEventListener('show.bs.modal', function (event) {
         // ...averigüe qué imagen fue la que activó el modal.
         const triggerImage = event.relatedTarget;
-        // Obtengo la URL de esa imagen.
-        const imageUrl = triggerImage.src;
+        // Obtengo la URL de la foto original (la tarjeta solo muestra la miniatura).
+        const imageUrl = triggerImage.dataset.full || triggerImage.src;
         // Busco el elemento de imagen dentro del modal.
         const modalImageEl = imageModal.querySelector('#modalImage');
         // Y le pongo la URL de la imagen que se clickeó.
         modalImageEl.src = imageUrl;
     });
 
-    // Llamo a la función para que busque los reportes en cuanto se carga la página.
-    fetchReportes();
-    // Y le digo que vuelva a buscar reportes automáticamente cada 15 segundos.
-    setInterval(fetchReportes, 15000);
+    // Aquí guardo los reportes que estoy mostrando, usando su ID como llave.
+    const reportesActuales = new Map();
+
+    // Defino una función que ordena los reportes guardados (los más nuevos primero) y los pinta.
+    function renderReportesActuales() {
+        // Convierto el mapa en una lista y la ordeno por fecha de creación, de la más nueva a la más vieja.
+        const lista = Array.from(reportesActuales.values()).sort((a, b) => (b.created_at || '').localeCompare(a.created_at || ''));
+        // Y uso la misma función de siempre para mostrarlos.
+        renderReportes(lista);
+    }
+
+    // Defino una función para escuchar los cambios que me manda el servidor en tiempo real.
+    function escucharReportes() {
+        // Abro una conexión de eventos (SSE). El navegador se reconecta solo si se cae la señal.
+        const stream = new EventSource('/api/reportes/stream');
+
+        // Cuando llega la foto completa de los reportes pendientes...
+        stream.addEventListener('snapshot', (event) => {
+            // ...vacío lo que tenía guardado.
+            reportesActuales.clear();
+            // Guardo cada reporte que me llegó.
+            JSON.parse(event.data).forEach(reporte => reportesActuales.set(reporte.id, reporte));
+            // Los pinto en la pantalla.
+            renderReportesActuales();
+            // Y oculto el ícono de carga.
+            spinner.style.display = 'none';
+        });
+
+        // Cuando alguien hace un reporte nuevo, lo añado a la lista.
+        stream.addEventListener('nuevo', (event) => {
+            const reporte = JSON.parse(event.data);
+            reportesActuales.set(reporte.id, reporte);
+            renderReportesActuales();
+        });
+
+        // Cuando un reporte ya fue recogido (por mí o por otro lanchero), lo quito de la lista.
+        stream.addEventListener('recogido', (event) => {
+            const { id } = JSON.parse(event.data);
+            reportesActuales.delete(id);
+            renderReportesActuales();
+        });
+
+        // Si hay un error de conexión, EventSource vuelve a intentarlo solo.
+        stream.onerror = (error) => {
+            // Pero si el servidor cerró la conexión del todo (por ejemplo, respondió 204 porque no sirve streams), paso a preguntar cada rato.
+            if (stream.readyState === EventSource.CLOSED) {
+                usarPolling();
+                return;
+            }
+            console.warn('Conexión de reportes interrumpida, reintentando...', error);
+        };
+    }
+
+    // Guardo el intervalo del polling para no crear dos.
+    let intervaloPolling = null;
+
+    // Busco los reportes ahora y después cada 15 segundos.
+    function usarPolling() {
+        if (intervaloPolling) {
+            return;
+        }
+        // Llamo a la función para que busque los reportes en cuanto se carga la página.
+        fetchReportes();
+        // Y le digo que vuelva a buscar reportes automáticamente cada 15 segundos.
+        intervaloPolling = setInterval(fetchReportes, 15000);
+    }
+
+    // Si el navegador sabe recibir eventos del servidor...
+    if (window.EventSource) {
+        // ...me suscribo a los cambios en vez de preguntar cada rato.
+        escucharReportes();
+    } else {
+        // Si no, pregunto cada rato.
+        usarPolling();
+    }
 });
\ No newline at end of file
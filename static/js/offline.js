@@ -0,0 +1,12 @@
+// Registro el service worker que guarda los envíos cuando no hay señal y los manda cuando vuelve.
+if ('serviceWorker' in navigator) {
+    // Lo registro desde la raíz (/sw.js) para que cubra todas las páginas de la app.
+    navigator.serviceWorker.register('/sw.js').catch((error) => console.error('No se pudo registrar el service worker:', error));
+
+    // Le pido que intente mandar la cola apenas se abre la página...
+    navigator.serviceWorker.ready.then((registro) => registro.active && registro.active.postMessage('sincronizar'));
+    // ...y cada vez que el teléfono recupera la conexión.
+    window.addEventListener('online', () => {
+        navigator.serviceWorker.ready.then((registro) => registro.active && registro.active.postMessage('sincronizar'));
+    });
+}
@@ -84,9 +84,14 @@ document.addEventListener('DOMContentLoaded', () => {
             const result = await response.json();
             // Si el servidor me dice que se subió bien...
             if (result.success) {
-                // ...actualizo la imagen del avatar en la página con la nueva URL que me dio el servidor.
-                // Le añado la fecha para evitar problemas de caché del navegador.
-                document.getElementById('avatarImage').src = result.url + '?t=' + new Date().getTime();
+                // Si la foto todavía se está subiendo en el servidor, muestro la copia que tengo en el navegador.
+                if (result.pendiente) {
+                    document.getElementById('avatarImage').src = URL.createObjectURL(file);
+                } else {
+                    // ...si no, actualizo la imagen del avatar en la página con la nueva URL que me dio el servidor.
+                    // Le añado la fecha para evitar problemas de caché del navegador.
+                    document.getElementById('avatarImage').src = result.url + '?t=' + new Date().getTime();
+                }
             } else {
                 // Si no, muestro una alerta con el error.
                 alert(result.error || 'Error al subir la imagen.');
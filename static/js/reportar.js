@@ -1,3 +1,25 @@
+// Apenas se abre la página pido la ubicación del teléfono, así el reporte aparece en el mapa de los lancheros.
+function pedirUbicacion() {
+    // Busco el texto donde informo el estado de la ubicación.
+    const estado = document.getElementById('ubicacionEstado');
+    // Si el navegador no sabe dar la ubicación, el reporte se envía sin coordenadas (la ubicación escrita sigue sirviendo).
+    if (!navigator.geolocation) {
+        return;
+    }
+    estado.textContent = 'Buscando tu ubicación...';
+    navigator.geolocation.getCurrentPosition((posicion) => {
+        // Guardo las coordenadas en los campos ocultos del formulario.
+        document.getElementById('reporteLat').value = posicion.coords.latitude.toFixed(6);
+        document.getElementById('reporteLng').value = posicion.coords.longitude.toFixed(6);
+        estado.textContent = 'Ubicación lista ✓';
+    }, () => {
+        // Si el usuario no da permiso o falla el GPS, sigo sin coordenadas.
+        estado.textContent = 'Sin ubicación: describe el lugar en el campo de ubicación.';
+    }, { enableHighAccuracy: true, timeout: 15000, maximumAge: 60000 });
+}
+
+pedirUbicacion();
+
 // Aquí le digo a mi formulario con el id 'reportarForm' que cuando alguien lo envíe, ejecute esta función.
 document.getElementById('reportarForm').addEventListener('submit', async function(e) {
     // Con esto evito que la página se recargue cuando envío el formulario, que es lo que haría normalmente.
@@ -31,8 +53,13 @@ document.getElementById('reportarForm').addEventListener('submit', async functio
 
         // Si el servidor me dice en su respuesta que todo salió bien ('success' es true)...
         if (result.success) {
-            // ...llamo a mi función para mostrar una alerta de éxito.
-            showAlert('¡Reporte enviado con éxito! El lanchero ha sido notificado.', 'success');
+            // Si no había señal, el reporte quedó guardado en el teléfono y se enviará solo cuando vuelva la conexión.
+            if (result.encolado) {
+                showAlert('Sin señal: tu reporte quedó guardado y se enviará cuando vuelva la conexión.', 'warning');
+            } else {
+                // ...llamo a mi función para mostrar una alerta de éxito.
+                showAlert('¡Reporte enviado con éxito! El lanchero ha sido notificado.', 'success');
+            }
             // Limpio todos los campos del formulario.
             form.reset();
             // Espero 2 segundos y después redirijo al usuario a su panel de control (dashboard).
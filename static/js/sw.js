@@ -0,0 +1,222 @@
+// Service worker de Chocó Limpio. Se sirve desde /sw.js para poder atender todas las páginas.
+// Cuando no hay señal, guarda los reportes y las recogidas en una cola (IndexedDB) y los manda
+// después, todos juntos, en una sola petición a /api/sync. Si falla, reintenta esperando cada vez más.
+
+// El nombre de mi base de datos local y de la tabla donde guardo la cola.
+const DB_NOMBRE = 'chocolimpio-cola';
+const DB_TABLA = 'operaciones';
+// Cuántas operaciones mando como máximo en cada sincronización (el servidor acepta hasta 50).
+const OPS_POR_SYNC = 50;
+// La espera entre reintentos empieza en 5 segundos y nunca pasa de 5 minutos.
+const ESPERA_INICIAL = 5000;
+const ESPERA_MAXIMA = 5 * 60 * 1000;
+
+// Guardo si ya hay una sincronización en curso, para no lanzar dos al mismo tiempo.
+let sincronizando = null;
+// El temporizador del próximo reintento y cuántos fallos seguidos llevo.
+let proximoIntento = null;
+let fallosSeguidos = 0;
+
+// Apenas se instala, tomo el control sin esperar a que se cierren las pestañas viejas.
+self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', (event) => {
+    event.waitUntil(self.clients.claim().then(() => sincronizar()));
+});
+
+// Solo intercepto los dos envíos que se pueden hacer sin señal; todo lo demás pasa directo.
+self.addEventListener('fetch', (event) => {
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'POST' || url.origin !== self.location.origin) {
+        return;
+    }
+    if (url.pathname === '/reportar') {
+        event.respondWith(enviarReporte(event.request));
+    } else if (url.pathname === '/api/reportes/recoger') {
+        event.respondWith(enviarRecogida(event.request));
+    }
+});
+
+// Las páginas me avisan cuando vuelve la conexión (o cuando se abren) para que intente enseguida.
+self.addEventListener('message', (event) => {
+    if (event.data === 'sincronizar') {
+        event.waitUntil(sincronizar());
+    }
+});
+
+// Si el navegador soporta Background Sync, también me despierta él cuando vuelve la señal.
+self.addEventListener('sync', (event) => {
+    if (event.tag === 'chocolimpio-cola') {
+        event.waitUntil(sincronizar());
+    }
+});
+
+// Un reporte nuevo: le pongo una clave para que, si se repite, el servidor no lo cree dos veces.
+async function enviarReporte(request) {
+    const form = await request.formData();
+    const clave = form.get('clave') || nuevaClave();
+    form.set('clave', clave);
+    try {
+        // Intento mandarlo normalmente.
+        return await fetch(request.url, { method: 'POST', body: form, credentials: 'same-origin' });
+    } catch (error) {
+        // Sin señal: lo guardo en la cola con su foto y le respondo a la página que quedó pendiente.
+        await encolar({
+            clave: clave,
+            tipo: 'reporte',
+            datos: { kg: form.get('kg'), ubicacion: form.get('ubicacion'), lat: form.get('lat'), lng: form.get('lng') },
+            foto: form.get('foto'),
+        });
+        return respuestaEncolada({ pendiente: true });
+    }
+}
+
+// Una recogida: la página ya manda su propia clave en el header Idempotency-Key.
+async function enviarRecogida(request) {
+    const copia = request.clone();
+    try {
+        return await fetch(request);
+    } catch (error) {
+        const cuerpo = await copia.json();
+        await encolar({
+            clave: copia.headers.get('Idempotency-Key') || nuevaClave(),
+            tipo: 'recoger',
+            datos: { ids: cuerpo.ids },
+        });
+        return respuestaEncolada({ resultados: {}, recogidos: [] });
+    }
+}
+
+// La respuesta que le doy a la página cuando algo quedó en la cola (202 = aceptado, se hará después).
+function respuestaEncolada(extra) {
+    return new Response(JSON.stringify({ success: true, encolado: true, ...extra }), {
+        status: 202,
+        headers: { 'Content-Type': 'application/json' },
+    });
+}
+
+// Guardo una operación en la cola y programo un intento de envío.
+async function encolar(op) {
+    op.creado = Date.now();
+    const db = await abrirDB();
+    await transaccion(db, 'readwrite', (tabla) => tabla.put(op));
+    if (self.registration.sync) {
+        // Si no se puede registrar (permiso, navegador), me quedo con los reintentos propios.
+        self.registration.sync.register('chocolimpio-cola').catch(() => {});
+    }
+    programarReintento();
+}
+
+// Manda la cola al servidor en una sola petición. Devuelve cuando termina (bien o mal).
+function sincronizar() {
+    if (!sincronizando) {
+        sincronizando = enviarCola().finally(() => { sincronizando = null; });
+    }
+    return sincronizando;
+}
+
+async function enviarCola() {
+    const db = await abrirDB();
+    // Leo la cola en el orden en que se guardó.
+    const ops = (await transaccion(db, 'readonly', (tabla) => tabla.getAll()))
+        .sort((a, b) => a.creado - b.creado)
+        .slice(0, OPS_POR_SYNC);
+    if (!ops.length) {
+        fallosSeguidos = 0;
+        return;
+    }
+
+    // Armo la petición: la lista de operaciones en JSON y cada foto como un archivo aparte.
+    const form = new FormData();
+    const lista = ops.map((op, i) => {
+        const item = { clave: op.clave, tipo: op.tipo, datos: op.datos };
+        if (op.foto) {
+            item.foto = `foto_${i}`;
+            form.append(item.foto, op.foto, `${op.clave}.jpg`);
+        }
+        return item;
+    });
+    form.append('ops', JSON.stringify(lista));
+
+    let resultado;
+    try {
+        const response = await fetch('/api/sync', { method: 'POST', body: form, credentials: 'same-origin' });
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        resultado = await response.json();
+    } catch (error) {
+        // Sin señal o servidor caído: lo intento más tarde.
+        fallosSeguidos++;
+        programarReintento();
+        return;
+    }
+
+    // Quito de la cola lo que ya se aplicó (o que nunca se podrá aplicar); lo demás se queda.
+    let quedanPendientes = false;
+    // Si el servidor dijo cuánto esperar (por el límite de reportes), no vuelvo antes de eso.
+    let esperaMinima = 0;
+    for (const item of resultado.resultados) {
+        if (item.estado === 'error' && item.reintentar) {
+            quedanPendientes = true;
+            esperaMinima = Math.max(esperaMinima, (item.retry_after || 0) * 1000);
+            continue;
+        }
+        await transaccion(db, 'readwrite', (tabla) => tabla.delete(item.clave));
+    }
+    await avisarPaginas(resultado.resultados);
+
+    fallosSeguidos = quedanPendientes ? fallosSeguidos + 1 : 0;
+    const restantes = await transaccion(db, 'readonly', (tabla) => tabla.count());
+    if (restantes) {
+        // Si quedó algo (porque había más de OPS_POR_SYNC o hubo errores temporales), sigo después.
+        programarReintento(quedanPendientes ? undefined : 0, esperaMinima);
+    }
+}
+
+// Espero 5s, 10s, 20s... (con un poco de azar para que no reintenten todos a la vez) y vuelvo a intentar.
+function programarReintento(espera, esperaMinima = 0) {
+    if (proximoIntento) {
+        clearTimeout(proximoIntento);
+    }
+    if (espera === undefined) {
+        espera = Math.min(ESPERA_INICIAL * (2 ** fallosSeguidos), ESPERA_MAXIMA) * (0.8 + Math.random() * 0.4);
+    }
+    // Nunca antes de lo que pidió el servidor.
+    espera = Math.max(espera, esperaMinima);
+    proximoIntento = setTimeout(() => {
+        proximoIntento = null;
+        sincronizar();
+    }, espera);
+}
+
+// Les cuento a las páginas abiertas qué se sincronizó, por si quieren actualizar lo que muestran.
+async function avisarPaginas(resultados) {
+    const paginas = await self.clients.matchAll({ type: 'window' });
+    for (const pagina of paginas) {
+        pagina.postMessage({ tipo: 'sincronizado', resultados: resultados });
+    }
+}
+
+function nuevaClave() {
+    return self.crypto && crypto.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+// Abro (o creo la primera vez) la base de datos local con la tabla de la cola.
+function abrirDB() {
+    return new Promise((resolve, reject) => {
+        const pedido = indexedDB.open(DB_NOMBRE, 1);
+        pedido.onupgradeneeded = () => pedido.result.createObjectStore(DB_TABLA, { keyPath: 'clave' });
+        pedido.onsuccess = () => resolve(pedido.result);
+        pedido.onerror = () => reject(pedido.error);
+    });
+}
+
+// Ejecuta una operación sobre la tabla de la cola y devuelve su resultado.
+function transaccion(db, modo, operacion) {
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(DB_TABLA, modo);
+        const pedido = operacion(tx.objectStore(DB_TABLA));
+        tx.oncomplete = () => resolve(pedido.result);
+        tx.onerror = () => reject(tx.error);
+    });
+}
@@ -0,0 +1,33 @@
+-- Acumulados diarios de kg recogidos por usuario.
+-- Cada fila es un día en la zona horaria de la app (APP_TIMEZONE, por defecto America/Bogota).
+-- La carga inicial tiene que usar la misma zona que APP_TIMEZONE, o los días viejos quedarían
+-- partidos distinto que los nuevos. La toma de app.timezone; si la app usa otra zona, antes de
+-- aplicar esta migración: alter database postgres set app.timezone = '<APP_TIMEZONE>';
+create table if not exists public.progreso_diario (
+    user_id uuid not null references public.usuarios(id) on delete cascade,
+    dia date not null,
+    kg numeric(10, 2) not null default 0,
+    reportes integer not null default 0,
+    primary key (user_id, dia)
+);
+
+alter table public.progreso_diario enable row level security;
+
+create policy "progreso_diario_select_own" on public.progreso_diario
+    for select using (auth.uid() = user_id);
+
+-- Carga inicial con los reportes que ya estaban recogidos.
+with zona as (
+    select coalesce(nullif(current_setting('app.timezone', true), ''), 'America/Bogota') as nombre
+)
+insert into public.progreso_diario (user_id, dia, kg, reportes)
+select r.user_id,
+       (r.created_at at time zone zona.nombre)::date,
+       sum(r.kg_reportados),
+       count(*)
+from public.reportes r, zona
+where r.recogido = true
+group by r.user_id, 2
+on conflict (user_id, dia) do update
+    set kg = excluded.kg,
+        reportes = excluded.reportes;
@@ -0,0 +1,4 @@
+-- Miniaturas generadas al subir fotos. Si son nulas (fotos antiguas) la app usa la URL original.
+alter table public.reportes add column if not exists foto_thumb_url text;
+alter table public.usuarios add column if not exists avatar_thumb_url text;
+alter table public.usuarios add column if not exists foto_lancha_thumb_url text;
@@ -0,0 +1,20 @@
+-- Ids de auth.users por páginas, ordenados por id, para reconciliarlos con public.usuarios
+-- (limpiar_registros en eliminar_usuarios.py). La API de admin de Auth no permite ordenar
+-- ni paginar por llave, por eso se lee la tabla directamente.
+create or replace function public.listar_auth_ids(p_despues uuid default null, p_limite integer default 1000)
+returns table (id uuid, email text)
+language sql
+stable
+security definer
+set search_path = ''
+as $$
+    select u.id, u.email::text
+    from auth.users u
+    where p_despues is null or u.id > p_despues
+    order by u.id
+    limit least(greatest(p_limite, 1), 5000);
+$$;
+
+-- Solo la llave service_role (la de la herramienta de administración) puede llamarla.
+revoke all on function public.listar_auth_ids(uuid, integer) from public, anon, authenticated;
+grant execute on function public.listar_auth_ids(uuid, integer) to service_role;
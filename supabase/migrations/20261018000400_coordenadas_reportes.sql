@@ -0,0 +1,10 @@
+-- Coordenadas del lugar del reporte (las toma el navegador al reportar). Son opcionales:
+-- los reportes antiguos o sin permiso de ubicación siguen teniendo solo ubicacion_desc.
+alter table public.reportes add column if not exists lat double precision;
+alter table public.reportes add column if not exists lng double precision;
+
+alter table public.reportes drop constraint if exists reportes_coordenadas_validas;
+alter table public.reportes add constraint reportes_coordenadas_validas check (
+    (lat is null and lng is null)
+    or (lat between -90 and 90 and lng between -180 and 180)
+);
@@ -0,0 +1,112 @@
+-- Recogida de varios reportes en una sola transacción (POST /api/reportes/recoger).
+-- Un reporte solo se puede reclamar si sigue sin recoger, así dos lancheros nunca se
+-- quedan con el mismo. Los kg y minutos del usuario y el progreso diario se suman en
+-- la misma sentencia.
+
+-- Antes la app solo marcaba recogido = true. Ni chocolimpio_db_.sql ni estas migraciones
+-- definen un trigger sobre reportes que sume kg_reciclados o minutos, así que no hay
+-- ninguno que quitar por nombre. Si en una base se creó uno a mano, con esta función cada
+-- recogida contaría doble; en vez de adivinar cuál es y borrarlo, la migración se detiene
+-- y dice cuáles encontró, para quitarlos por nombre en una migración aparte.
+do $$
+declare
+    v_triggers text;
+begin
+    select string_agg(format('%I (%I)', tg.tgname, p.proname), ', ')
+    into v_triggers
+    from pg_trigger tg
+    join pg_proc p on p.oid = tg.tgfoid
+    where tg.tgrelid = 'public.reportes'::regclass
+      and not tg.tgisinternal
+      and p.prosrc ilike '%kg_reciclados%';
+    if v_triggers is not null then
+        raise exception 'recoger_reportes() ya suma kg_reciclados y minutos; estos triggers sobre reportes los sumarían otra vez: %', v_triggers;
+    end if;
+end;
+$$;
+
+-- El progreso diario también se suma aquí; la función de una fila por llamada ya no se usa.
+drop function if exists public.sumar_progreso_diario(uuid, date, numeric);
+
+-- Respuestas ya dadas por clave de idempotencia: un reintento con la misma clave
+-- devuelve el mismo resultado sin volver a sumar nada.
+create table if not exists public.recogidas_idempotencia (
+    lanchero_id uuid not null,
+    clave text not null,
+    resultado jsonb not null,
+    creado timestamptz not null default now(),
+    primary key (lanchero_id, clave)
+);
+
+create index if not exists recogidas_idempotencia_creado_idx on public.recogidas_idempotencia (creado);
+
+alter table public.recogidas_idempotencia enable row level security;
+
+create or replace function public.recoger_reportes(
+    p_lanchero uuid,
+    p_ids bigint[],
+    p_clave text default null,
+    p_zona text default 'America/Bogota',
+    p_minutos_por_kg numeric default 15
+)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_resultado jsonb;
+begin
+    if p_clave is not null then
+        -- Dos reintentos simultáneos con la misma clave esperan aquí al primero.
+        perform pg_advisory_xact_lock(hashtextextended(p_lanchero::text || ':' || p_clave, 0));
+        select resultado into v_resultado
+        from public.recogidas_idempotencia
+        where lanchero_id = p_lanchero and clave = p_clave;
+        if found then
+            return v_resultado || jsonb_build_object('repetido', true);
+        end if;
+    end if;
+
+    with reclamados as (
+        update public.reportes
+        set recogido = true
+        where id = any(p_ids) and recogido = false
+        returning id, user_id, kg_reportados, created_at
+    ), por_usuario as (
+        update public.usuarios u
+        set kg_reciclados = coalesce(u.kg_reciclados, 0) + t.kg,
+            minutos = coalesce(u.minutos, 0) + round(t.kg * p_minutos_por_kg)::integer
+        from (select user_id, sum(kg_reportados) as kg from reclamados group by user_id) t
+        where u.id = t.user_id
+        returning u.id, u.kg_reciclados, u.minutos
+    ), por_dia as (
+        insert into public.progreso_diario (user_id, dia, kg, reportes)
+        select user_id, (created_at at time zone p_zona)::date, sum(kg_reportados), count(*)
+        from reclamados
+        group by 1, 2
+        on conflict (user_id, dia) do update
+            set kg = progreso_diario.kg + excluded.kg,
+                reportes = progreso_diario.reportes + excluded.reportes
+        returning 1
+    )
+    select jsonb_build_object(
+        'recogidos', coalesce((select jsonb_agg(jsonb_build_object(
+            'id', r.id, 'user_id', r.user_id, 'kg_reportados', r.kg_reportados)) from reclamados r), '[]'::jsonb),
+        'usuarios', coalesce((select jsonb_agg(jsonb_build_object(
+            'id', p.id, 'kg_reciclados', p.kg_reciclados, 'minutos', p.minutos)) from por_usuario p), '[]'::jsonb),
+        'dias', (select count(*) from por_dia)
+    ) into v_resultado;
+
+    if p_clave is not null then
+        insert into public.recogidas_idempotencia (lanchero_id, clave, resultado)
+        values (p_lanchero, p_clave, v_resultado);
+        -- Las claves solo hacen falta mientras el cliente pueda reintentar.
+        delete from public.recogidas_idempotencia where creado < now() - interval '2 days';
+    end if;
+
+    return v_resultado || jsonb_build_object('repetido', false);
+end;
+$$;
+
+-- Suma kg y minutos a cualquier usuario: solo la llama la app, con la llave service_role.
+revoke all on function public.recoger_reportes(uuid, bigint[], text, text, numeric) from public, anon, authenticated;
+grant execute on function public.recoger_reportes(uuid, bigint[], text, text, numeric) to service_role;
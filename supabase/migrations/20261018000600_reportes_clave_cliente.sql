@@ -0,0 +1,6 @@
+-- Clave que genera el navegador para cada reporte. Si el mismo reporte llega dos veces
+-- (reintento sin señal, cola de sincronización), la segunda vez no crea otra fila.
+alter table public.reportes add column if not exists clave_cliente text;
+
+alter table public.reportes drop constraint if exists reportes_user_clave_cliente_key;
+alter table public.reportes add constraint reportes_user_clave_cliente_key unique (user_id, clave_cliente);
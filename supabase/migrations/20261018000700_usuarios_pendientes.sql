@@ -0,0 +1,5 @@
+-- Cola de revisión del admin (/admin/solicitudes): páginas por id y el contador de
+-- pendientes leen solo este índice, aunque la tabla de usuarios sea grande.
+create index if not exists usuarios_pendientes_idx
+    on public.usuarios (id)
+    where rol = 'lanchero_pendiente';
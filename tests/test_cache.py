@@ -0,0 +1,104 @@
+import pytest
+
+import cache
+from cache import ProfileCache, TTLCache
+
+
+class Reloj:
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(cache.time, 'monotonic', reloj)
+    return reloj
+
+
+def test_entrada_vence_con_el_ttl(reloj):
+    datos = TTLCache(ttl=10)
+    datos.set('rol', 'admin')
+    reloj.ahora += 9.9
+    assert datos.get('rol') == 'admin'
+    reloj.ahora += 0.1
+    assert datos.get('rol') is None
+    assert len(datos) == 0
+    assert (datos.hits, datos.misses) == (1, 1)
+
+
+def test_ttl_por_entrada(reloj):
+    datos = TTLCache(ttl=10)
+    datos.set('corto', 1, ttl=1)
+    datos.set('largo', 2)
+    reloj.ahora += 5
+    assert datos.get('corto') is None
+    assert datos.get('largo') == 2
+
+
+def test_ttl_cero_no_guarda(reloj):
+    datos = TTLCache(ttl=0)
+    datos.set('rol', 'admin')
+    assert datos.get('rol') is None
+    cargas = []
+    assert datos.get_or_set('rol', lambda: cargas.append(1) or 'admin') == 'admin'
+    assert datos.get_or_set('rol', lambda: cargas.append(1) or 'admin') == 'admin'
+    assert len(cargas) == 2
+
+
+def test_desalojo_lru(reloj):
+    datos = TTLCache(maxsize=2, ttl=60)
+    datos.set('a', 1)
+    datos.set('b', 2)
+    datos.get('a')
+    datos.set('c', 3)
+    assert datos.get('b') is None
+    assert (datos.get('a'), datos.get('c')) == (1, 3)
+
+
+class RedisEnMemoria:
+    # Lo que ProfileCache usa de RedisBackend, compartido entre "workers" del mismo test.
+
+    def __init__(self):
+        self.datos = {}
+
+    def get(self, key):
+        return self.datos.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.datos[key] = value
+
+    def delete(self, key):
+        self.datos.pop(key, None)
+
+    def incr(self, key):
+        self.datos[key] = self.datos.get(key, 0) + 1
+        return self.datos[key]
+
+
+def test_perfil_escrito_en_otro_worker_no_se_sirve_viejo(reloj):
+    base = {'u1': {'nombre': 'Ana', 'kg_reciclados': 1}}
+    redis = RedisEnMemoria()
+    worker_a = ProfileCache(lambda user_id: dict(base[user_id]), backend=redis)
+    worker_b = ProfileCache(lambda user_id: dict(base[user_id]), backend=redis)
+    assert worker_a.get('u1')['kg_reciclados'] == 1
+    assert worker_b.get('u1')['kg_reciclados'] == 1
+
+    base['u1']['kg_reciclados'] = 5
+    worker_b.actualizar('u1', {'kg_reciclados': 5})
+    assert worker_a.get('u1')['kg_reciclados'] == 5
+    assert worker_a.stale_reads == 1
+    assert worker_a.loads == 1
+
+
+def test_perfil_sin_backend_con_ttl_cero_siempre_lee_la_fuente(reloj):
+    base = {'u1': {'nombre': 'Ana'}}
+    perfiles = ProfileCache(lambda user_id: dict(base[user_id]), ttl=0)
+    assert perfiles.get('u1')['nombre'] == 'Ana'
+    base['u1']['nombre'] = 'Ana María'
+    assert perfiles.get('u1')['nombre'] == 'Ana María'
+    assert perfiles.loads == 2
@@ -0,0 +1,69 @@
+from eliminar_usuarios import archivos_de_usuarios, diferencias
+
+
+def filas(*ids):
+    return iter([{'id': i} for i in ids])
+
+
+def test_diferencias_entre_listas_ordenadas():
+    resultado = list(diferencias(filas('a', 'b', 'd', 'f'), filas('b', 'c', 'd', 'e')))
+    assert [(lado, fila['id']) for lado, fila in resultado] == [
+        ('perfil', 'a'), ('cuenta', 'c'), ('cuenta', 'e'), ('perfil', 'f'),
+    ]
+
+
+def test_diferencias_con_un_lado_vacio():
+    assert [f['id'] for _, f in diferencias(filas(), filas('a', 'b'))] == ['a', 'b']
+    assert [f['id'] for _, f in diferencias(filas('a'), filas())] == ['a']
+    assert list(diferencias(filas('a', 'b'), filas('a', 'b'))) == []
+
+
+def test_diferencias_lee_de_a_una_fila():
+    # Con la cuenta 'z' al frente, los perfiles se recorren sin leer más cuentas.
+    leidas = []
+
+    def cuentas():
+        for i in ('z',):
+            leidas.append(i)
+            yield {'id': i}
+
+    perfiles = diferencias(filas('a', 'b', 'c'), cuentas())
+    assert next(perfiles) == ('perfil', {'id': 'a'})
+    assert leidas == ['z']
+
+
+class Carpeta:
+
+    def __init__(self, nombres):
+        self._nombres = nombres
+
+    def list(self, carpeta, opciones):
+        return [{'name': n} for n in self._nombres[opciones['offset']:opciones['offset'] + opciones['limit']]]
+
+
+class Storage:
+
+    def __init__(self, buckets):
+        self._buckets = buckets
+
+    def from_(self, bucket):
+        return Carpeta(self._buckets.get(bucket, []))
+
+
+class Cliente:
+
+    def __init__(self, buckets):
+        self.storage = Storage(buckets)
+
+
+def test_archivos_de_usuarios_con_cualquier_extension_y_miniaturas():
+    cliente = Cliente({
+        'avatars': ['u1.png', 'u1_128.jpg', 'u2.jpg', 'u10.jpg'],
+        'reportes_fotos': ['u1_1700000000_5.jpg', 'u1_1700000000_5_320.jpg', 'u2_1700000000_6.jpg'],
+    })
+    archivos = archivos_de_usuarios(cliente, ['u1'], {'u1': 'public/u1_lancha.jpg', 'u2': 'public/u2_lancha.jpg'})
+    assert archivos == {
+        'avatars': ['public/u1.png', 'public/u1_128.jpg'],
+        'reportes_fotos': ['public/u1_1700000000_5.jpg', 'public/u1_1700000000_5_320.jpg'],
+        'lanchas_fotos': ['public/u1_lancha.jpg', 'public/u1_lancha_320.jpg'],
+    }
@@ -0,0 +1,64 @@
+from geo_index import GridIndex
+
+
+def reporte(i, lat, lng, kg=1):
+    return {'id': i, 'lat': lat, 'lng': lng, 'kg_reportados': kg}
+
+
+def ids(reportes):
+    return sorted(r['id'] for r in reportes)
+
+
+def test_bordes_de_celda_y_del_rectangulo_se_incluyen():
+    indice = GridIndex(celda=1.0)
+    indice.insertar(reporte(1, 1.0, 1.0))    # justo en la esquina de cuatro celdas
+    indice.insertar(reporte(2, 0.999, 0.999))
+    indice.insertar(reporte(3, 2.0, 2.0))
+    assert ids(indice.consultar(1.0, 1.0, 2.0, 2.0)) == [1, 3]
+    assert ids(indice.consultar(0.5, 0.5, 1.0, 1.0)) == [1, 2]
+    assert ids(indice.consultar(1.0001, 1.0001, 1.9999, 1.9999)) == []
+
+
+def test_coordenadas_negativas():
+    indice = GridIndex(celda=0.01)
+    indice.insertar(reporte(1, 5.69, -76.65))
+    indice.insertar(reporte(2, -0.005, -0.005))
+    assert ids(indice.consultar(5.68, -76.66, 5.70, -76.64)) == [1]
+    assert ids(indice.consultar(-0.01, -0.01, 0, 0)) == [2]
+
+
+def test_rectangulo_enorme_recorre_las_celdas_ocupadas():
+    indice = GridIndex(celda=0.01)
+    indice.insertar(reporte(1, 5.69, -76.65))
+    indice.insertar(reporte(2, 40.0, 10.0))
+    assert ids(indice.consultar(-90, -180, 90, 180)) == [1, 2]
+    assert ids(indice.consultar(0, -180, 10, 0)) == [1]
+
+
+def test_mover_y_quitar():
+    indice = GridIndex(celda=1.0)
+    indice.insertar(reporte(1, 0.5, 0.5))
+    indice.insertar(reporte(1, 3.5, 3.5))
+    assert indice.consultar(0, 0, 1, 1) == []
+    assert ids(indice.consultar(3, 3, 4, 4)) == [1]
+    indice.escuchar_feed('recogido', {'id': 1})
+    assert indice.stats() == {'reportes': 0, 'celdas': 0, 'celda_grados': 1.0}
+
+
+def test_sin_coordenadas_no_entra_y_se_quita():
+    indice = GridIndex()
+    indice.insertar(reporte(1, 5.0, -76.0))
+    assert not indice.insertar({'id': 1, 'lat': None, 'lng': None})
+    assert indice.stats()['reportes'] == 0
+
+
+def test_agrupar_segun_zoom():
+    indice = GridIndex()
+    indice.insertar(reporte(1, 5.6900, -76.6500, kg=2))
+    indice.insertar(reporte(2, 5.6901, -76.6501, kg=3))
+    indice.insertar(reporte(3, 6.5, -77.5))
+    sueltos, grupos = indice.agrupar(5, -78, 7, -76, zoom=8)
+    assert ids(sueltos) == [3]
+    assert [(g['cantidad'], g['kg']) for g in grupos] == [(2, 5.0)]
+    sueltos, grupos = indice.agrupar(5, -78, 7, -76, zoom=16)
+    assert ids(sueltos) == [1, 2, 3] and grupos == []
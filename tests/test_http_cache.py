@@ -0,0 +1,68 @@
+import pytest
+from flask import Flask, jsonify, request, url_for
+
+from http_cache import agregar_huella, aplicar_politica, con_etag, etag_de, no_modificado, politica
+
+
+@pytest.fixture
+def app(tmp_path):
+    (tmp_path / 'app.js').write_text('console.log(1);')
+    app = Flask(__name__, static_folder=str(tmp_path), static_url_path='/static')
+    datos = {'kg': 1}
+
+    @app.route('/api/datos')
+    @politica('revalidar')
+    def api_datos():
+        etag = etag_de(datos)
+        return no_modificado(request, etag) or con_etag(jsonify(datos), etag)
+
+    @app.route('/pagina')
+    def pagina():
+        return 'hola'
+
+    @app.after_request
+    def politica_de_cache(response):
+        return aplicar_politica(app, request, response)
+
+    app.url_defaults(agregar_huella(app))
+    app.datos = datos
+    return app
+
+
+def test_etag_depende_solo_del_contenido():
+    assert etag_de({'a': 1, 'b': 2}) == etag_de({'b': 2, 'a': 1})
+    assert etag_de({'a': 1}) != etag_de({'a': 2})
+    assert etag_de('a', 'b') != etag_de('ab')
+
+
+def test_304_mientras_no_cambie(app):
+    cliente = app.test_client()
+    primera = cliente.get('/api/datos')
+    assert primera.status_code == 200
+    assert primera.headers['Cache-Control'] == 'private, no-cache'
+    assert primera.headers['Vary'] == 'Cookie'
+    etag = primera.headers['ETag']
+
+    repetida = cliente.get('/api/datos', headers={'If-None-Match': etag})
+    assert repetida.status_code == 304
+    assert repetida.data == b''
+    assert repetida.headers['ETag'] == etag
+
+    app.datos['kg'] = 2
+    cambiada = cliente.get('/api/datos', headers={'If-None-Match': etag})
+    assert cambiada.status_code == 200
+    assert cambiada.headers['ETag'] != etag
+
+
+def test_vistas_sin_politica_no_se_guardan(app):
+    respuesta = app.test_client().get('/pagina')
+    assert respuesta.headers['Cache-Control'].startswith('no-store')
+
+
+def test_estaticos_con_huella_son_inmutables(app):
+    with app.test_request_context():
+        url = url_for('static', filename='app.js')
+    assert '?v=' in url
+    cliente = app.test_client()
+    assert 'immutable' in cliente.get(url).headers['Cache-Control']
+    assert cliente.get('/static/app.js?v=vieja').headers['Cache-Control'] == 'public, max-age=300'
@@ -0,0 +1,37 @@
+from leaderboard import Leaderboard
+
+
+class RedisCaido:
+
+    def get(self, key):
+        raise ConnectionError('redis caído')
+
+    def set(self, key, value, ttl=None):
+        raise ConnectionError('redis caído')
+
+    def add(self, key, value, ttl=None):
+        raise ConnectionError('redis caído')
+
+    def delete(self, key):
+        raise ConnectionError('redis caído')
+
+
+def test_sin_redis_consulta_y_despues_usa_la_foto_local():
+    consultas = []
+
+    def cargar(n):
+        consultas.append(n)
+        return [{'nombre': 'Ana', 'kg_reciclados': 5.0}]
+
+    tabla = Leaderboard(cargar, size=10, interval=60, backend=RedisCaido())
+    assert tabla.top(3) == [{'nombre': 'Ana', 'kg_reciclados': 5.0}]
+    assert tabla.top(3) == [{'nombre': 'Ana', 'kg_reciclados': 5.0}]
+    assert consultas == [10]
+
+
+def test_con_foto_vencida_y_redis_caido_sirve_la_foto_local():
+    tabla = Leaderboard(lambda n: [{'nombre': 'Ana'}], interval=60, backend=RedisCaido())
+    tabla.top()
+    tabla._snapshot['ts'] -= 120
+    tabla._cargar = lambda n: [{'nombre': 'Luis'}]
+    assert tabla.top() == [{'nombre': 'Ana'}]
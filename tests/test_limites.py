@@ -0,0 +1,79 @@
+import pytest
+
+import limites
+from limites import BucketsLocales, Limitador, leer_limite, reglas_desde_entorno
+
+
+class Reloj:
+
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(limites.time, 'monotonic', reloj)
+    return reloj
+
+
+def test_leer_limite():
+    limite = leer_limite('10/60')
+    assert (limite.capacidad, limite.por_segundo) == (10, 10 / 60)
+    assert leer_limite('off') is None and leer_limite('') is None
+    with pytest.raises(ValueError):
+        leer_limite('0/10')
+
+
+def test_reglas_desde_entorno():
+    por_defecto = {'login': {'ip': '30/300', 'usuario': '5/300'}}
+    reglas = reglas_desde_entorno(por_defecto, environ={'RATE_LIMIT_LOGIN_IP': '2/10', 'RATE_LIMIT_LOGIN_USUARIO': 'off'})
+    assert list(reglas['login']) == ['ip']
+    assert reglas['login']['ip'].capacidad == 2
+    assert reglas_desde_entorno(por_defecto, environ={'RATE_LIMIT_ENABLED': '0'}) == {}
+
+
+def test_bucket_se_vacia_y_se_vuelve_a_llenar(reloj):
+    buckets = BucketsLocales()
+    assert [buckets.tomar_token('k', 2, 1.0) for _ in range(3)] == [0.0, 0.0, 1.0]
+    reloj.ahora += 0.5
+    assert buckets.tomar_token('k', 2, 1.0) == pytest.approx(0.5)
+    reloj.ahora += 0.5
+    assert buckets.tomar_token('k', 2, 1.0) == 0.0
+    # Nunca se llena por encima de la capacidad.
+    reloj.ahora += 100
+    assert [buckets.tomar_token('k', 2, 1.0) for _ in range(3)] == [0.0, 0.0, 1.0]
+
+
+def test_buckets_locales_desalojan_los_mas_viejos(reloj):
+    buckets = BucketsLocales(maxsize=2)
+    for key in ('a', 'b', 'c'):
+        buckets.tomar_token(key, 1, 1.0)
+    assert len(buckets) == 2
+    # 'a' salió del LRU, así que vuelve con el bucket lleno.
+    assert buckets.tomar_token('a', 1, 1.0) == 0.0
+
+
+def test_limitador_por_ip_y_por_usuario(reloj):
+    limitador = Limitador({'login': {'ip': leer_limite('3/60'), 'usuario': leer_limite('1/60')}})
+    assert limitador.revisar('login', ip='1.1.1.1', usuario='1.1.1.1|ana') == 0
+    assert limitador.revisar('login', ip='1.1.1.1', usuario='1.1.1.1|ana') > 0
+    # Otra IP con el mismo correo tiene su propio bucket.
+    assert limitador.revisar('login', ip='2.2.2.2', usuario='2.2.2.2|ana') == 0
+    assert limitador.revisar('otra_ruta', ip='1.1.1.1') == 0
+    assert limitador.stats()['rutas']['login'] == {'admitidas': 2, 'rechazadas': 1}
+
+
+class RedisCaido:
+
+    def tomar_token(self, *args):
+        raise ConnectionError('redis caído')
+
+
+def test_limitador_sigue_con_buckets_locales_si_redis_falla(reloj):
+    limitador = Limitador({'login': {'ip': leer_limite('1/60')}}, backend=RedisCaido())
+    assert limitador.revisar('login', ip='1.1.1.1') == 0
+    assert limitador.revisar('login', ip='1.1.1.1') > 0
@@ -0,0 +1,79 @@
+import json
+
+from report_feed import InMemoryReportSource, ReportFeed
+
+
+def reporte(i, creado):
+    return {'id': i, 'created_at': creado, 'kg_reportados': 1}
+
+
+def eventos(stream):
+    # Convierte la salida SSE en [(id, evento, data)], sin 'retry' ni heartbeats.
+    salida = []
+    for bloque in stream:
+        campos = dict(linea.split(': ', 1) for linea in bloque.strip().split('\n') if not linea.startswith(':'))
+        if 'event' in campos:
+            salida.append((campos['id'], campos['event'], json.loads(campos['data'])))
+    return salida
+
+
+def feed_con(*reportes, buffer_size=500):
+    fuente = InMemoryReportSource(reportes)
+    feed = ReportFeed(fuente, interval=60, buffer_size=buffer_size)
+    feed.sincronizar()
+    return fuente, feed
+
+
+def test_sincronizar_emite_nuevos_y_recogidos():
+    fuente, feed = feed_con(reporte(1, '2026-01-01'))
+    vistos = []
+    feed.escuchar(lambda tipo, data: vistos.append((tipo, data['id'])))
+    fuente.agregar(reporte(2, '2026-01-02'))
+    fuente.recoger(1)
+    feed.sincronizar()
+    assert vistos == [('recogido', 1), ('nuevo', 2)]
+    assert [r['id'] for r in feed.snapshot()] == [2]
+
+
+def test_sin_last_event_id_empieza_con_snapshot():
+    _, feed = feed_con(reporte(1, '2026-01-01'), reporte(2, '2026-01-02'))
+    [(_, tipo, data)] = eventos(feed.stream(max_duration=0))
+    assert tipo == 'snapshot'
+    assert [r['id'] for r in data] == [2, 1]
+
+
+def test_last_event_id_reanuda_sin_repetir():
+    fuente, feed = feed_con(reporte(1, '2026-01-01'))
+    [(ultimo, _, _)] = eventos(feed.stream(max_duration=0))
+    fuente.agregar(reporte(2, '2026-01-02'))
+    fuente.recoger(1)
+    feed.sincronizar()
+    pendientes = eventos(feed.stream(last_event_id=ultimo, max_duration=0))
+    assert [(tipo, data['id']) for _, tipo, data in pendientes] == [('recogido', 1), ('nuevo', 2)]
+    assert eventos(feed.stream(last_event_id=pendientes[-1][0], max_duration=0)) == []
+
+
+def test_last_event_id_de_otro_proceso_recibe_snapshot():
+    _, feed = feed_con(reporte(1, '2026-01-01'))
+    [(_, tipo, _)] = eventos(feed.stream(last_event_id='otroepoch-1', max_duration=0))
+    assert tipo == 'snapshot'
+
+
+def test_cliente_atrasado_mas_que_el_buffer_recibe_snapshot():
+    fuente, feed = feed_con(buffer_size=2)
+    [(ultimo, _, _)] = eventos(feed.stream(max_duration=0))
+    for i in range(1, 5):
+        fuente.agregar(reporte(i, f'2026-01-0{i}'))
+    feed.sincronizar()
+    [(_, tipo, data)] = eventos(feed.stream(last_event_id=ultimo, max_duration=0))
+    assert tipo == 'snapshot'
+    assert [r['id'] for r in data] == [4, 3, 2, 1]
+
+
+def test_publicar_no_repite_eventos():
+    _, feed = feed_con()
+    feed.publicar_nuevo(reporte(1, '2026-01-01'))
+    feed.publicar_nuevo(reporte(1, '2026-01-01'))
+    feed.publicar_recogido(1)
+    feed.publicar_recogido(1)
+    assert feed.stats()['seq'] == 2
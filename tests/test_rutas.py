@@ -0,0 +1,59 @@
+import random
+import time
+
+from rutas import RedFluvial, haversine_km, planificar_ruta, repartir
+
+
+def reporte(i, lat, lng, kg=1):
+    return {'id': i, 'lat': lat, 'lng': lng, 'kg_reportados': kg}
+
+
+def red_lineal():
+    # Tres puntos de paso en línea: a - b - c.
+    return RedFluvial({'a': [0, 0], 'b': [0, 0.1], 'c': [0, 0.2]}, [['a', 'b'], ['b', 'c']])
+
+
+def test_distancias_es_el_bloque_de_la_matriz():
+    red = red_lineal()
+    origenes = [(0, 0), (0, 0.2)]
+    destinos = [(0.01, 0.05), (0, 0.15), (0.02, 0.19)]
+    matriz = red.matriz_puntos(origenes + destinos)
+    bloque = red.distancias(origenes, destinos)
+    for i in range(len(origenes)):
+        for j in range(len(destinos)):
+            assert bloque[i][j] == matriz[i][len(origenes) + j]
+
+
+def test_distancias_sin_red_es_linea_recta():
+    red = RedFluvial()
+    assert red.distancias([(0, 0)], [(0, 1)]) == [[haversine_km((0, 0), (0, 1))]]
+
+
+def test_ruta_respeta_capacidad_y_orden():
+    reportes = [reporte(1, 0, 0.03, kg=4), reporte(2, 0, 0.01, kg=4), reporte(3, 0, 0.02, kg=4)]
+    ruta, total = planificar_ruta((0, 0), 10, reportes, RedFluvial(), presupuesto=0.05)
+    assert [r['id'] for r in ruta] == [2, 3]
+    assert total > 0
+
+
+def test_ruta_solo_usa_los_candidatos_mas_cercanos():
+    reportes = [reporte(i, 0, 0.001 * i) for i in range(1, 51)]
+    ruta, _ = planificar_ruta((0, 0), None, reportes, RedFluvial(), presupuesto=0.05, max_candidatos=10)
+    assert sorted(r['id'] for r in ruta) == list(range(1, 11))
+
+
+def test_ruta_con_backlog_grande_no_tarda_mas_que_con_uno_chico():
+    azar = random.Random(1)
+    reportes = [reporte(i, azar.uniform(-0.1, 0.1), azar.uniform(0, 0.2)) for i in range(3000)]
+    inicio = time.monotonic()
+    planificar_ruta((0, 0), 50, reportes, red_lineal(), presupuesto=0.05, max_candidatos=100)
+    assert time.monotonic() - inicio < 1.0
+
+
+def test_repartir_al_bote_mas_cercano():
+    reportes = [reporte(1, 0, 0.01), reporte(2, 0, 0.19), reporte(3, 0, 0.02)]
+    activos = {'otro': {'posicion': [0, 0.2], 'ruta': [3]}}
+    mios, fuera = repartir('yo', (0, 0), reportes, activos, red_lineal())
+    # El 3 ya va en la ruta del otro bote y el 2 le queda más cerca a él.
+    assert [r['id'] for r in mios] == [1]
+    assert fuera == 2
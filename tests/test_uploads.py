@@ -0,0 +1,118 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from uploads import UploadPipeline
+
+
+class Bucket:
+
+    def __init__(self, storage, nombre):
+        self._storage = storage
+        self._nombre = nombre
+
+    def upload(self, file, path, file_options):
+        self._storage.seguir.wait()
+        with open(file, 'rb') as f:
+            self._storage.subidos[f'{self._nombre}/{path}'] = f.read()
+
+    def get_public_url(self, path):
+        return f'https://storage/{self._nombre}/{path}'
+
+
+class Storage:
+
+    def __init__(self):
+        self.subidos = {}
+        # Mientras no esté puesto, las subidas se quedan esperando, como con la red caída.
+        self.seguir = threading.Event()
+        self.seguir.set()
+
+    def from_(self, bucket):
+        return Bucket(self, bucket)
+
+
+class Cliente:
+
+    def __init__(self):
+        self.storage = Storage()
+
+
+class Archivo:
+    # Lo mínimo de FileStorage que usa spool().
+
+    def __init__(self, datos):
+        self._datos = datos
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self._datos)
+
+
+def procesador_roto(path, **imagen):
+    raise ValueError('no es una imagen')
+
+
+def esperar(condicion, segundos=5):
+    limite = time.monotonic() + segundos
+    while not condicion():
+        if time.monotonic() > limite:
+            raise AssertionError('tiempo agotado')
+        time.sleep(0.01)
+
+
+def test_si_no_se_puede_procesar_no_se_sube_el_original(tmp_path):
+    cliente = Cliente()
+    pipeline = UploadPipeline(cliente, str(tmp_path), workers=1, processor=procesador_roto, process_workers=1)
+    subidas, fallos = [], []
+    pipeline.on('reporte', lambda params, urls: subidas.append(params), fallo=fallos.append)
+    local_path = pipeline.spool(Archivo(b'\xff\xd8 con exif'))
+    pipeline.submit(local_path, 'reportes_fotos', 'public/r.jpg', accion='reporte', params={'reporte_id': 1},
+                    imagen={'max_lado': 1600, 'miniaturas': [320]})
+    esperar(lambda: fallos)
+    assert fallos == [{'reporte_id': 1}]
+    assert subidas == []
+    assert cliente.storage.subidos == {}
+    assert pipeline.stats()['failed'] == 1
+    esperar(lambda: not os.listdir(tmp_path))
+
+
+def trabajo_en_spool(carpeta, nombre, meta):
+    local_path = os.path.join(carpeta, nombre)
+    with open(local_path, 'wb') as f:
+        f.write(b'foto')
+    job = {'local_path': local_path, 'bucket': 'avatars', 'path': f'public/{nombre}.jpg', 'content_type': None,
+           'upsert': True, 'accion': None, 'params': {}, 'imagen': None, 'encolado': time.time()}
+    with open(os.path.join(carpeta, meta), 'w') as f:
+        json.dump(job, f)
+
+
+def test_el_trabajo_encolado_ya_esta_reclamado(tmp_path):
+    cliente = Cliente()
+    cliente.storage.seguir.clear()
+    pipeline = UploadPipeline(cliente, str(tmp_path), workers=1)
+    local_path = pipeline.spool(Archivo(b'foto'))
+    pipeline.submit(local_path, 'avatars', 'public/u.jpg')
+    nombre = os.path.basename(local_path)
+    assert sorted(os.listdir(tmp_path)) == sorted([nombre, f'{nombre}.json.{os.getpid()}'])
+    cliente.storage.seguir.set()
+    pipeline._queue.join()
+    assert os.listdir(tmp_path) == []
+
+
+def test_recuperar_no_toma_trabajos_de_un_proceso_vivo(tmp_path):
+    muerto = subprocess.Popen([sys.executable, '-c', 'pass'])
+    muerto.wait()
+    trabajo_en_spool(tmp_path, 'vivo', f'vivo.json.{os.getppid()}')
+    trabajo_en_spool(tmp_path, 'muerto', f'muerto.json.{muerto.pid}')
+    trabajo_en_spool(tmp_path, 'huerfano', 'huerfano.json')
+    cliente = Cliente()
+    pipeline = UploadPipeline(cliente, str(tmp_path), workers=1)
+    pipeline.start()
+    esperar(lambda: len(cliente.storage.subidos) == 2)
+    pipeline._queue.join()
+    assert sorted(cliente.storage.subidos) == ['avatars/public/huerfano.jpg', 'avatars/public/muerto.jpg']
+    assert sorted(os.listdir(tmp_path)) == ['vivo', f'vivo.json.{os.getppid()}']
@@ -0,0 +1,54 @@
+# unicidad.py
+# Comprobación de datos únicos (nombre, teléfono, email) compartida por el registro web
+# y la herramienta de administración. Resuelve todo en una sola consulta y usa la misma
+# regla en los dos lados: nombre y email sin distinguir mayúsculas, teléfono exacto.
+
+CAMPOS = ('nombre', 'telefono', 'email')
+
+MENSAJES = {
+    'nombre': 'Este nombre de usuario ya está en uso. Por favor, elige otro.',
+    'telefono': 'Este número de teléfono ya está registrado.',
+    'email': 'Este correo electrónico ya está registrado.',
+}
+
+
+def normalizar(campo, valor):
+    valor = (valor or '').strip()
+    return valor.casefold() if campo in ('nombre', 'email') else valor
+
+
+def campos_en_uso(client, nombre=None, telefono=None, email=None, excluir_id=None):
+    # Devuelve la lista de campos que ya usa otro perfil, en el orden de CAMPOS.
+    candidatos = {'nombre': nombre, 'telefono': telefono, 'email': email}
+    candidatos = {campo: valor.strip() for campo, valor in candidatos.items() if valor and valor.strip()}
+    if not candidatos:
+        return []
+
+    filtros = []
+    for campo, valor in candidatos.items():
+        if campo == 'telefono':
+            filtros.append(f'telefono.eq.{literal(valor)}')
+        else:
+            filtros.append(f'{campo}.ilike.{literal(_sin_comodines(valor))}')
+
+    query = client.table('usuarios').select('id, nombre, telefono, email').or_(','.join(filtros))
+    if excluir_id:
+        query = query.neq('id', excluir_id)
+    filas = query.limit(50).execute().data
+
+    en_uso = set()
+    for fila in filas:
+        for campo, valor in candidatos.items():
+            if normalizar(campo, fila.get(campo)) == normalizar(campo, valor):
+                en_uso.add(campo)
+    return [campo for campo in CAMPOS if campo in en_uso]
+
+
+def _sin_comodines(valor):
+    # En ILIKE '%' y '_' son comodines; los escapamos para comparar el texto tal cual.
+    return valor.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def literal(valor):
+    # Entre comillas para que comas, puntos o paréntesis no rompan el filtro or=(...).
+    return '"' + valor.replace('\\', '\\\\').replace('"', '\\"') + '"'
@@ -0,0 +1,289 @@
+# uploads.py
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+class UploadQueueFull(Exception):
+    pass
+
+
+class UploadPipeline:
+    # Las fotos se guardan primero en disco local (sin leerlas enteras en memoria) y se
+    # responde enseguida. Un grupo fijo de hilos las sube después a Supabase Storage con
+    # reintentos. Cada trabajo deja un 'x.json.<pid>' al lado del archivo, a nombre del
+    # proceso que lo tiene en su cola, para retomarlo si ese proceso muere antes de terminar. Si se configura `processor`, las imágenes
+    # pasan antes por un pool de procesos que genera la versión reducida y las miniaturas.
+
+    def __init__(self, client, spool_dir, workers=4, max_queue=100, retries=4, backoff=1.0,
+                 processor=None, process_workers=2):
+        self._client = client
+        self.spool_dir = spool_dir
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self._processor = processor
+        self.process_workers = process_workers
+        self._process_pool = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._handlers = {}
+        self._fallos = {}
+        self._lock = threading.Lock()
+        self._hilos = []
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.processing_failed = 0
+        self._latencias = deque(maxlen=500)
+        self._latencias_proceso = deque(maxlen=500)
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def on(self, accion, handler, fallo=None):
+        # handler(params, urls) se ejecuta cuando los archivos ya están en Storage.
+        # urls es {sufijo: url_publica}; '' es la imagen principal y '_320' la miniatura de 320px.
+        # fallo(params) se ejecuta si la subida falla después de todos los reintentos, para
+        # deshacer lo que se guardó esperando la foto.
+        self._handlers[accion] = handler
+        if fallo is not None:
+            self._fallos[accion] = fallo
+
+    def start(self):
+        with self._lock:
+            if self._hilos:
+                return
+            if self._processor is not None:
+                # El pool se crea aquí y no al importar, para que cada worker de gunicorn tenga el suyo.
+                self._process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+            for i in range(self.workers):
+                hilo = threading.Thread(target=self._worker, name=f'upload-{i}', daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+        self._recuperar()
+
+    def has_capacity(self):
+        return not self._queue.full()
+
+    def spool(self, archivo):
+        # FileStorage.save copia el stream por bloques, así no cargamos la foto completa en memoria.
+        local_path = os.path.join(self.spool_dir, uuid.uuid4().hex)
+        archivo.save(local_path)
+        return local_path
+
+    def discard(self, local_path, meta_path=None):
+        _borrar(local_path)
+        _borrar(meta_path or _meta_propio(local_path))
+
+    def submit(self, local_path, bucket, path, content_type=None, upsert=False, accion=None, params=None, imagen=None):
+        self.start()
+        job = {
+            'local_path': local_path,
+            'bucket': bucket,
+            'path': path,
+            'content_type': content_type,
+            'upsert': upsert,
+            'accion': accion,
+            'params': params or {},
+            'imagen': imagen,
+            'encolado': time.time(),
+            'meta_path': _meta_propio(local_path),
+        }
+        with open(job['meta_path'], 'w') as f:
+            json.dump(job, f)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            self.discard(local_path)
+            raise UploadQueueFull()
+
+    def public_url(self, bucket, path):
+        return self._client.storage.from_(bucket).get_public_url(path)
+
+    def stats(self):
+        latencias = sorted(self._latencias)
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_max': self._queue.maxsize,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'retried': self.retried,
+            'latency_p50': _percentil(latencias, 0.50),
+            'latency_p95': _percentil(latencias, 0.95),
+            'latency_max': latencias[-1] if latencias else None,
+            'processing_failed': self.processing_failed,
+            'processing_p50': _percentil(sorted(self._latencias_proceso), 0.50),
+        }
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self.in_flight += 1
+            try:
+                self._procesar(job)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                self._queue.task_done()
+
+    def _procesar(self, job):
+        archivos = {'': (job['local_path'], job['content_type'])}
+        if job.get('imagen') and self._process_pool is not None:
+            inicio = time.time()
+            try:
+                variantes = self._process_pool.submit(self._processor, job['local_path'], **job['imagen']).result()
+                archivos = {sufijo: (path, 'image/jpeg') for sufijo, path in variantes.items()}
+                self._latencias_proceso.append(round(time.time() - inicio, 3))
+            except Exception as e:
+                # Si no se puede procesar (formato raro, archivo dañado) no se publica el original:
+                # conserva el EXIF con la ubicación y no tiene miniaturas. Cuenta como fallida.
+                print(f"[ERROR UPLOAD PROCESAR] {job['bucket']}/{job['path']}: {e}")
+                with self._lock:
+                    self.processing_failed += 1
+                    self.failed += 1
+                self._fallar(job)
+                return
+
+        try:
+            urls = {}
+            for sufijo, (local_path, content_type) in archivos.items():
+                path = _ruta_variante(job['path'], sufijo)
+                if not self._subir(job['bucket'], path, local_path, content_type, job['upsert']):
+                    with self._lock:
+                        self.failed += 1
+                    self._fallar(job)
+                    return
+                urls[sufijo] = self.public_url(job['bucket'], path)
+        finally:
+            # Las variantes generadas se pueden volver a crear; el original se conserva hasta el final.
+            for local_path, _ in archivos.values():
+                if local_path != job['local_path']:
+                    _borrar(local_path)
+
+        try:
+            handler = self._handlers.get(job['accion'])
+            if handler:
+                handler(job['params'], urls)
+        except Exception as e:
+            print(f"[ERROR UPLOAD CALLBACK] {job['accion']}: {e}")
+        finally:
+            self.discard(job['local_path'], job['meta_path'])
+
+        with self._lock:
+            self.completed += 1
+            self._latencias.append(round(time.time() - job['encolado'], 3))
+
+    def _fallar(self, job):
+        try:
+            fallo = self._fallos.get(job['accion'])
+            if fallo:
+                fallo(job['params'])
+        except Exception as e:
+            print(f"[ERROR UPLOAD FALLO] {job['accion']}: {e}")
+        finally:
+            self.discard(job['local_path'], job['meta_path'])
+
+    def _subir(self, bucket, path, local_path, content_type, upsert):
+        file_options = {'cache-control': '3600'}
+        if content_type:
+            file_options['content-type'] = content_type
+        if upsert:
+            file_options['upsert'] = 'true'
+
+        for intento in range(self.retries + 1):
+            try:
+                self._client.storage.from_(bucket).upload(file=local_path, path=path, file_options=file_options)
+                return True
+            except Exception as e:
+                if intento == self.retries:
+                    print(f"[ERROR UPLOAD] {bucket}/{path}: {e}")
+                    return False
+                with self._lock:
+                    self.retried += 1
+                time.sleep(self.backoff * (2 ** intento))
+
+    def _recuperar(self):
+        # Retoma trabajos que quedaron a medias. Un 'x.json.<pid>' es de un proceso que lo tiene
+        # en su cola (aunque esté esperando reintentos); solo se toma si ese proceso murió. Un
+        # 'x.json' sin pid no es de nadie. Con varios workers compartiendo la carpeta, el rename
+        # funciona como candado: solo un proceso se queda con cada trabajo.
+        for nombre in os.listdir(self.spool_dir):
+            if nombre.endswith('.json'):
+                original = nombre
+            else:
+                base, separador, pid = nombre.rpartition('.json.')
+                if not separador or not pid.isdigit() or _proceso_vivo(int(pid)):
+                    continue
+                original = base + '.json'
+            meta_path = os.path.join(self.spool_dir, nombre)
+            original = os.path.join(self.spool_dir, original)
+            reclamado = f'{original}.{os.getpid()}'
+            try:
+                os.rename(meta_path, reclamado)
+            except OSError as e:
+                print(f"[ERROR UPLOAD RECUPERAR] {nombre}: {e}")
+                continue
+            try:
+                with open(reclamado) as f:
+                    job = json.load(f)
+                job['meta_path'] = reclamado
+                if os.path.exists(job['local_path']):
+                    self._queue.put_nowait(job)
+                else:
+                    os.remove(reclamado)
+            except (OSError, ValueError, queue.Full) as e:
+                # Se devuelve el reclamo para que otro proceso (o el próximo arranque) lo retome.
+                print(f"[ERROR UPLOAD RECUPERAR] {nombre}: {e}")
+                try:
+                    os.rename(reclamado, original)
+                except OSError:
+                    pass
+
+
+def _meta_propio(local_path):
+    # El .json de un trabajo nace ya reclamado por el proceso que lo encola.
+    return f'{local_path}.json.{os.getpid()}'
+
+
+def _proceso_vivo(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _borrar(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def rutas_con_variantes(path, miniaturas=()):
+    # La ruta de una foto y las de las miniaturas que se generaron al subirla, para borrarlas juntas.
+    return [path] + [_ruta_variante(path, f'_{lado}') for lado in miniaturas]
+
+
+def _ruta_variante(path, sufijo):
+    # 'public/u_1.jpg' + '_320' -> 'public/u_1_320.jpg'
+    if not sufijo:
+        return path
+    base, punto, ext = path.rpartition('.')
+    return f'{base}{sufijo}.{ext}' if punto else f'{path}{sufijo}'
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    return valores[min(len(valores) - 1, int(p * len(valores)))]